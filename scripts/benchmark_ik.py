@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2015--2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+import os
+import rospkg
+import time
+
+import numpy as np
+
+from kinematics import (
+    IKSolver,
+    KinematicChain,
+    hom_to_pose,
+    load_urdf
+)
+from settings import settings
+
+
+def reachable_poses(chain, n):
+    """Sample poses by forward kinematics of random configurations, such
+    that a solution exists for each of them.
+
+    :param chain: The KinematicChain of the limb.
+    :param n: The number of poses.
+    :return: A list of n poses [x, y, z, qx, qy, qz, qw].
+    """
+    angles = chain.lower + (chain.upper - chain.lower)*np.random.random_sample(
+        (n, chain.n_joints))
+    return [hom_to_pose(hom) for hom in chain.fk(angles)]
+
+
+def task_space_poses(n):
+    """Sample top-down poses from within the robot's task space, as done by
+    Baxter.sample_task_space_pose.
+
+    :param n: The number of poses.
+    :return: A list of n poses [x, y, z, roll, pitch, yaw].
+    """
+    lim = settings.task_space_limits_m
+    return [[(lim['x_max'] - lim['x_min'])*np.random.random_sample() + lim['x_min'],
+             (lim['y_max'] - lim['y_min'])*np.random.random_sample() + lim['y_min'],
+             (lim['z_max'] - lim['z_min'])*np.random.random_sample() + lim['z_min'],
+             np.pi, 0.0, np.pi] for _ in range(n)]
+
+
+class ServiceSolver(object):
+    def __init__(self, arm):
+        """Inverse kinematics via the IK service of the Baxter robot, with
+        the same interface as IKSolver.solve.
+
+        :param arm: The arm <'left', 'right'> to solve for.
+        """
+        import rospy
+        from baxter_core_msgs.srv import (
+            SolvePositionIK,
+            SolvePositionIKRequest
+        )
+        from geometry_msgs.msg import PoseStamped
+        from hardware.utils import list_to_pose_msg
+
+        self._request = SolvePositionIKRequest
+        self._stamped = PoseStamped
+        self._to_msg = list_to_pose_msg
+        node = "ExternalTools/" + arm + "/PositionKinematicsNode/IKService"
+        rospy.wait_for_service(node, 5.0)
+        self._service = rospy.ServiceProxy(node, SolvePositionIK,
+                                           persistent=True)
+
+    def solve(self, poses, seed=None):
+        request = self._request()
+        for pose in poses:
+            msg = self._stamped()
+            msg.pose = self._to_msg(pose)
+            msg.header.frame_id = 'base'
+            request.pose_stamp.append(msg)
+        response = self._service(request)
+        configs = [dict(zip(joints.name, joints.position)) if valid else None
+                   for valid, joints in zip(response.isValid, response.joints)]
+        return configs, np.array(response.isValid, dtype=bool)
+
+
+def benchmark(solver, chain, poses):
+    """Measure latency and success rate of an inverse kinematics solver.
+
+    :param solver: The solver to benchmark (an IKSolver or ServiceSolver).
+    :param chain: The KinematicChain of the limb, to check solutions with.
+    :param poses: The list of poses to solve for.
+    :return: A tuple (single-pose latencies in ms, batch time per pose in
+        ms, success rate, maximum position error in mm of the solutions
+        according to the kinematic model).
+    """
+    latencies = np.empty(len(poses))
+    for i, pose in enumerate(poses):
+        t = time.time()
+        solver.solve([pose])
+        latencies[i] = time.time() - t
+    t = time.time()
+    configs, valid = solver.solve(poses)
+    batch = (time.time() - t)/len(poses)
+    error = np.nan
+    if valid.any():
+        angles = np.array([chain.config_to_array(c) for c in configs
+                           if c is not None])
+        targets = np.array([p[:3] for p, v in zip(poses, valid) if v])
+        error = np.max(np.linalg.norm(chain.fk(angles)[:, :3, 3] - targets,
+                                      axis=1))
+    return 1000.0*latencies, 1000.0*batch, valid.mean(), 1000.0*error
+
+
+if __name__ == '__main__':
+    """Compare the in-process NumPy inverse kinematics solver with the
+    inverse kinematics service of the Baxter robot.
+
+    Usage:
+        1. Run 'rosrun baxter_pick_and_place benchmark_ik.py' with the robot
+           (or the Gazebo simulation) running to compare both solvers.
+        2. Run 'rosrun baxter_pick_and_place benchmark_ik.py --no-service'
+           to benchmark the NumPy solver only (no robot needed).
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark inverse kinematics for the Baxter limbs.')
+    parser.add_argument('-n', '--n-poses', type=int, default=100,
+                        help='number of poses per pose set and limb')
+    parser.add_argument('--n-seeds', type=int, default=8,
+                        help='number of seeds per pose of the NumPy solver')
+    parser.add_argument('--no-service', action='store_true',
+                        help='do not benchmark the IK service')
+    # ignore ROS remapping arguments
+    args, _ = parser.parse_known_args()
+
+    ns = rospkg.RosPack().get_path('baxter_pick_and_place')
+    joints = load_urdf(os.path.join(ns, 'models', 'baxter',
+                                    'baxter_kinematics.urdf'))
+    if not args.no_service:
+        import rospy
+        print 'Initialize ROS node.'
+        rospy.init_node('benchmark_ik_module', anonymous=True)
+
+    print '{:6s} {:10s} {:8s} {:>8s} {:>8s} {:>11s} {:>8s} {:>8s}'.format(
+        'arm', 'poses', 'solver', 'p50 ms', 'p90 ms', 'batch ms/p',
+        'success', 'err mm')
+    for arm in ['left', 'right']:
+        chain = KinematicChain(joints, base='base', tip='%s_gripper' % arm)
+        solvers = [('numpy', IKSolver(chain, n_seeds=args.n_seeds))]
+        if not args.no_service:
+            solvers.append(('service', ServiceSolver(arm)))
+        pose_sets = [('reachable', reachable_poses(chain, args.n_poses)),
+                     ('task space', task_space_poses(args.n_poses))]
+        for set_name, poses in pose_sets:
+            for name, solver in solvers:
+                latencies, batch, success, error = benchmark(solver, chain,
+                                                             poses)
+                p50, p90 = np.percentile(latencies, [50, 90])
+                print '{:6s} {:10s} {:8s} {:8.2f} {:8.2f} {:11.2f} {:7.0%} {:8.2f}'.format(
+                    arm, set_name, name, p50, p90, batch, success, error)
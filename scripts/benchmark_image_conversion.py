@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2015--2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import timeit
+
+import cv_bridge
+import numpy as np
+
+from hardware import img_to_imgmsg, imgmsg_to_img
+
+
+def legacy_imgmsg_to_img(imgmsg):
+    """The conversion used before, trying encodings one after the other."""
+    img = None
+    for enc in ['bgr8', 'mono8', 'passthrough']:
+        try:
+            img = cv_bridge.CvBridge().imgmsg_to_cv2(imgmsg, enc)
+        except cv_bridge.CvBridgeError:
+            pass
+        if img is not None:
+            break
+    return img
+
+
+def legacy_img_to_imgmsg(img):
+    """The conversion used before, trying encodings one after the other."""
+    imgmsg = None
+    for enc in ['bgr8', 'mono8', 'passthrough']:
+        try:
+            imgmsg = cv_bridge.CvBridge().cv2_to_imgmsg(img, enc)
+        except cv_bridge.CvBridgeError:
+            pass
+        if imgmsg is not None:
+            break
+    return imgmsg
+
+
+def time_ms(func, n):
+    """The mean run time of func in milliseconds."""
+    return 1e3*timeit.timeit(func, number=n)/n
+
+
+if __name__ == '__main__':
+    """Compare the image message conversion functions in hardware.base with
+    the trial-and-error conversion via a new CvBridge used before.
+
+    Usage:
+        Run 'rosrun baxter_pick_and_place benchmark_image_conversion.py'.
+    """
+    n = 50
+    images = [
+        ('hand camera 1280x800 bgr8',
+         (np.random.rand(800, 1280, 3)*255).astype(np.uint8), 'bgr8'),
+        ('hand camera 1280x800 bgra8',
+         (np.random.rand(800, 1280, 4)*255).astype(np.uint8), 'bgra8'),
+        ('Kinect 1920x1080 bgr8',
+         (np.random.rand(1080, 1920, 3)*255).astype(np.uint8), 'bgr8'),
+        ('Kinect 512x424 16UC1',
+         (np.random.rand(424, 512)*4500).astype(np.uint16), '16UC1')
+    ]
+    print '{:28s} {:>12s} {:>12s} {:>12s} {:>12s}'.format(
+        'image', 'to img old', 'to img new', 'to msg old', 'to msg new')
+    for name, img, enc in images:
+        msg = cv_bridge.CvBridge().cv2_to_imgmsg(img, enc)
+        if enc == 'bgr8' or enc == '16UC1':
+            assert np.array_equal(imgmsg_to_img(msg), img)
+        print '{:28s} {:9.3f} ms {:9.3f} ms {:9.3f} ms {:9.3f} ms'.format(
+            name,
+            time_ms(lambda: legacy_imgmsg_to_img(msg), n),
+            time_ms(lambda: imgmsg_to_img(msg), n),
+            time_ms(lambda: legacy_img_to_imgmsg(img), n),
+            time_ms(lambda: img_to_imgmsg(img), n))
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2015--2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+import itertools
+import logging
+import os
+import rospkg
+import time
+
+import numpy as np
+import rospy
+
+from core import get_default_handler
+from hardware import Kinect
+from hardware.kinect_server import (
+    KinectServer,
+    load_recording,
+    save_recording,
+    synthetic_frames
+)
+
+
+def benchmark(kinect, color, depth, skeleton, n_frames):
+    """Measure the latency of Kinect.collect_data for one stream combination.
+
+    :param kinect: The Kinect instance to benchmark.
+    :param color: Whether to request color images.
+    :param depth: Whether to request depth images.
+    :param skeleton: Whether to request skeleton data.
+    :param n_frames: The number of frames to request.
+    :return: A tuple (latencies in ms, frames per second).
+    """
+    # warm up (connect, allocate receive buffers, fill the pipeline)
+    for _ in range(3):
+        kinect.collect_data(color=color, depth=depth, skeleton=skeleton)
+    latencies = np.empty(n_frames)
+    start = time.time()
+    for i in range(n_frames):
+        t = time.time()
+        kinect.collect_data(color=color, depth=depth, skeleton=skeleton)
+        latencies[i] = time.time() - t
+    fps = n_frames/(time.time() - start)
+    return 1000.0*latencies, fps
+
+
+def record(kinect, filename, n_frames):
+    """Record frames from a (real) Kinect for later replay with the stand-in
+    server.
+
+    :param kinect: The Kinect instance to record from.
+    :param filename: The npz file to write.
+    :param n_frames: The number of frames to record.
+    :return:
+    """
+    frames = list()
+    for _ in range(n_frames):
+        frames.append(kinect.collect_data(color=True, depth=True,
+                                          skeleton=True))
+    save_recording(filename, frames)
+
+
+if __name__ == '__main__':
+    """Benchmark the client interface to the ELTE Kinect Windows tool.
+
+    Usage:
+        1. Run 'rosrun baxter_pick_and_place benchmark_kinect.py' to
+           benchmark against a local stand-in server replaying synthetic
+           frames, optionally with simulated '--latency' and '--bandwidth'
+           and frames replayed from a '--replay' recording.
+        2. Run 'rosrun baxter_pick_and_place benchmark_kinect.py --host <IP>'
+           to benchmark against the ELTE Kinect Windows tool, optionally
+           recording frames with '--record <file.npz>'.
+        3. Compare payload encodings (bytes on the wire and decode times)
+           with, e.g., '--color-codecs jpeg jpeg:50 raw --depth-codecs png
+           raw zlib'.
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark the ELTE Kinect Windows tool client.')
+    parser.add_argument('--host', default=None,
+                        help='host running the ELTE Kinect Windows tool; '
+                             'if not given, a local stand-in server is used')
+    parser.add_argument('--port', type=int, default=9999)
+    parser.add_argument('-n', '--n-frames', type=int, default=100,
+                        help='number of frames per stream combination')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='stand-in server latency per request in s')
+    parser.add_argument('--bandwidth', type=float, default=None,
+                        help='stand-in server bandwidth in MB/s')
+    parser.add_argument('--replay', default=None,
+                        help='npz recording for the stand-in server to replay')
+    parser.add_argument('--record', default=None,
+                        help='npz file to record frames from the Kinect to')
+    parser.add_argument('--inflight', type=int, nargs='+', default=[1, 2],
+                        help='pipeline depths to benchmark persistent '
+                             'connections with')
+    parser.add_argument('--color-codecs', nargs='+', default=['jpeg'],
+                        help='color payload encodings to compare, e.g., '
+                             'jpeg jpeg:50 raw')
+    parser.add_argument('--depth-codecs', nargs='+', default=['png'],
+                        help='depth payload encodings to compare, e.g., '
+                             'png raw zlib')
+    args = parser.parse_args(rospy.myargv()[1:])
+
+    logger = logging.getLogger('main')
+    logger.setLevel(logging.INFO)
+    for h in get_default_handler(filename='', stream_level=logging.INFO,
+                                 file_level=logging.INFO):
+        logger.addHandler(hdlr=h)
+
+    print 'Initialize ROS node.'
+    rospy.init_node('benchmark_kinect_module', anonymous=True)
+    ns = rospkg.RosPack().get_path('baxter_pick_and_place')
+
+    server = None
+    host = args.host
+    port = args.port
+    if host is None:
+        if args.replay is not None:
+            frames = load_recording(args.replay)
+        else:
+            frames = synthetic_frames()
+        bandwidth = None
+        if args.bandwidth is not None:
+            bandwidth = args.bandwidth*1e6
+        server = KinectServer(frames, port=0, latency=args.latency,
+                              bandwidth=bandwidth)
+        server.start()
+        host, port = server.host, server.port
+
+    if args.record is not None:
+        kinect = Kinect(root_dir=ns, host=host, port=port)
+        print 'Record {} frames to {}.'.format(args.n_frames, args.record)
+        record(kinect, args.record, args.n_frames)
+
+    modes = [('per call', False, 1)]
+    modes += [('persistent x{}'.format(n), True, n) for n in args.inflight]
+    print '{:16s} {:5s} {:5s} {:5s} {:>8s} {:>8s} {:>8s} {:>8s}'.format(
+        'mode', 'color', 'depth', 'skel', 'p50 ms', 'p90 ms', 'p99 ms', 'fps')
+    for name, persistent, n_inflight in modes:
+        kinect = Kinect(root_dir=ns, host=host, port=port,
+                        persistent=persistent, n_inflight=n_inflight)
+        if persistent:
+            kinect.open_session()
+        for flags in itertools.product([True, False], repeat=3):
+            if not any(flags):
+                continue
+            latencies, fps = benchmark(kinect, *flags, n_frames=args.n_frames)
+            p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+            print '{:16s} {:5d} {:5d} {:5d} {:8.2f} {:8.2f} {:8.2f} {:8.1f}'.format(
+                name, flags[0], flags[1], flags[2], p50, p90, p99, fps)
+        if persistent:
+            kinect.close_session()
+
+    print
+    print '{:10s} {:10s} {:>10s} {:>10s} {:>10s} {:>10s} {:>8s}'.format(
+        'color', 'depth', 'color kB', 'color ms', 'depth kB', 'depth ms',
+        'fps')
+    for color_codec, depth_codec in itertools.product(args.color_codecs,
+                                                      args.depth_codecs):
+        kinect = Kinect(root_dir=ns, host=host, port=port, persistent=True,
+                        n_inflight=args.inflight[-1], color_codec=color_codec,
+                        depth_codec=depth_codec)
+        kinect.open_session()
+        kinect.collect_data(color=True, depth=True)
+        kinect.reset_statistics()
+        _, fps = benchmark(kinect, True, True, False, n_frames=args.n_frames)
+        stats = kinect.receive_statistics()
+        print '{:10s} {:10s} {:10.1f} {:10.2f} {:10.1f} {:10.2f} {:8.1f}'.format(
+            color_codec, depth_codec,
+            stats['color']['kb_per_frame'], stats['color']['ms_decode'],
+            stats['depth']['kb_per_frame'], stats['depth']['ms_decode'], fps)
+        kinect.close_session()
+
+    if server is not None:
+        server.stop()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2015--2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+import os
+import rospkg
+import time
+
+import numpy as np
+
+from hardware import Baxter
+from kinematics import KinematicChain, load_urdf
+from motion_planning import CollisionChecker, RRTConnectPlanner
+
+
+# neutral configuration of the Baxter limbs, as in baxter_interface
+NEUTRAL = {'s0': 0.0, 's1': -0.55, 'e0': 0.0, 'e1': 0.75,
+           'w0': 0.0, 'w1': 1.26, 'w2': 0.0}
+
+
+def sample_pairs(planner, n, detour):
+    """Sample pairs of collision-free start and goal configurations.
+
+    :param planner: The RRTConnectPlanner to sample for.
+    :param n: The number of pairs.
+    :param detour: If True, only keep pairs whose straight line in joint
+        space is in collision, i.e., that need a detour.
+    :return: A list of n tuples (start, goal) of joint angle arrays.
+    """
+    chain = planner.checker.chain
+    pairs = list()
+    while len(pairs) < n:
+        angles = chain.lower + (chain.upper - chain.lower)*np.random.random_sample(
+            (2*n, chain.n_joints))
+        angles = angles[planner.checker.check(angles)]
+        for start, goal in zip(angles[::2], angles[1::2]):
+            if detour and planner.checker.check_motion(start, goal,
+                                                       planner.resolution):
+                continue
+            pairs.append((start, goal))
+    return pairs[:n]
+
+
+def benchmark(planner, pairs):
+    """Measure planning time, success rate and path quality of a planner.
+
+    :param planner: The RRTConnectPlanner to benchmark.
+    :param pairs: The list of (start, goal) pairs to plan for.
+    :return: A tuple (planning times in ms of the successful plans, success
+        rate, mean number of way points, mean path length in rad).
+    """
+    chain = planner.checker.chain
+    times, waypoints, lengths = list(), list(), list()
+    for start, goal in pairs:
+        t = time.time()
+        try:
+            planner.plan(start=chain.array_to_config(start),
+                         end=chain.array_to_config(goal))
+        except RuntimeError:
+            continue
+        times.append(time.time() - t)
+        waypoints.append(len(planner.path) - 1)
+        lengths.append(np.sum(np.linalg.norm(np.diff(planner.path, axis=0),
+                                             axis=1)))
+    return (1000.0*np.array(times), len(times)/float(len(pairs)),
+            np.mean(waypoints), np.mean(lengths))
+
+
+if __name__ == '__main__':
+    """Benchmark the RRT-Connect motion planner of the Baxter limbs on random
+    pairs of collision-free start and goal configurations, with the table
+    plane and the other limb (in neutral configuration) as obstacles.
+
+    Usage:
+        Run 'rosrun baxter_pick_and_place benchmark_rrt.py' (no robot
+        needed).
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark collision-free motion planning for the '
+                    'Baxter limbs.')
+    parser.add_argument('-n', '--n-pairs', type=int, default=50,
+                        help='number of start/goal pairs per set and limb')
+    parser.add_argument('-z', '--z-table', type=float, default=-0.18,
+                        help='height of the table plane in the base frame')
+    parser.add_argument('--shortcuts', type=int, default=100,
+                        help='number of shortcut smoothing attempts')
+    # ignore ROS remapping arguments
+    args, _ = parser.parse_known_args()
+
+    ns = rospkg.RosPack().get_path('baxter_pick_and_place')
+    joints = load_urdf(os.path.join(ns, 'models', 'baxter',
+                                    'baxter_kinematics.urdf'))
+    arms = ['left', 'right']
+    checkers = {a: CollisionChecker(KinematicChain(joints, base='base',
+                                                   tip='%s_gripper' % a),
+                                    radii=Baxter._link_radii(),
+                                    z_table=args.z_table)
+                for a in arms}
+
+    print '{:6s} {:8s} {:>8s} {:>8s} {:>8s} {:>8s} {:>10s} {:>10s}'.format(
+        'arm', 'pairs', 'p50 ms', 'p90 ms', 'max ms', 'success',
+        'waypoints', 'length')
+    for arm in arms:
+        other = [a for a in arms if a != arm][0]
+        checkers[arm].set_obstacle_chain(
+            checkers[other], {'%s_%s' % (other, j): a
+                              for j, a in NEUTRAL.items()})
+        planner = RRTConnectPlanner(checkers[arm], shortcuts=args.shortcuts)
+        for set_name, detour in [('random', False), ('detour', True)]:
+            pairs = sample_pairs(planner, args.n_pairs, detour)
+            times, success, waypoints, length = benchmark(planner, pairs)
+            p50, p90, p100 = np.percentile(times, [50, 90, 100]) \
+                if len(times) else (np.nan,)*3
+            print '{:6s} {:8s} {:8.1f} {:8.1f} {:8.1f} {:7.0%} {:10.1f} {:10.2f}'.format(
+                arm, set_name, p50, p90, p100, success, waypoints, length)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2015--2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+import os
+import rospkg
+import time
+
+import numpy as np
+
+from kinematics import (
+    IKSolver,
+    KinematicChain,
+    build_reachability_map,
+    load_urdf
+)
+from settings import settings
+
+
+if __name__ == '__main__':
+    """Build the reachability map of the Baxter limbs over the robot's task
+    space with the gripper pointing down, as used for sampling poses and
+    selecting limbs (see hardware.Baxter).
+
+    Usage:
+        Run 'rosrun baxter_pick_and_place build_reachability_map.py' once
+        (no robot needed). The map is written to
+        data/setup/reachability.npy and loaded on start-up of Baxter.
+    """
+    parser = argparse.ArgumentParser(
+        description='Build the reachability map of the Baxter limbs.')
+    parser.add_argument('-r', '--resolution', type=float, default=0.02,
+                        help='edge length of the map cells in m')
+    parser.add_argument('--n-seeds', type=int, default=16,
+                        help='number of IK seeds per cell')
+    # ignore ROS remapping arguments
+    args, _ = parser.parse_known_args()
+
+    ns = rospkg.RosPack().get_path('baxter_pick_and_place')
+    joints = load_urdf(os.path.join(ns, 'models', 'baxter',
+                                    'baxter_kinematics.urdf'))
+    solvers = {a: IKSolver(KinematicChain(joints, base='base',
+                                          tip='%s_gripper' % a),
+                           n_seeds=args.n_seeds)
+               for a in ['left', 'right']}
+
+    start = time.time()
+    reachability = build_reachability_map(
+        solvers, limits=settings.task_space_limits_m,
+        resolution=args.resolution, orientation=[np.pi, 0.0, np.pi])
+    print 'Built map of {} cells per arm in {:.1f} s.'.format(
+        np.prod(reachability.shape), time.time() - start)
+    for i, arm in enumerate(reachability.arms):
+        print '{:5s} arm reaches {:.0%} of the task space.'.format(
+            arm, reachability.reachable[i].mean())
+    print 'Both arms reach {:.0%} of the task space.'.format(
+        reachability.reachable.all(axis=0).mean())
+
+    setup_dir = os.path.join(ns, 'data', 'setup')
+    if not os.path.exists(setup_dir):
+        os.makedirs(setup_dir)
+    filename = os.path.join(setup_dir, 'reachability.npy')
+    reachability.save(filename)
+    print 'Wrote map to {}.'.format(filename)
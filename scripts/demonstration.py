@@ -59,8 +59,12 @@ class Demonstration(object):
                                         # TODO replace with object_set[1:],
                                         object_ids=[],
                                         ws_limits=settings.world_space_limits_m)
-        self._robot = Baxter(sim=self._sim)
-        self._camera = Kinect(root_dir=ros_ws, host=settings.elte_kinect_win_host)
+        self._robot = Baxter(sim=self._sim, root_dir=ros_ws)
+        self._camera = Kinect(root_dir=ros_ws, host=settings.elte_kinect_win_host,
+                              persistent=settings.elte_kinect_win_persistent,
+                              n_inflight=settings.elte_kinect_win_inflight,
+                              color_codec=settings.elte_kinect_win_color_codec,
+                              depth_codec=settings.elte_kinect_win_depth_codec)
         self._detection = ObjectDetection(root_dir=ros_ws,
                                           object_ids=object_set)
         self._segmentation = ObjectSegmentation(root_dir=ros_ws,
@@ -94,6 +98,7 @@ class Demonstration(object):
         """Clean up everything that needs cleaning up before ROS is shutdown."""
         self._logger.info('Shut down the demonstration framework.')
         self._robot.clean_up()
+        self._camera.close_session()
         if self._sim:
             self._environment.clean_up()
 
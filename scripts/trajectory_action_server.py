@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2015--2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+
+import rospy
+
+from hardware.trajectory_server import TrajectoryActionServer
+
+
+if __name__ == '__main__':
+    """Run local stand-ins for the joint trajectory action servers of both
+    Baxter limbs, for testing the 'action' control backend of
+    hardware.Baxter without the robot.
+
+    Usage:
+        Run 'rosrun baxter_pick_and_place trajectory_action_server.py',
+        optionally with '--time-scale 1.2' to simulate limbs that are slower
+        than commanded. On the robot (or in Gazebo), run
+        'rosrun baxter_interface joint_trajectory_action_server.py' instead.
+    """
+    parser = argparse.ArgumentParser(
+        description='Stand-in joint trajectory action servers for Baxter.')
+    parser.add_argument('--time-scale', type=float, default=1.0,
+                        help='factor to stretch the execution time with')
+    parser.add_argument('--lag', type=float, default=0.05,
+                        help='delay of the simulated joint angles in s')
+    args = parser.parse_args(rospy.myargv()[1:])
+
+    print 'Initialize ROS node.'
+    rospy.init_node('trajectory_action_server_module')
+    servers = [TrajectoryActionServer(arm=arm, time_scale=args.time_scale,
+                                      lag=args.lag)
+               for arm in ['left', 'right']]
+    for server in servers:
+        server.start()
+    print 'Serving joint trajectory actions.'
+    rospy.spin()
@@ -14,14 +14,16 @@ d['packages'] = [
     'demo',
     'hardware',
     'instruction',
+    'kinematics',
     'motion_planning',
     'servoing',
     'settings',
     'simulation',
     'vision']
 d['package_dir'] = {'': 'src'}
-d['requires'] = ['rospy', 'roswtf', 'tf',
+d['requires'] = ['rospy', 'roswtf', 'tf', 'actionlib',
                  'geometry_msgs', 'std_msgs', 'std_srvs', 'gazebo_msgs',
+                 'control_msgs', 'trajectory_msgs',
                  'baxter_interface', 'baxter_core_msgs',
                  'os', 'time', 'logging', 'numpy',
                  'cv2', 'caffe']
@@ -51,10 +51,14 @@ class External(object):
 
         self.logger = logging.getLogger('cal_ext')
 
-        self._robot = Baxter(sim=sim_or_real())
+        self._robot = Baxter(sim=sim_or_real(), root_dir=root_dir)
         self._robot.set_up(gripper=False)
         self._kinect = Kinect(root_dir=root_dir,
-                              host=settings.elte_kinect_win_host)
+                              host=settings.elte_kinect_win_host,
+                              persistent=settings.elte_kinect_win_persistent,
+                              n_inflight=settings.elte_kinect_win_inflight,
+                              color_codec=settings.elte_kinect_win_color_codec,
+                              depth_codec=settings.elte_kinect_win_depth_codec)
         self._pub_vis = rospy.Publisher(topic_img4, Image,
                                         queue_size=10, latch=True)
         self._sink = os.path.join(root_dir, 'data', 'setup', 'external')
@@ -97,14 +101,18 @@ class External(object):
         for _ in xrange(n):
             yield self._robot.sample_pose(lim=self._lim)
 
-    def _modify_w2(self, pose):
-        config = self._robot.ik(arm=self._arm, pose=pose)
+    @staticmethod
+    def _randomize_w2(config):
         for key in config:
             if '_w2' in key:
                 config[key] = 6.117*np.random.random_sample() - 3.059
                 break
         return config
 
+    def _modify_w2(self, pose):
+        config = self._robot.ik(arm=self._arm, pose=pose)
+        return self._randomize_w2(config)
+
     def test_poses(self):
         i = 0
         for pose in self._generate_random_poses(n=10):
@@ -121,12 +129,14 @@ class External(object):
             pose = self._robot.endpoint_pose(arm=self._arm)
             print "Pose is [", (" {: .3f}"*6).format(*pose), ']'
 
-    def _generate_random_configs(self, n):
-        for pose in self._generate_random_poses(n=n):
-            try:
-                yield self._modify_w2(pose=pose)
-            except ValueError:
-                yield None
+    def _generate_random_configs(self, n, batch_size=50):
+        # solve IK for batches of random poses in one request each
+        for start in xrange(0, n, batch_size):
+            poses = list(self._generate_random_poses(n=min(batch_size,
+                                                           n - start)))
+            configs, _ = self._robot.ik_batch(arm=self._arm, poses=poses)
+            for config in configs:
+                yield None if config is None else self._randomize_w2(config)
 
     def test_configs(self):
         i = 0
@@ -154,12 +164,14 @@ class External(object):
 
     def _move_automatic(self):
         for config in self._generate_random_configs(n=1000):
+            if rospy.is_shutdown():
+                break
             if config is not None:
                 self._robot.move_to_config(config=config)
                 pose = self._robot.endpoint_pose(arm=self._arm)
                 self.logger.debug("Pose is [" + (" {: .3f}"*6).format(*pose) + " ]")
                 return True
-            return False
+        return False
 
     def _move(self):
         if self._automatic:
@@ -468,5 +480,6 @@ def perform_external_calibration(arm='left', n1=3, n2=1, automatic=True, root_di
 
     cal.logger.info("Third, visualize estimate ...")
     cal.visual_test(tto=tto_default, btc=btc_default)
+    cal._kinect.close_session()
     cal._robot.clean_up(gripper=False)
     return btc
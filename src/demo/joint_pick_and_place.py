@@ -92,7 +92,7 @@ class PickAndPlace(object):
             if len(s) > 0 and s.lower()[0] == 'y':
                 empty = True
 
-    def _move_to_pose_or_raise(self, arm, pose):
+    def _move_to_pose_or_raise(self, arm, pose, wait=True):
         """Shortcut to move the robots' specified limb to the given pose. If
         the pose was not reached, raise an exception.
 
@@ -101,7 +101,9 @@ class PickAndPlace(object):
             - a ROS Pose,
             - a list of length 6 [x, y, z, roll, pitch, yaw] or
             - a list of length 7 [x, y, z, qx, qy, qz, qw].
-        :return:
+        :param wait: Whether to wait for the motion to finish. If False,
+            later motions of the limb are queued behind this one.
+        :return: The MotionHandle of the motion.
         :raise: ValueError if inverse kinematics failed.
         """
         try:
@@ -109,7 +111,10 @@ class PickAndPlace(object):
         except ValueError as e:
             self._logger.error("This should not have happened! Abort.")
             raise e
-        self._robot.move_to_config(config=config)
+        motion = self._robot.move_to_config_async(config=config)
+        if wait:
+            motion.wait()
+        return motion
 
     def _dither_pose(self, pose, fix_z=False):
         """Modify the given pose slightly in a random fashion.
@@ -150,13 +155,24 @@ class PickAndPlace(object):
             to joint angle values.
         """
         config = None
+        try:
+            config = self._robot.ik(arm=arm, pose=pose)
+        except ValueError:
+            self._logger.debug('Computing IK for pose {} with {} arm '
+                               'failed!'.format(pose, arm))
         while config is None and not rospy.is_shutdown():
-            try:
-                config = self._robot.ik(arm=arm, pose=pose)
-            except ValueError:
-                self._logger.debug('Computing IK for pose {} with {} arm '
-                                   'failed!'.format(pose, arm))
-                pose = self._dither_pose(pose=pose, fix_z=fix_z)
+            # solve IK for a batch of dithered poses in one request
+            poses = [self._dither_pose(pose=pose, fix_z=fix_z)
+                     for _ in range(16)]
+            # skip dithered poses the limb is known not to reach
+            poses = [p for p in poses
+                     if self._robot.is_reachable(pose=p, arm=arm)] or poses
+            configs, valid = self._robot.ik_batch(arm=arm, poses=poses)
+            if valid.any():
+                config = configs[np.flatnonzero(valid)[0]]
+            else:
+                # random walk: dither around one of the failed poses next
+                pose = poses[np.random.randint(len(poses))]
         self._robot.move_to_config(config=config)
         return config
 
@@ -182,28 +198,31 @@ class PickAndPlace(object):
             self._move_to_pose_or_raise(arm=arm, pose=settings.calibration_pose)
             self._wait_for_clear_table(arm=arm)
             heights = list()
-            for n in range(n_samples):
+            # solve IK for batches of random poses until we have enough
+            configs = list()
+            while len(configs) < n_samples and not rospy.is_shutdown():
+                random_poses = [self._robot.sample_task_space_pose(clip_z=True,
+                                                                   arm=arm)
+                                for _ in range(2*n_samples)]
+                cfgs, _ = self._robot.ik_batch(arm=arm, poses=random_poses)
+                configs += [c for c in cfgs if c is not None]
+            for config in configs[:n_samples]:
                 if rospy.is_shutdown():
                     break
-                config = None
-                while config is None:
-                    if rospy.is_shutdown():
-                        break
-                    random_pose = self._robot.sample_task_space_pose(clip_z=True)
-                    try:
-                        config = self._robot.ik(arm=arm, pose=random_pose)
-                    except ValueError:
-                        pass
                 self._robot.move_to_config(config=config)
                 self.publish_vis(image=self._robot.cameras[arm].collect_image())
-                distances = list()
-                while len(distances) < 10:
-                    d = self._robot.measure_distance(arm=arm)
-                    if d is not None:
-                        distances.append(d)
-                distance = np.mean(distances)
+                try:
+                    distance = self._robot.range_sensors[arm].robust_mean(
+                        window=10, timeout=2.0)
+                except RuntimeError:
+                    self._logger.warning("Skipping calibration pose without "
+                                         "valid distance measurements.")
+                    continue
                 heights.append(self._robot.endpoint_pose(arm=arm)[2] -
                                (distance + self._robot.range_offset[2]))
+            if not heights:
+                raise RuntimeError("Failed to measure the distance to the "
+                                   "table at any calibration pose!")
             heights = np.asarray(heights)
             h_min = heights.min()
             h_max = heights.max()
@@ -328,6 +347,8 @@ class PickAndPlace(object):
         self._logger.info("Perform / read calibration of demonstration setup.")
         # height of the table in robot coordinates
         self._robot.z_table = self._calibrate_table_height()
+        # plan limb motions around the table from now on
+        self._robot.collision_checking = settings.baxter_collision_checking
 
         # image patches on a table reference image
         # Needed for selecting empty spots on the table for placing objects.
@@ -359,22 +380,32 @@ class PickAndPlace(object):
         """
         return [a + b for a, b in zip(pose, self._approach_offset)]
 
-    @staticmethod
-    def _is_in_task_space(pose):
-        """Check whether a given pose lies within the robot's task space.
+    def _is_in_task_space(self, pose, arm=None):
+        """Check whether a given pose lies within the robot's task space and
+        is reachable with the gripper pointing down.
+        The reachability map (see Baxter.is_reachable) only serves as a
+        prefilter. It was built with the in-process IK solver, so positions
+        it marks unreachable are confirmed with the IK backend used for
+        execution.
 
         :param pose: A position or pose [x, y, z, ...] (list of len >= 3).
+        :param arm: The arm <'left', 'right'> to check. If None, check
+            whether either arm reaches the pose.
         :return: Boolean flag.
         """
-        xl = settings.task_space_limits_m['x_min']
-        xu = settings.task_space_limits_m['x_max']
-        yl = settings.task_space_limits_m['y_min']
-        yu = settings.task_space_limits_m['y_max']
-        zl = settings.task_space_limits_m['z_min']
-        zu = settings.task_space_limits_m['z_max']
-        if xl <= pose[0] <= xu and yl <= pose[1] <= yu and zl <= pose[2] <= zu:
+        if not self._robot.in_task_space(pose):
+            return False
+        if self._robot.is_reachable(pose=pose, arm=arm):
             return True
-        return False
+        pose = list(pose[:3]) + [np.pi, 0.0, np.pi]
+        try:
+            if arm is None:
+                self._robot.ik_either_limb(pose=pose)
+            else:
+                self._robot.ik(arm=arm, pose=pose)
+        except ValueError:
+            return False
+        return True
 
     def perform(self):
         """Perform the pick-and-place demonstration.
@@ -382,168 +413,181 @@ class PickAndPlace(object):
         :return:
         """
         self._logger.info('Starting pick and place demonstration.')
-        instr = client.wait_for_instruction()
-        while not rospy.is_shutdown() and instr != 'exit':
-            obj_id, tgt_id = instr.split(' ')
-            self._logger.info('Instructed to take {} and {}.'.format(
-                'the {}'.format(obj_id) if obj_id != 'hand' else "'it'",
-                'give it to you' if tgt_id == 'hand' else 'put it on the table')
-            )
-
-            self._logger.info('Looking for {} and estimate its '
-                              'pose.'.format(obj_id))
-            if obj_id == 'hand':
-                arm = None
-                while not rospy.is_shutdown():
-                    obj_pose = self._camera.estimate_hand_position(
-                        hand=settings.human_hand)
+        # keep the latest Kinect color and skeleton data at hand, such that
+        # hand position queries do not need to wait for the network
+        self._camera.start_grabber(color=True, depth=False, skeleton=True)
+        try:
+            instr = client.wait_for_instruction()
+            while not rospy.is_shutdown() and instr != 'exit':
+                obj_id, tgt_id = instr.split(' ')
+                self._logger.info('Instructed to take {} and {}.'.format(
+                    'the {}'.format(obj_id) if obj_id != 'hand' else "'it'",
+                    'give it to you' if tgt_id == 'hand' else 'put it on the table')
+                )
+
+                self._logger.info('Looking for {} and estimate its '
+                                  'pose.'.format(obj_id))
+                if obj_id == 'hand':
+                    arm = None
+                    while not rospy.is_shutdown():
+                        obj_pose = self._camera.estimate_hand_position(
+                            hand=settings.human_hand)
+                        if obj_pose is None:
+                            self._logger.warning("No hand position estimate was found!")
+                        elif not self._is_in_task_space(pose=obj_pose):
+                            self._logger.warning("Hand position estimate is not "
+                                                 "within task space!")
+                            obj_pose = None
+                        else:
+                            break
+                        self._logger.info("Please relocate your {} hand holding "
+                                          "the object.".format(settings.human_hand))
+                        rospy.sleep(2.0)
+                    obj_pose += [np.pi, 0.0, np.pi]
+                else:
+                    arm = self._robot.select_gripper_for_object(object_id=obj_id)
+                    # img_color, img_depth, _ = self._camera.collect_data(color=True,
+                    #                                                     depth=True,
+                    #                                                     skeleton=False)
+                    # det = self._detection.detect_object(image=img_color,
+                    #                                     object_id=obj_id,
+                    #                                     threshold=0.5)
+                    # draw_detection(image=img_color, detections=det)
+                    # self.publish_vis(image=img_color)
+                    # obj_pose = self._camera.estimate_object_position(img_color=img_color,
+                    #                                                  bbox=det['box'],
+                    #                                                  img_depth=img_depth)
+                    obj_pose = None
                     if obj_pose is None:
-                        self._logger.warning("No hand position estimate was found!")
+                        self._logger.warning("I did not find the {} using the "
+                                             "Kinect!".format(obj_id))
+                        self._logger.info('I resort to searching with the robot.')
+                        obj_pose = settings.search_pose[:3]
                     elif not self._is_in_task_space(pose=obj_pose):
-                        self._logger.warning("Hand position estimate is not "
-                                             "within task space!")
+                        self._logger.debug("Object position estimate[" +
+                                           (" {: .3f}"*3).format(*obj_pose) +
+                                           " ] is not within task space!")
                         obj_pose = None
+                    if obj_pose is None:
+                        self._logger.warning("I abort this task! Please start over.")
+                        instr = client.wait_for_instruction()
+                        continue
+                    obj_pose += [np.pi, 0.0, np.pi]
+                appr_pose = self._get_approach_pose(pose=obj_pose)
+                try:
+                    if arm is None:
+                        arm, appr_cfg = self._robot.ik_either_limb(pose=appr_pose)
                     else:
-                        break
-                    self._logger.info("Please relocate your {} hand holding "
-                                      "the object.".format(settings.human_hand))
-                    rospy.sleep(2.0)
-                obj_pose += [np.pi, 0.0, np.pi]
-            else:
-                arm = self._robot.select_gripper_for_object(object_id=obj_id)
-                # img_color, img_depth, _ = self._camera.collect_data(color=True,
-                #                                                     depth=True,
-                #                                                     skeleton=False)
-                # det = self._detection.detect_object(image=img_color,
-                #                                     object_id=obj_id,
-                #                                     threshold=0.5)
-                # draw_detection(image=img_color, detections=det)
-                # self.publish_vis(image=img_color)
-                # obj_pose = self._camera.estimate_object_position(img_color=img_color,
-                #                                                  bbox=det['box'],
-                #                                                  img_depth=img_depth)
-                obj_pose = None
-                if obj_pose is None:
-                    self._logger.warning("I did not find the {} using the "
-                                         "Kinect!".format(obj_id))
-                    self._logger.info('I resort to searching with the robot.')
-                    obj_pose = settings.search_pose[:3]
-                elif not self._is_in_task_space(pose=obj_pose):
-                    self._logger.debug("Object position estimate[" +
-                                       (" {: .3f}"*3).format(*obj_pose) +
-                                       " ] is not within task space!")
-                    obj_pose = None
-                if obj_pose is None:
+                        appr_cfg = self._robot.ik(arm=arm, pose=appr_pose)
+                except ValueError:
                     self._logger.warning("I abort this task! Please start over.")
                     instr = client.wait_for_instruction()
                     continue
-                obj_pose += [np.pi, 0.0, np.pi]
-            appr_pose = self._get_approach_pose(pose=obj_pose)
-            try:
-                if arm is None:
-                    arm, appr_cfg = self._robot.ik_either_limb(pose=appr_pose)
-                else:
-                    appr_cfg = self._robot.ik(arm=arm, pose=appr_pose)
-            except ValueError:
-                self._logger.warning("I abort this task! Please start over.")
-                instr = client.wait_for_instruction()
-                continue
-
-            if tgt_id == 'table':
-                self._logger.info('Looking for a spot to put the object down.')
-                self._move_to_pose_or_raise(arm=arm, pose=settings.calibration_pose)
-                table_img = self._robot.cameras[arm].collect_image()
-                idxs = range(len(self._table_patches))
-                random.shuffle(idxs)
-                tgt_pose = None
-                for idx in idxs:
-                    if rospy.is_shutdown() or tgt_pose is not None:
-                        break
-                    (xul, yul), (xlr, ylr) = self._table_patches[idx]
-                    table_patch = table_img[yul:ylr, xul: xlr]
-                    ref_patch = self._table_image[arm][yul:ylr, xul: xlr]
-                    diff, vis_patch = color_difference(image_1=table_patch,
-                                                       image_2=ref_patch)
-                    img_copy = np.copy(table_img)
-                    img_copy[yul:ylr, xul:xlr] = cv2.cvtColor(vis_patch, cv2.COLOR_GRAY2BGR)
-                    cv2.rectangle(img_copy, pt1=(xul, yul), pt2=(xlr, ylr),
-                                  color=[0, 255, 0], thickness=1)
-                    self.publish_vis(image=img_copy)
-                    change = diff.mean()*100.0
-                    accepted = change <= settings.color_change_threshold
-                    self._logger.debug("Patch {} changed by {:.2f}% {} {:.2f}%.".format(
-                        idx, change, '<' if accepted else '>', settings.color_change_threshold))
-                    if diff.mean()*100.0 < settings.color_change_threshold:
-                        pose = self._table_poses[idx]
-                        pose[2] += 0.01
-                        try:
-                            _ = self._robot.ik(arm=arm, pose=pose)
-                            tgt_pose = pose
-                        except ValueError:
-                            pass
-                if tgt_pose is None:
-                    self._logger.warning("Found no place to put the object down! "
-                                         "I abort this task. Please start over.")
-                    instr = client.wait_for_instruction()
-                    continue
 
-            self._logger.info('Picking up the object.')
-            self._logger.info('Attempting to grasp object with {} limb.'.format(arm))
-            self._robot.move_to_config(config=appr_cfg)
-            while not rospy.is_shutdown():
-                self._logger.info('Using visual servoing to grasp object.')
-                if obj_id == 'hand':
-                    ret = self._servo['hand'].servo(arm=arm, object_id=obj_id)
-                else:
-                    ret = self._servo['table'].servo(arm=arm, object_id=obj_id)
-                if ret:
-                    if self._robot.grasp(arm):
-                        break
-                    else:
-                        self._logger.info('Something went wrong. I will try again.')
-                        self._robot.release(arm)
-                        self._robot.move_to_config(config=appr_cfg)
-                else:
-                    new_pose = self._dither_pose(pose=appr_pose, fix_z=True)
-                    try:
-                        self._robot.move_to_pose(arm=arm, pose=new_pose)
-                    except ValueError:
+                if tgt_id == 'table':
+                    self._logger.info('Looking for a spot to put the object down.')
+                    self._move_to_pose_or_raise(arm=arm, pose=settings.calibration_pose)
+                    table_img = self._robot.cameras[arm].collect_image()
+                    idxs = range(len(self._table_patches))
+                    random.shuffle(idxs)
+                    candidates = list()
+                    for idx in idxs:
+                        if rospy.is_shutdown():
+                            break
+                        (xul, yul), (xlr, ylr) = self._table_patches[idx]
+                        table_patch = table_img[yul:ylr, xul: xlr]
+                        ref_patch = self._table_image[arm][yul:ylr, xul: xlr]
+                        diff, vis_patch = color_difference(image_1=table_patch,
+                                                           image_2=ref_patch)
+                        img_copy = np.copy(table_img)
+                        img_copy[yul:ylr, xul:xlr] = cv2.cvtColor(vis_patch, cv2.COLOR_GRAY2BGR)
+                        cv2.rectangle(img_copy, pt1=(xul, yul), pt2=(xlr, ylr),
+                                      color=[0, 255, 0], thickness=1)
+                        self.publish_vis(image=img_copy)
+                        change = diff.mean()*100.0
+                        accepted = change <= settings.color_change_threshold
+                        self._logger.debug("Patch {} changed by {:.2f}% {} {:.2f}%.".format(
+                            idx, change, '<' if accepted else '>', settings.color_change_threshold))
+                        if diff.mean()*100.0 < settings.color_change_threshold:
+                            pose = list(self._table_poses[idx])
+                            pose[2] += 0.01
+                            candidates.append(pose)
+                    tgt_pose = None
+                    if candidates:
+                        # check all free spots with one IK request
+                        _, valid = self._robot.ik_batch(arm=arm, poses=candidates)
+                        if valid.any():
+                            tgt_pose = candidates[np.flatnonzero(valid)[0]]
+                    if tgt_pose is None:
+                        self._logger.warning("Found no place to put the object down! "
+                                             "I abort this task. Please start over.")
+                        instr = client.wait_for_instruction()
                         continue
-            self._logger.info("Successfully grasped the object.")
-            self._move_to_pose_or_raise(arm=arm, pose=settings.top_pose)
-
-            self._logger.info('Placing the object.')
-            if tgt_id == 'table':
-                appr_pose = self._get_approach_pose(pose=tgt_pose)
-                appr_cfg = self._move_to_pose_or_dither(arm=arm, pose=appr_pose)
-                self._move_to_pose_or_dither(arm=arm, pose=tgt_pose, fix_z=True)
-                self._robot.release(arm)
+
+                self._logger.info('Picking up the object.')
+                self._logger.info('Attempting to grasp object with {} limb.'.format(arm))
                 self._robot.move_to_config(config=appr_cfg)
-            else:
                 while not rospy.is_shutdown():
-                    tgt_pose = self._camera.estimate_hand_position(
-                        hand=settings.human_hand)
-                    if tgt_pose is None:
-                        self._logger.warning("No hand position estimate was found!")
-                    elif not self._is_in_task_space(pose=tgt_pose):
-                        self._logger.warning("Hand position estimate is not "
-                                             "within task space!")
-                        tgt_pose = None
+                    self._logger.info('Using visual servoing to grasp object.')
+                    if obj_id == 'hand':
+                        ret = self._servo['hand'].servo(arm=arm, object_id=obj_id)
                     else:
-                        break
-                    self._logger.info("Please relocate your hand.")
-                    rospy.sleep(2.0)
-                tgt_pose += [np.pi, 0.0, np.pi]
-                self._move_to_pose_or_dither(arm=arm, pose=tgt_pose, fix_z=True)
-                self._logger.info('Please take the object from me.')
-                while self._robot.is_gripping(arm):
-                    rospy.sleep(0.5)
-                self._robot.release(arm)
-            self._move_to_pose_or_raise(arm=arm, pose=settings.top_pose)
-            self._robot.move_to_neutral(arm=arm)
-            self._logger.info('I finished my task.')
+                        ret = self._servo['table'].servo(arm=arm, object_id=obj_id)
+                    if ret:
+                        if self._robot.grasp(arm):
+                            break
+                        else:
+                            self._logger.info('Something went wrong. I will try again.')
+                            self._robot.release(arm)
+                            self._robot.move_to_config(config=appr_cfg)
+                    else:
+                        new_pose = self._dither_pose(pose=appr_pose, fix_z=True)
+                        try:
+                            self._robot.move_to_pose(arm=arm, pose=new_pose)
+                        except ValueError:
+                            continue
+                self._logger.info("Successfully grasped the object.")
+                # lift the object in the background, such that solving IK for
+                # the table spot or tracking the hand overlaps with the motion
+                lift = self._move_to_pose_or_raise(arm=arm, pose=settings.top_pose,
+                                                   wait=False)
+
+                self._logger.info('Placing the object.')
+                if tgt_id == 'table':
+                    appr_pose = self._get_approach_pose(pose=tgt_pose)
+                    appr_cfg = self._move_to_pose_or_dither(arm=arm, pose=appr_pose)
+                    self._move_to_pose_or_dither(arm=arm, pose=tgt_pose, fix_z=True)
+                    self._robot.release(arm)
+                    self._robot.move_to_config(config=appr_cfg)
+                else:
+                    while not rospy.is_shutdown():
+                        tgt_pose = self._camera.estimate_hand_position(
+                            hand=settings.human_hand)
+                        if tgt_pose is None:
+                            self._logger.warning("No hand position estimate was found!")
+                        elif not self._is_in_task_space(pose=tgt_pose, arm=arm):
+                            self._logger.warning("Hand position estimate is not "
+                                                 "within task space!")
+                            tgt_pose = None
+                        else:
+                            break
+                        self._logger.info("Please relocate your hand.")
+                        rospy.sleep(2.0)
+                    tgt_pose += [np.pi, 0.0, np.pi]
+                    self._logger.debug("Found hand {:.3f} s into lifting the "
+                                       "object.".format(lift.duration()))
+                    self._move_to_pose_or_dither(arm=arm, pose=tgt_pose, fix_z=True)
+                    self._logger.info('Please take the object from me.')
+                    while self._robot.is_gripping(arm):
+                        rospy.sleep(0.5)
+                    self._robot.release(arm)
+                self._move_to_pose_or_raise(arm=arm, pose=settings.top_pose)
+                self._robot.move_to_neutral(arm=arm)
+                self._logger.info('I finished my task.')
 
-            instr = client.wait_for_instruction()
-        if instr == 'exit':
-            self._logger.info('Instructed to exit the demonstration.')
+                instr = client.wait_for_instruction()
+            if instr == 'exit':
+                self._logger.info('Instructed to exit the demonstration.')
+        finally:
+            self._camera.stop_grabber()
         self._logger.info('Exiting pick and place demonstration.')
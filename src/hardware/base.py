@@ -23,9 +23,14 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+from collections import deque
 import logging
 import numpy as np
+import sys
+import threading
+import time
 
+import cv2
 import cv_bridge
 
 import rospy
@@ -34,9 +39,11 @@ from sensor_msgs.msg import (
     Image
 )
 
+from depth_registration import normalized_ray_grid
+
 
 class Camera(object):
-    def __init__(self, topic, prefix, cam_pars=None):
+    def __init__(self, topic, prefix, cam_pars=None, buffer_size=5):
         """Base class for a ROS camera.
         A camera should have at least
           - a method to read images from a ROS topic,
@@ -51,8 +58,15 @@ class Camera(object):
                 - a 3x3 camera matrix,
                 - the image size (height, width) and
                 - the camera distortion coefficients.
+        :param buffer_size: The number of most recent image messages to keep
+            in the ring buffer filled by the image topic subscriber.
         """
         self._topic = topic
+        # The subscriber is created on first use and kept alive, filling a
+        # ring buffer of (header time stamp, image message) tuples.
+        self._subscriber = None
+        self._buffer = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
 
         self._logger = logging.getLogger('{}.cam'.format(prefix))
 
@@ -71,6 +85,9 @@ class Camera(object):
 
         self.meters_per_pixel = None
 
+        # cached normalized ray grids, keyed by intrinsics and image size
+        self._rays = dict()
+
     def _get_ros_calibration(self):
         """Read the calibration data of the camera from the ROS topic. For
         additional information see
@@ -90,21 +107,46 @@ class Camera(object):
         except rospy.ROSException:
             raise RuntimeError("Unable to read camera info from ROS master!")
 
-    def collect_image(self):
-        """Read the most recent image message from the ROS topic and convert
-        it into a numpy array.
+    def subscribe(self):
+        """Subscribe to the image topic, if not done yet. From then on the
+        ring buffer holds the most recent image messages.
 
+        :return:
+        """
+        if self._subscriber is None:
+            self._subscriber = rospy.Subscriber(self._topic, Image,
+                                                self._callback, queue_size=1,
+                                                buff_size=2**24)
+
+    def unsubscribe(self):
+        """Unsubscribe from the image topic and clear the ring buffer.
+
+        :return:
+        """
+        if self._subscriber is not None:
+            self._subscriber.unregister()
+            self._subscriber = None
+        with self._cond:
+            self._buffer.clear()
+
+    def _callback(self, msg):
+        stamp = msg.header.stamp.to_sec()
+        if stamp == 0.0:
+            # unstamped message, use time of reception instead
+            stamp = rospy.get_time()
+        with self._cond:
+            self._buffer.append((stamp, msg))
+            self._cond.notify_all()
+
+    def _convert(self, msg, copy=True):
+        """Convert an image message into a numpy array.
+
+        :param msg: A ROS image message.
+        :param copy: Whether to return an array that does not share memory
+            with the image message. Otherwise the array may be read-only.
         :return: An image (a (height, width, n_channels) numpy array).
         """
-        try:
-            msg = rospy.wait_for_message(topic=self._topic,
-                                         topic_type=Image,
-                                         timeout=0.5)
-            img = imgmsg_to_img(imgmsg=msg)
-        except rospy.ROSException:
-            msg = "ROS error while reading image from {}.".format(self._topic)
-            self._logger.error(msg)
-            raise RuntimeError(msg)
+        img = imgmsg_to_img(imgmsg=msg, copy=copy)
         if img.dtype == np.float32:
             # In simulation, depth map is a float32 image
             mask = np.isnan(img)
@@ -115,7 +157,8 @@ class Camera(object):
                 self._logger.debug("{}: There was at least one NaN in the depth "
                                    "image. I replaced all occurrences with "
                                    "0.0 m.".format(self._topic))
-                img.flags.writeable = True
+                if not img.flags.writeable:
+                    img = img.copy()
                 img[mask] = 0.0
                 # We now map the float values in meters to uint16 values in mm
                 # as provided by the libfreenect2 library and Kinect SDK.
@@ -123,6 +166,81 @@ class Camera(object):
                 img = img.astype(np.uint16, copy=False)
         return img
 
+    def _snapshot(self):
+        """Return the content of the ring buffer.
+
+        :return: A list of (time stamp, image message) tuples, oldest first.
+        """
+        with self._cond:
+            return list(self._buffer)
+
+    def latest(self, max_age=None):
+        """Return the most recent image immediately.
+
+        :param max_age: The maximum age of the image in s. If None, any age
+            is accepted.
+        :return: A tuple (image, time stamp). The image is None if no
+            (sufficiently recent) image was received yet.
+        """
+        self.subscribe()
+        with self._cond:
+            if not self._buffer:
+                return None, 0.0
+            stamp, msg = self._buffer[-1]
+        if max_age is not None and rospy.get_time() - stamp > max_age:
+            return None, stamp
+        return self._convert(msg), stamp
+
+    def wait_newer_than(self, stamp, timeout=0.5):
+        """Wait for an image stamped after the given time stamp.
+
+        :param stamp: The time stamp (in s) the image needs to be newer than.
+        :param timeout: The maximum time to wait in s.
+        :return: A tuple (image, time stamp).
+        :raise RuntimeError: If no newer image arrived within the timeout.
+        """
+        self.subscribe()
+        end = time.time() + timeout
+        with self._cond:
+            while not self._buffer or self._buffer[-1][0] <= stamp:
+                remaining = end - time.time()
+                if remaining <= 0.0:
+                    msg = "No new image from {} within {} s.".format(
+                        self._topic, timeout)
+                    self._logger.error(msg)
+                    raise RuntimeError(msg)
+                self._cond.wait(remaining)
+            stamp, msg = self._buffer[-1]
+        return self._convert(msg), stamp
+
+    def last_n(self, k):
+        """Return the k most recent images, e.g., for averaging.
+
+        :param k: The number of images to return (at most the size of the
+            ring buffer).
+        :return: A list of up to k tuples (image, time stamp), oldest first.
+            The images may be read-only views onto the image messages.
+        """
+        if k <= 0:
+            return []
+        self.subscribe()
+        with self._cond:
+            entries = list(self._buffer)[-k:]
+        return [(self._convert(msg, copy=False), stamp)
+                for stamp, msg in entries]
+
+    def collect_image(self):
+        """Read the next image from the ROS topic and convert it into a numpy
+        array.
+
+        :return: An image (a (height, width, n_channels) numpy array).
+        """
+        self.subscribe()
+        with self._cond:
+            stamp = self._buffer[-1][0] if self._buffer else 0.0
+        img, _ = self.wait_newer_than(stamp, timeout=0.5)
+        return img
+
     def projection_pixel_to_camera(self, pixel, z):
         """Project a 2d point (px, py) in pixel coordinates into 3D camera
         coordinates.
@@ -166,43 +284,300 @@ class Camera(object):
             return px, self.image_size[0] - py
         raise ValueError("'position' should be a list of length 3!")
 
+    def ray_grid(self, size=None):
+        """Return the (cached) normalized viewing rays (x/z, y/z) through
+        all pixels of the camera.
+
+        :param size: The size (height, width) of the image. If None, the
+            image size of the camera is used.
+        :return: A (height, width, 2) float32 numpy array.
+        """
+        size = tuple(int(x) for x in (size or self.image_size)[:2])
+        key = (size, self.camera_matrix.tostring())
+        if key not in self._rays:
+            self._rays[key] = normalized_ray_grid(self.camera_matrix, size)
+        return self._rays[key]
+
+    def point_cloud(self, img_depth, mask=None, roi=None, voxel_size=None,
+                    max_points=None):
+        """Project a depth image into 3D camera coordinates.
+        The y axis is flipped as in projection_pixel_to_camera.
+
+        :param img_depth: A depth image, either integer valued in
+            millimeters or floating point valued in meters.
+        :param mask: An optional boolean (height, width) numpy array
+            selecting the pixels to project.
+        :param roi: An optional region of interest (x_min, y_min, x_max,
+            y_max) in pixels to project.
+        :param voxel_size: If given, the points are downsampled to one point
+            per voxel of this edge length (in meters), see voxel_downsample.
+        :param max_points: If given, at most this many points are returned.
+        :return: A (N, 3) float32 numpy array of camera coordinates of the
+            pixels with valid (non-zero) depth.
+        """
+        rays = self.ray_grid(img_depth.shape[:2])
+        if mask is not None:
+            mask = np.asarray(mask, dtype=bool)
+        if roi is not None:
+            x0, y0, x1, y1 = [int(x) for x in roi]
+            img_depth = img_depth[y0:y1, x0:x1]
+            rays = rays[y0:y1, x0:x1]
+            if mask is not None:
+                mask = mask[y0:y1, x0:x1]
+        z = img_depth.astype(np.float32)
+        if img_depth.dtype.kind in 'iu':
+            z *= np.float32(0.001)
+        valid = z > 0
+        if mask is not None:
+            valid &= mask
+        z = z[valid]
+        rays = rays[valid]
+        points = np.empty((len(z), 3), dtype=np.float32)
+        points[:, 0] = rays[:, 0]*z
+        # flip y axis
+        points[:, 1] = -rays[:, 1]*z
+        points[:, 2] = z
+        if voxel_size is not None:
+            points = voxel_downsample(points, voxel_size)
+        if max_points is not None and len(points) > max_points:
+            points = points[np.linspace(0, len(points) - 1,
+                                        max_points).astype(np.int64)]
+        return points
+
+
+def voxel_downsample(points, voxel_size):
+    """Downsample a point cloud by replacing all points within a voxel of
+    a regular grid by their centroid.
+
+    :param points: A (N, 3) numpy array of points.
+    :param voxel_size: The edge length of the voxels.
+    :return: A (M, 3) float32 numpy array of points, M <= N.
+    """
+    if len(points) == 0:
+        return np.asarray(points, dtype=np.float32).reshape((0, 3))
+    cells = np.floor(points/voxel_size).astype(np.int64)
+    cells -= cells.min(axis=0)
+    dims = cells.max(axis=0) + 1
+    keys = (cells[:, 0]*dims[1] + cells[:, 1])*dims[2] + cells[:, 2]
+    _, index = np.unique(keys, return_inverse=True)
+    counts = np.bincount(index)
+    centroids = np.empty((len(counts), 3), dtype=np.float32)
+    for i in range(3):
+        centroids[:, i] = np.bincount(index, weights=points[:, i])/counts
+    return centroids
+
+
+class CameraPair(object):
+    def __init__(self, first, second, tolerance=0.02):
+        """Time-synchronized image pairs from two cameras, e.g., the color and
+        depth images of a Kinect. Images are matched by their header time
+        stamps from the ring buffers of both cameras, and the newest matched
+        pair is kept converted for repeated reads.
+
+        :param first: The first Camera.
+        :param second: The second Camera.
+        :param tolerance: The maximum difference in s between the time
+            stamps of two images to be considered a pair.
+        """
+        self._first = first
+        self._second = second
+        self._tolerance = tolerance
+        # (first stamp, second stamp, first image, second image)
+        self._cached = None
+
+    def _match(self):
+        """Find the newest pair of images whose time stamps differ by no more
+        than the tolerance.
+
+        :return: A tuple (first entry, second entry) of (time stamp, image
+            message) tuples or None if there is no such pair.
+        """
+        entries = self._second._snapshot()
+        for first in reversed(self._first._snapshot()):
+            # second entry closest in time to the first entry
+            best = None
+            for second in entries:
+                dt = abs(second[0] - first[0])
+                if dt <= self._tolerance and (best is None or dt < best[0]):
+                    best = (dt, second)
+            if best is not None:
+                return first, best[1]
+        return None
+
+    def _get(self, match):
+        """Convert a matched pair, reusing the cached images if possible.
+
+        :param match: A tuple (first entry, second entry), see _match.
+        :return: A triple (first image, second image, time stamp), where the
+            time stamp is the later of the two images' time stamps.
+        """
+        (stamp_a, msg_a), (stamp_b, msg_b) = match
+        if self._cached is None or self._cached[:2] != (stamp_a, stamp_b):
+            self._cached = (stamp_a, stamp_b,
+                            self._first._convert(msg_a, copy=False),
+                            self._second._convert(msg_b, copy=False))
+        img_a, img_b = self._cached[2:]
+        return img_a.copy(), img_b.copy(), max(stamp_a, stamp_b)
+
+    def latest(self):
+        """Return the newest matched pair immediately.
+
+        :return: A triple (first image, second image, time stamp). The images
+            are None if no matched pair was received yet.
+        """
+        self._first.subscribe()
+        self._second.subscribe()
+        match = self._match()
+        if match is None:
+            return None, None, 0.0
+        return self._get(match)
+
+    def wait_newer_than(self, stamp, timeout=0.5):
+        """Wait for a matched pair with both images stamped after the given
+        time stamp.
+
+        :param stamp: The time stamp (in s) the images need to be newer than.
+        :param timeout: The maximum time to wait in s.
+        :return: A triple (first image, second image, time stamp).
+        :raise RuntimeError: If no newer pair arrived within the timeout.
+        """
+        self._first.subscribe()
+        self._second.subscribe()
+        end = time.time() + timeout
+        while True:
+            match = self._match()
+            if match is not None and min(match[0][0], match[1][0]) > stamp:
+                return self._get(match)
+            remaining = end - time.time()
+            if remaining <= 0.0:
+                raise RuntimeError("No synchronized images from {} and {} "
+                                   "within {} s.".format(self._first._topic,
+                                                         self._second._topic,
+                                                         timeout))
+            # wake up on new images of the second camera, but look at both
+            with self._second._cond:
+                self._second._cond.wait(min(remaining, 0.005))
+
+    def collect(self, timeout=0.5):
+        """Return the next matched pair captured after this call.
+
+        :param timeout: The maximum time to wait in s.
+        :return: A triple (first image, second image, time stamp).
+        :raise RuntimeError: If no new pair arrived within the timeout.
+        """
+        self._first.subscribe()
+        self._second.subscribe()
+        stamps = [e[-1][0] for e in [self._first._snapshot(),
+                                     self._second._snapshot()] if e]
+        return self.wait_newer_than(max(stamps) if stamps else 0.0,
+                                    timeout=timeout)
+
+
+# Encodings that map onto a (height, width[, channels]) numpy array without
+# any channel conversion, as (dtype, number of channels).
+_plain_encodings = {
+    'bgr8': (np.uint8, 3),
+    'mono8': (np.uint8, 1),
+    '8UC1': (np.uint8, 1),
+    '8UC3': (np.uint8, 3),
+    'bgra8': (np.uint8, 4),
+    'rgb8': (np.uint8, 3),
+    'rgba8': (np.uint8, 4),
+    'mono16': (np.uint16, 1),
+    '16UC1': (np.uint16, 1),
+    '32FC1': (np.float32, 1)
+}
+
+# Channel conversions to apply to obtain a BGR image from color encodings.
+_to_bgr = {
+    'mono8': cv2.COLOR_GRAY2BGR,
+    '8UC1': cv2.COLOR_GRAY2BGR,
+    'bgra8': cv2.COLOR_BGRA2BGR,
+    'rgb8': cv2.COLOR_RGB2BGR,
+    'rgba8': cv2.COLOR_RGBA2BGR
+}
+
+# Encodings for outgoing image messages, keyed by (dtype, number of channels).
+_from_array = {
+    (np.dtype(np.uint8), 3): 'bgr8',
+    (np.dtype(np.uint8), 1): 'mono8',
+    (np.dtype(np.uint8), 4): 'bgra8',
+    (np.dtype(np.uint16), 1): '16UC1',
+    (np.dtype(np.float32), 1): '32FC1'
+}
+
+# one CvBridge for all encodings not handled above
+_bridge = None
+
+
+def _get_bridge():
+    global _bridge
+    if _bridge is None:
+        _bridge = cv_bridge.CvBridge()
+    return _bridge
+
 
-def imgmsg_to_img(imgmsg):
+def imgmsg_to_img(imgmsg, copy=False):
     """Convert a ROS image message to a numpy array holding the image.
+    Color images are converted to BGR, depth images are returned as is.
+    If no channel conversion is needed, the array is a read-only view onto
+    the message data unless a copy is requested.
 
     :param imgmsg: A ROS image message.
-    :return: The BGR image as a (height, width, n_channels) numpy array.
+    :param copy: Whether to return an array that does not share memory with
+        the image message.
+    :return: The BGR image as a (height, width, n_channels) numpy array or
+        the depth image as a (height, width) numpy array.
     """
-    img = None
-    for enc in ['bgr8', 'mono8', 'passthrough']:
+    enc = imgmsg.encoding
+    if enc not in _plain_encodings:
         try:
-            img = cv_bridge.CvBridge().imgmsg_to_cv2(imgmsg, enc)
+            return _get_bridge().imgmsg_to_cv2(imgmsg, 'passthrough')
         except cv_bridge.CvBridgeError:
-            pass
-        except AttributeError as e:
-            raise e
-        if img is not None:
-            break
-    if img is None:
+            raise ValueError("Cannot convert image message to numpy array!")
+    dtype, n_channels = _plain_encodings[enc]
+    dtype = np.dtype(dtype)
+    if dtype.itemsize > 1:
+        dtype = dtype.newbyteorder('>' if imgmsg.is_bigendian else '<')
+    shape = (imgmsg.height, imgmsg.width)
+    strides = (imgmsg.step, n_channels*dtype.itemsize)
+    if n_channels > 1:
+        shape += (n_channels,)
+        strides += (dtype.itemsize,)
+    try:
+        img = np.ndarray(shape=shape, dtype=dtype, buffer=imgmsg.data,
+                         strides=strides)
+    except (TypeError, ValueError):
         raise ValueError("Cannot convert image message to numpy array!")
+    if enc in _to_bgr:
+        return cv2.cvtColor(img, _to_bgr[enc])
+    if not dtype.isnative:
+        return img.astype(dtype.newbyteorder('='))
+    if copy:
+        return img.copy()
     return img
 
 
 def img_to_imgmsg(img):
     """Convert a numpy array holding an image to a ROS image message.
+    The image data is copied into the message exactly once.
 
     :param img: A BGR image as a (height, width, n_channels) numpy array.
     :return: The corresponding ROS image message.
     """
-    imgmsg = None
-    for enc in ['bgr8', 'mono8', 'passthrough']:
+    n_channels = 1 if img.ndim == 2 else img.shape[2]
+    enc = _from_array.get((img.dtype.newbyteorder('='), n_channels))
+    if enc is None:
         try:
-            imgmsg = cv_bridge.CvBridge().cv2_to_imgmsg(img, enc)
+            return _get_bridge().cv2_to_imgmsg(img, 'passthrough')
         except cv_bridge.CvBridgeError:
-            pass
-        if imgmsg is not None:
-            break
-    if imgmsg is None:
-        raise ValueError("Cannot convert {} {} array to image message!".format(
-            img.shape, img.dtype))
+            raise ValueError("Cannot convert {} {} array to image "
+                             "message!".format(img.shape, img.dtype))
+    imgmsg = Image()
+    imgmsg.height, imgmsg.width = img.shape[:2]
+    imgmsg.encoding = enc
+    imgmsg.is_bigendian = img.dtype.byteorder == '>' or (
+        img.dtype.byteorder == '=' and sys.byteorder == 'big')
+    imgmsg.step = imgmsg.width*n_channels*img.dtype.itemsize
+    imgmsg.data = img.tostring()
     return imgmsg
@@ -24,7 +24,13 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 import logging
+from functools import partial
+from multiprocessing.pool import ThreadPool
+import os
+import threading
+import time
 
+import actionlib
 import baxter_interface
 import numpy as np
 import rospy
@@ -32,13 +38,26 @@ from baxter_core_msgs.srv import (
     SolvePositionIK,
     SolvePositionIKRequest
 )
+from control_msgs.msg import (
+    FollowJointTrajectoryAction,
+    FollowJointTrajectoryGoal,
+    FollowJointTrajectoryResult
+)
 from geometry_msgs.msg import (
     Pose,
     PoseStamped
 )
+from trajectory_msgs.msg import JointTrajectoryPoint
 
 from base import Camera
-from motion_planning import SimplePlanner
+from ik_cache import IKCache
+from kinematics import IKSolver, KinematicChain, load_urdf
+from kinematics import load_reachability_map, pose_to_hom
+from motion import MotionHandle
+from range_sensor import RangeSensor
+from snapshot import KinematicSnapshot
+from motion_planning import CollisionChecker, RRTConnectPlanner
+from motion_planning import SimplePlanner, TrajectoryPlanner
 from motion_planning.base import MotionPlanner
 from settings import settings
 from utils import list_to_pose_msg, pose_dict_to_list
@@ -46,11 +65,19 @@ from utils import pose_dict_to_hom, hom_to_list
 
 
 class Baxter(object):
-    def __init__(self, sim=False):
+    def __init__(self, sim=False, root_dir=None):
         """Hardware abstraction of the Baxter robot using the BaxterSDK
         interface.
 
         :param sim: Whether in Gazebo (True) or on real Baxter (False).
+        :param root_dir: Where the baxter_pick_and_place package resides. If
+            given, the inverse kinematics solutions for the fixed poses in
+            the settings are kept in data/setup/ik_cache.npz between runs,
+            the forward kinematics (see fk) and in-process inverse
+            kinematics solver (see ik_backend) are built from
+            models/baxter/baxter_kinematics.urdf, and the reachability map
+            is loaded from data/setup/reachability.npy (if it was built
+            with scripts/build_reachability_map.py).
         """
         name = 'main.baxter'
         self._logger = logging.getLogger(name)
@@ -62,8 +89,9 @@ class Baxter(object):
         self._grippers_pars = self._grippers['left'].valid_parameters()
         self._grippers_pars['moving_force'] = 40.0
         self._grippers_pars['holding_force'] = 30.0
-        self._sensors = {a: baxter_interface.analog_io.AnalogIO('%s_hand_range' % a)
-                         for a in self._arms}
+        # streams of the infrared range sensors in the hands
+        self.range_sensors = {a: RangeSensor(arm=a, prefix=name)
+                              for a in self._arms}
         # Cameras on the Baxter robot are tricky. Due to limited bandwidth
         # only two cameras can be operating at a time.
         # http://sdk.rethinkrobotics.com/wiki/Camera_Control_Tool
@@ -82,7 +110,74 @@ class Baxter(object):
         self.cameras = {a: Camera(topic='/cameras/{}_hand_camera/image'.format(a),
                                   prefix=name)
                         for a in self._arms}
-        self._planner = SimplePlanner()
+        if settings.baxter_control_mode == 'velocity':
+            self._planner = TrajectoryPlanner(
+                velocity_limits=self._joint_velocity_limits(),
+                acceleration_limits=self._joint_acceleration_limits(),
+                profile=settings.baxter_velocity_profile,
+                speed=settings.baxter_speed_fraction)
+        else:
+            self._planner = SimplePlanner()
+        # the latest motion started per limb, see control_async
+        self._motions = dict()
+        # kinematic state per limb, reused within one control tick (see
+        # snapshot)
+        self._snapshots = dict()
+        self.snapshot_max_age = 0.1
+        self._hom_cam_in_grip = dict()
+        # execute motions with the baxter_interface 'limb' interface or the
+        # joint trajectory 'action' server
+        self.control_backend = 'limb'
+        self._trajectory_clients = dict()
+        # plan around the table and the other limb (see plan), needs the
+        # kinematic chains
+        self.collision_checking = False
+        self._collision_planners = dict()
+        # planning uses shared planner instances, see move_to_config_async
+        self._plan_lock = threading.Lock()
+        # for commanding the limbs and grippers of both arms at once
+        self._command_pool = ThreadPool(processes=2*len(self._arms))
+
+        # persistent connections to the inverse kinematics services
+        self._ik_services = dict()
+        # for querying the inverse kinematics services of both arms at once
+        self._ik_pool = ThreadPool(processes=len(self._arms))
+        self.ik_cost_type = 'distance'
+        # solve inverse kinematics with the 'service' or in-process 'numpy'
+        self.ik_backend = 'service'
+        # kinematic chains from the base to the grippers, with the hand
+        # camera and range sensor frames attached
+        self.kinematics = dict()
+        self._ik_solvers = dict()
+        # which limb reaches which part of the task space, see is_reachable
+        self.reachability = None
+        self.ik_cache = IKCache()
+        self._ik_cache_file = None
+        if root_dir is not None:
+            joints = load_urdf(os.path.join(root_dir, 'models', 'baxter',
+                                            'baxter_kinematics.urdf'))
+            self.kinematics = {
+                a: KinematicChain(joints, base='base', tip='%s_gripper' % a,
+                                  frames=['%s_hand_camera' % a,
+                                          '%s_hand_range' % a])
+                for a in self._arms}
+            self._ik_solvers = {a: IKSolver(self.kinematics[a])
+                                for a in self._arms}
+            self._collision_planners = {
+                a: RRTConnectPlanner(CollisionChecker(
+                    self.kinematics[a], radii=self._link_radii()))
+                for a in self._arms}
+            self._ik_cache_file = os.path.join(root_dir, 'data', 'setup',
+                                               'ik_cache.npz')
+            if os.path.exists(self._ik_cache_file):
+                n = self.ik_cache.load(self._ik_cache_file)
+                self._logger.info("Loaded {} cached IK solutions.".format(n))
+            reachability_file = os.path.join(root_dir, 'data', 'setup',
+                                             'reachability.npy')
+            if os.path.exists(reachability_file):
+                self.reachability = load_reachability_map(reachability_file)
+                self._logger.info("Loaded reachability map with {} cells "
+                                  "per arm.".format(np.prod(self.reachability.shape)))
 
         self._rs = None
         self._init_state = None
@@ -91,34 +186,30 @@ class Baxter(object):
 
         self.z_table = None
 
-    @staticmethod
-    def _get_cam_offset():
+    def _get_cam_offset(self):
         """Get the hand_camera--gripper offset in gripper coordinates.
         Note: The offset is the same for the left and right limbs.
 
-        It would be nicer to implement it using a tf.TransformListener between
-        topics "/left_gripper" and "/left_hand_camera", but for some reason
-        it does not find the topics...
-        See http://wiki.ros.org/tf/TfUsingPython#TransformListener for more
-        details.
+        It is taken from the kinematic model if it was loaded (see fk) and
+        hard-coded otherwise.
 
         :return: The offset as a list of length 3 [dx, dy, dz].
         """
+        if self.kinematics:
+            return list(self.kinematics['left'].offset('left_hand_camera')[:-1, -1])
         return [0.03828, 0.012, -0.142345]
 
-    @staticmethod
-    def _get_range_offset():
+    def _get_range_offset(self):
         """Get the hand_range--gripper offset in gripper coordinates.
         Note: The offset is the same for the left and right limbs.
 
-        It would be nicer to implement it using a tf.TransformListener between
-        topics "/left_gripper" and "/left_hand_range", but for some reason
-        it does not find the topics...
-        See http://wiki.ros.org/tf/TfUsingPython#TransformListener for more
-        details.
+        It is taken from the kinematic model if it was loaded (see fk) and
+        hard-coded otherwise.
 
         :return: The offset as a list of length 3 [dx, dy, dz].
         """
+        if self.kinematics:
+            return list(self.kinematics['left'].offset('left_hand_range')[:-1, -1])
         return [0.032, -0.020245, -0.1289]
 
     def set_up(self, gripper=True):
@@ -136,17 +227,30 @@ class Baxter(object):
 
         self._logger.info("Getting camera offset.")
         self.cam_offset = self._get_cam_offset()
+        self._hom_cam_in_grip = dict()
         self._logger.info("Getting range offset.")
         self.range_offset = self._get_range_offset()
 
         self._logger.info("Moving limbs to neutral configuration and calibrate grippers.")
+        commands = {'move {} limb'.format(a): partial(self.move_to_neutral, arm=a)
+                    for a in self._arms}
+        if gripper:
+            for arm in self._arms:
+                commands['calibrate {} gripper'.format(arm)] = partial(
+                    self._calibrate_gripper, arm=arm)
+        self.run_concurrently(commands)
         for arm in self._arms:
-            self._limbs[arm].move_to_neutral()
-            if gripper:
-                self._grippers[arm].set_parameters(parameters=self._grippers_pars)
-                self._grippers[arm].calibrate()
             # Measured meters per pixel @ 1 m distance
             self.cameras[arm].meters_per_pixel = 0.0025
+            self.range_sensors[arm].subscribe()
+
+    def _calibrate_gripper(self, arm):
+        self._grippers[arm].set_parameters(parameters=self._grippers_pars)
+        self._grippers[arm].calibrate()
+
+    def _open_gripper(self, arm):
+        self._grippers[arm].set_parameters(defaults=True)
+        self._grippers[arm].open()
 
     def clean_up(self, gripper=True):
         """Open both grippers, move both limbs to neutral configuration and
@@ -156,14 +260,70 @@ class Baxter(object):
         """
         self._logger.info("Initiating safe shut-down")
         self._logger.info("Moving limbs to neutral configuration")
-        for arm in self._arms:
-            if gripper:
-                self._grippers[arm].set_parameters(defaults=True)
-                self._grippers[arm].open()
-            self._limbs[arm].move_to_neutral()
+        if gripper:
+            # release held objects where they are before moving
+            self.run_concurrently({'open {} gripper'.format(a): partial(self._open_gripper, arm=a)
+                                   for a in self._arms})
+        self.move_to_neutral()
         if not self._init_state:
             self._logger.info("Disabling robot")
             self._rs.disable()
+        self.save_ik_cache()
+        for service in self._ik_services.values():
+            service.close()
+        self._ik_services = dict()
+        for pool in [self._ik_pool, self._command_pool]:
+            pool.close()
+            pool.join()
+
+    def run_concurrently(self, commands):
+        """Run blocking commands (e.g., for the limbs and grippers of both
+        arms) concurrently and wait for all of them to finish.
+
+        :param commands: Dictionary of label keys to callables without
+            arguments.
+        :return: Dictionary of label keys to the return values of the
+            callables.
+        :raise: The first exception raised by any of the commands, after all
+            commands finished.
+        """
+        def timed(command):
+            start = time.time()
+            result = command()
+            return result, time.time() - start
+
+        start = time.time()
+        pending = {label: self._command_pool.apply_async(timed, (command,))
+                   for label, command in commands.items()}
+        results, durations, error = dict(), dict(), None
+        for label, result in pending.items():
+            try:
+                results[label], durations[label] = result.get()
+            except Exception as e:
+                self._logger.error("Failed to {}: {}".format(label, e))
+                error = error or e
+        if error is not None:
+            raise error
+        self._logger.info("Ran {} concurrently in {:.2f} s ({:.2f} s "
+                          "sequentially).".format(
+                              ', '.join(sorted(commands)),
+                              time.time() - start, sum(durations.values())))
+        return results
+
+    def save_ik_cache(self):
+        """Save the cached inverse kinematics solutions for the fixed poses
+        in the settings (top, calibration and search pose).
+
+        :return:
+        """
+        self._logger.info("IK cache: {entries} entries, {hits} hits, "
+                          "{misses} misses ({hit_rate:.0%} hit rate).".format(
+                              **self.ik_cache.statistics()))
+        if self._ik_cache_file is not None:
+            self.ik_cache.save(self._ik_cache_file,
+                               poses=[settings.top_pose,
+                                      settings.calibration_pose,
+                                      settings.search_pose])
 
     def _stamp_pose(self, pose, target_frame='base'):
         """Create a stamped pose ROS message.
@@ -189,14 +349,19 @@ class Baxter(object):
         pose_msg.header.stamp = rospy.Time.now()
         return pose_msg
 
-    def endpoint_pose(self, arm):
+    def endpoint_pose(self, arm, config=None):
         """Return the current Cartesian pose of the end effector of the given
         limb.
 
         :param arm: The arm <'left', 'right'> to control.
+        :param config: Optional dictionary of joint name keys to joint angles.
+            If given, the pose the end effector would have in this
+            configuration is returned (see fk).
         :return: The pose as a list [x, y, z, roll, pitch, yaw].
         """
-        return pose_dict_to_list(self._limbs[arm].endpoint_pose())
+        if config is not None:
+            return hom_to_list(matrix=self.fk(arm=arm, configs=config))
+        return list(self.snapshot(arm=arm).endpoint_pose)
 
     @staticmethod
     def sample_pose(lim):
@@ -209,25 +374,76 @@ class Baxter(object):
             (lim['yaw_max'] - lim['yaw_min'])*np.random.random_sample() + lim['yaw_min']
         ]
 
-    def sample_task_space_pose(self, clip_z=False):
+    def sample_task_space_pose(self, clip_z=False, arm=None):
         """Sample a random pose from within the robot's task space.
+        If the reachability map is loaded, only positions reachable by the
+        given arm (or either arm) are sampled.
         Note: The orientation is held fixed!
 
         :param clip_z: Whether to clip the maximum z coordinate.
             Used for calibrating the table height, due to strange behavior of
             the distance sensor.
+        :param arm: The arm <'left', 'right'> that should reach the pose. If
+            None, either arm may reach it.
         :return: The random pose as a list [x, y, z, roll, pitch, yaw].
         """
-        borders = settings.task_space_limits_m
+        borders = dict(settings.task_space_limits_m)
         if clip_z:
             borders['z_max'] = 0.0
+        if self.reachability is not None:
+            position = self.reachability.sample(arm=arm,
+                                                z_max=borders['z_max'])
+            if position is not None:
+                return position + [np.pi, 0.0, np.pi]
         borders['roll_max'] = borders['roll_min'] = np.pi
         borders['pitch_max'] = borders['pitch_min'] = 0.0
         borders['yaw_max'] = borders['yaw_min'] = np.pi
         return self.sample_pose(lim=borders)
 
+    def is_reachable(self, pose, arm=None):
+        """Check whether a given pose lies within the robot's task space and,
+        if the reachability map is loaded, is reachable with the gripper
+        pointing down.
+
+        :param pose: A position or pose [x, y, z, ...] (list of len >= 3).
+        :param arm: The arm <'left', 'right'> to check. If None, check
+            whether either arm reaches the pose.
+        :return: Boolean flag.
+        """
+        if self.reachability is not None:
+            return self.reachability.is_reachable(pose, arm=arm)
+        return self.in_task_space(pose)
+
+    @staticmethod
+    def in_task_space(pose):
+        """Check whether a given pose lies within the robot's task space.
+
+        :param pose: A position or pose [x, y, z, ...] (list of len >= 3).
+        :return: Boolean flag.
+        """
+        lim = settings.task_space_limits_m
+        return (lim['x_min'] <= pose[0] <= lim['x_max'] and
+                lim['y_min'] <= pose[1] <= lim['y_max'] and
+                lim['z_min'] <= pose[2] <= lim['z_max'])
+
+    def _ik_service(self, arm):
+        """Get the (persistent) proxy for the inverse kinematics service of
+        one limb.
+
+        :param arm: The arm <'left', 'right'> to control.
+        :return: The service proxy.
+        """
+        if arm not in self._ik_services:
+            node = "ExternalTools/" + arm + "/PositionKinematicsNode/IKService"
+            rospy.wait_for_service(node, 5.0)
+            self._ik_services[arm] = rospy.ServiceProxy(node, SolvePositionIK,
+                                                        persistent=True)
+        return self._ik_services[arm]
+
     def ik(self, arm, pose=None):
         """Solve inverse kinematics for one limb at given pose.
+        Solutions (and the absence of solutions) are cached per arm and
+        quantized pose, see ik_cache.
 
         :param arm: The arm <'left', 'right'> to control.
         :param pose:  The pose to stamp. One of
@@ -240,22 +456,9 @@ class Baxter(object):
         if pose is None:
             return self._limbs[arm].joint_angles()
 
-        pq = self._stamp_pose(pose, target_frame="base")
-        node = "ExternalTools/" + arm + "/PositionKinematicsNode/IKService"
-        ik_service = rospy.ServiceProxy(node, SolvePositionIK)
-        ik_request = SolvePositionIKRequest()
-        ik_request.pose_stamp.append(pq)
-        try:
-            rospy.wait_for_service(node, 5.0)
-            ik_response = ik_service(ik_request)
-        except (rospy.ServiceException, rospy.ROSException), error_message:
-            self._logger.error("Service request failed: %r" % (error_message,))
-            raise
-
-        if ik_response.isValid[0]:
-            # convert response to joint position control dictionary
-            return dict(zip(ik_response.joints[0].name,
-                            ik_response.joints[0].position))
+        config = self.ik_batch(arm=arm, poses=[pose])[0][0]
+        if config is not None:
+            return config
         else:
             pose_str = np.array_str(np.array(pose), precision=3,
                                     suppress_small=True)
@@ -264,33 +467,189 @@ class Baxter(object):
             self._logger.debug(s)
             raise ValueError(s)
 
-    def ik_either_limb(self, pose):
+    def ik_batch(self, arm, poses):
+        """Solve inverse kinematics for one limb at a number of poses with a
+        single request to the IK backend (see ik_backend). Poses found in the
+        IK cache are not sent.
+
+        :param arm: The arm <'left', 'right'> to control.
+        :param poses: A list of N poses, each one of
+            - a ROS Pose,
+            - a list of length 6 [x, y, z, roll, pitch, yaw] or
+            - a list of length 7 [x, y, z, qx, qy, qz, qw].
+        :return: A tuple (configs, valid), where configs is a list of N
+            dictionaries of joint name keys to joint angles (None where no
+            solution was found) and valid is a (N,) boolean numpy array.
+        """
+        configs = list()
+        missing = list()
+        for i, pose in enumerate(poses):
+            found, config = self.ik_cache.lookup(arm, pose)
+            configs.append(config)
+            if not found:
+                missing.append(i)
+        if missing:
+            if self.ik_backend == 'service':
+                solutions = self._ik_request_service(
+                    arm, [poses[i] for i in missing])
+            elif self.ik_backend == 'numpy':
+                solutions = self._ik_request_numpy(
+                    arm, [poses[i] for i in missing])
+            else:
+                raise KeyError("No such IK backend: '{}'!".format(self.ik_backend))
+            for i, config in zip(missing, solutions):
+                configs[i] = config
+                self.ik_cache.store(arm, poses[i], config)
+        valid = np.array([c is not None for c in configs], dtype=bool)
+        return configs, valid
+
+    def _ik_request_service(self, arm, poses):
+        """Solve inverse kinematics for one limb at a number of poses with a
+        single request to the inverse kinematics service.
+
+        :param arm: The arm <'left', 'right'> to control.
+        :param poses: A list of N poses, see ik_batch.
+        :return: A list of N dictionaries of joint name keys to joint angles
+            (None where no solution was found).
+        """
+        ik_request = SolvePositionIKRequest()
+        for pose in poses:
+            ik_request.pose_stamp.append(
+                self._stamp_pose(pose, target_frame="base"))
+        try:
+            ik_response = self._ik_service(arm)(ik_request)
+        except (rospy.ServiceException, rospy.ROSException), error_message:
+            self._logger.error("Service request failed: %r" % (error_message,))
+            # reconnect on the next request
+            service = self._ik_services.pop(arm, None)
+            if service is not None:
+                service.close()
+            raise
+        # convert response to joint position control dictionaries
+        return [dict(zip(joints.name, joints.position)) if valid else None
+                for valid, joints in zip(ik_response.isValid,
+                                         ik_response.joints)]
+
+    def _ik_request_numpy(self, arm, poses):
+        """Solve inverse kinematics for one limb at a number of poses with
+        the in-process solver, seeded with the current configuration.
+
+        :param arm: The arm <'left', 'right'> to control.
+        :param poses: A list of N poses, see ik_batch.
+        :return: A list of N dictionaries of joint name keys to joint angles
+            (None where no solution was found).
+        :raise RuntimeError: if no robot model was loaded (no root_dir given).
+        """
+        if arm not in self._ik_solvers:
+            raise RuntimeError("The numpy IK backend needs the robot model, "
+                             "pass root_dir to Baxter!")
+        configs, _ = self._ik_solvers[arm].solve(
+            poses, seed=self._limbs[arm].joint_angles())
+        return configs
+
+    @staticmethod
+    def _joint_velocity_limits():
+        """Maximum joint velocities (in rad/s) of the Baxter limbs, as given
+        in the Baxter URDF.
+        Note: The limits are the same for the left and right limbs.
+
+        :return: A dictionary of joint name suffix keys to velocities.
+        """
+        return {'s0': 1.5, 's1': 1.5, 'e0': 1.5, 'e1': 1.5,
+                'w0': 4.0, 'w1': 4.0, 'w2': 4.0}
+
+    @staticmethod
+    def _joint_acceleration_limits():
+        """Maximum joint accelerations (in rad/s^2) of the Baxter limbs used
+        for planning trajectories. They are not given in the Baxter URDF and
+        chosen conservatively.
+        Note: The limits are the same for the left and right limbs.
+
+        :return: A dictionary of joint name suffix keys to accelerations.
+        """
+        return {'s0': 1.5, 's1': 1.5, 'e0': 1.5, 'e1': 1.5,
+                'w0': 3.0, 'w1': 3.0, 'w2': 3.0}
+
+    @staticmethod
+    def _link_radii():
+        """Radii (in m) of the capsules approximating the links of the
+        Baxter limbs between consecutive joints (s0--s1, ..., w2--gripper),
+        used for collision checking. They enclose the link geometry of the
+        Baxter URDF with some margin.
+        Note: The radii are the same for the left and right limbs.
+
+        :return: A list of radii.
+        """
+        return [0.1, 0.08, 0.08, 0.07, 0.07, 0.06, 0.04]
+
+    def ik_cost(self, arm, config, cost='distance'):
+        """Compute the cost of moving a limb from its current configuration
+        to the given configuration.
+
+        :param arm: The arm <'left', 'right'> to control.
+        :param config: Dictionary of joint name keys to target joint angles.
+        :param cost: The cost to compute. One of
+            - 'distance', the Euclidean distance in joint space, or
+            - 'time', the estimated motion time in s when all joints move at
+                their maximum velocity.
+        :return: The cost (a float).
+        """
+        current = self._limbs[arm].joint_angles()
+        joints = sorted(config.keys())
+        delta = np.abs([config[j] - current[j] for j in joints])
+        if cost == 'distance':
+            return float(np.linalg.norm(delta))
+        elif cost == 'time':
+            limits = self._joint_velocity_limits()
+            v_max = np.array([limits[j.split('_')[-1]] for j in joints])
+            return float(np.max(delta/v_max))
+        raise KeyError("No such cost: '{}'!".format(cost))
+
+    def ik_either_limb(self, pose, cost=None):
         """Attempt to solve the inverse kinematics for a given pose with
-        either arm. If no solution is found, raise an exception
+        either arm. Both arms are queried concurrently, and if both find a
+        solution the arm with the lower cost is selected. If according to
+        the reachability map only one arm reaches the pose, that arm is
+        tried first on its own. If no solution is found, raise an exception.
 
         :param pose: The pose to stamp. One of
-            - None, in which case the current set of joint angles is returned,
             - a ROS Pose,
             - a list of length 6 [x, y, z, roll, pitch, yaw] or
             - a list of length 7 [x, y, z, qx, qy, qz, qw].
+        :param cost: The cost to select the arm by, see ik_cost. If None,
+            self.ik_cost_type is used.
         :return: tuple of string and dict:
             - the arm <'left', 'right'> the solution was found for
             - a dictionary of joint name keys to joint angles.
         :raise ValueError: if no valid configuration was found for either arm.
         """
-        arm = 'left'
-        try:
-            cfg = self.ik(arm, pose)
-        except ValueError:
-            # no valid configuration found for left arm
-            arm = 'right'
-            try:
-                cfg = self.ik(arm, pose)
-            except ValueError:
-                # no valid configuration found for right arm
-                s = "No valid configuration found for pose {} with either arm!".format(pose)
-                self._logger.warning(s)
-                raise ValueError(s)
+        cost = cost or self.ik_cost_type
+        start = time.time()
+        arms = self._arms
+        if self.reachability is not None:
+            reaching = self.reachability.arms_reaching(pose_to_hom(pose)[:-1, -1])
+            if len(reaching) == 1:
+                # only one arm is known to reach the pose, try it first
+                config = self.ik_batch(arm=reaching[0], poses=[pose])[0][0]
+                if config is not None:
+                    self._logger.debug("IK for {} arm took {:.3f} s.".format(
+                        reaching[0], time.time() - start))
+                    return reaching[0], config
+                arms = [a for a in self._arms if a not in reaching]
+        results = self._ik_pool.map(
+            lambda a: self.ik_batch(arm=a, poses=[pose])[0][0], arms)
+        solved = time.time()
+        candidates = [(self.ik_cost(arm=a, config=c, cost=cost), a, c)
+                      for a, c in zip(arms, results) if c is not None]
+        self._logger.debug("IK for both arms took {:.3f} s ({}).".format(
+            solved - start,
+            ', '.join('{}: {} {:.3f}'.format(a, cost, k)
+                      for k, a, _ in candidates) or 'no solution'))
+        if not candidates:
+            s = "No valid configuration found for pose {} with either arm!".format(pose)
+            self._logger.warning(s)
+            raise ValueError(s)
+        _, arm, cfg = min(candidates, key=lambda x: x[0])
         return arm, cfg
 
     def control(self, trajectory):
@@ -299,34 +658,339 @@ class Baxter(object):
         :param trajectory: A generator MotionPlanner instance.
         :return:
         """
+        self.control_async(trajectory=trajectory).wait()
+
+    def control_async(self, trajectory):
+        """Control one limb using position, velocity or torque control
+        without blocking. The trajectory is executed in a background thread
+        after all motions previously started for the same limb have
+        finished.
+
+        With the 'limb' control backend (see control_backend) position
+        control trajectories are executed waypoint by waypoint and velocity
+        control trajectories are streamed to the limb. With the 'action'
+        control backend the whole trajectory is sent to the joint trajectory
+        action server in one goal.
+
+        :param trajectory: A generator MotionPlanner instance. Velocity
+            control needs a time-parameterized trajectory (see
+            TrajectoryPlanner).
+        :return: A MotionHandle to poll, wait for or cancel the motion.
+        """
         if not isinstance(trajectory, MotionPlanner):
             raise TypeError("'trajectory' must be a MotionPlanner instance!")
-        if trajectory.controller_type == 'position':
-            for q in trajectory:
-                arm = q.keys()[0].split('_')[0]
-                self._limbs[arm].move_to_joint_positions(q)
-        elif trajectory.controller_type == 'velocity':
-            raise NotImplementedError("Need to implement velocity control!")
-            # for v in trajectory:
-            #     self._limbs[arm].set_joint_velocities(v)
-        elif trajectory.controller_type == 'torque':
+        if trajectory.controller_type == 'torque':
             raise NotImplementedError("Need to implement torque control!")
             # for t in trajectory:
             #     self._limbs[arm].set_joint_torques(t)
-        else:
+        elif trajectory.controller_type not in ['position', 'velocity']:
             raise KeyError("No such control mode: '{}'!".format(trajectory.controller_type))
+        planned = None
+        if self.control_backend == 'action':
+            timed = self._timed_trajectory(trajectory)
+            target = None
+            if timed is not None:
+                names, times, positions, velocities = timed
+                target = dict(zip(names, positions[-1].tolist()))
+                planned = float(times[-1])
+
+            def execute(limb, handle):
+                self._execute_action(names, times, positions, velocities,
+                                     handle)
+        elif self.control_backend != 'limb':
+            raise KeyError("No such control backend: '{}'!".format(self.control_backend))
+        elif trajectory.controller_type == 'position':
+            steps = list(trajectory)
+            target = steps[-1] if steps else None
+
+            def execute(limb, handle):
+                self._execute_positions(limb, steps, handle)
+        else:
+            if getattr(trajectory, 'positions', None) is None:
+                raise TypeError("Velocity control needs a time-parameterized "
+                                "trajectory, see TrajectoryPlanner!")
+            names = trajectory.joint_names
+            positions = trajectory.positions
+            velocities = trajectory.velocities
+            rate = trajectory.rate
+            target = dict(zip(names, positions[-1].tolist()))
+            planned = float(trajectory.times[-1])
+
+            def execute(limb, handle):
+                self._execute_velocities(limb, names, positions, velocities,
+                                         rate, handle)
+        if not target:
+            handle = MotionHandle(arm=None)
+            handle._finish()
+            return handle
+        arm = target.keys()[0].split('_')[0]
+        handle = MotionHandle(arm=arm, target=target)
+        handle.planned_duration = planned
+        previous = self._motions.get(arm)
+        self._motions[arm] = handle
+        thread = threading.Thread(target=self._execute,
+                                  args=(execute, handle, previous))
+        thread.daemon = True
+        thread.start()
+        return handle
+
+    def _execute(self, execute, handle, previous=None):
+        """Execute a motion of one limb, see control_async.
+
+        :param execute: The function executing the motion, taking the limb
+            and the MotionHandle as arguments.
+        :param handle: The MotionHandle of the motion.
+        :param previous: The MotionHandle of the motion previously started
+            for the same limb, if any.
+        :return:
+        """
+        error = None
+        limb = self._limbs[handle.arm]
+        try:
+            if previous is not None:
+                while not previous.done() and not handle.cancelled():
+                    time.sleep(0.01)
+            if not handle.cancelled():
+                execute(limb, handle)
+            if handle.cancelled():
+                # hold the limb where it is
+                limb.set_joint_positions(limb.joint_angles())
+        except Exception as e:
+            self._logger.error("Motion of {} limb failed: {}".format(handle.arm, e))
+            error = e
+        self._logger.debug("Motion of {} limb {} after {:.3f} s{}.".format(
+            handle.arm, 'cancelled' if handle.cancelled() else 'finished',
+            handle.duration(),
+            '' if handle.planned_duration is None else
+            ' (planned {:.3f} s)'.format(handle.planned_duration)))
+        handle._finish(error=error)
+
+    @staticmethod
+    def _execute_positions(limb, steps, handle):
+        """Move one limb through a list of configurations using position
+        control.
+
+        :param limb: The baxter_interface.Limb to control.
+        :param steps: The list of dictionaries of joint name keys to joint
+            angles to move through.
+        :param handle: The MotionHandle of the motion.
+        :return:
+        """
+        for q in steps:
+            if handle.cancelled():
+                break
+            limb.move_to_joint_positions(q, test=handle.cancelled)
+
+    def _execute_velocities(self, limb, names, positions, velocities, rate,
+                            handle):
+        """Stream a time-parameterized trajectory to one limb using velocity
+        control at a fixed rate, correcting deviations from the planned
+        joint angles, and settle at the target using position control.
+
+        :param limb: The baxter_interface.Limb to control.
+        :param names: The list of n joint names.
+        :param positions: A (K, n) numpy array of planned joint angles.
+        :param velocities: A (K, n) numpy array of planned joint velocities.
+        :param rate: The rate in Hz the trajectory was sampled at.
+        :param handle: The MotionHandle of the motion.
+        :return:
+        """
+        # proportional gain (in 1/s) on the deviation from the plan
+        gain = 2.0
+        limits = self._joint_velocity_limits()
+        v_max = np.array([limits[n.split('_')[-1]] for n in names])
+        r = rospy.Rate(rate)
+        for q_ref, v_ref in zip(positions, velocities):
+            if handle.cancelled() or rospy.is_shutdown():
+                break
+            current = limb.joint_angles()
+            q = np.array([current[n] for n in names])
+            v = np.clip(v_ref + gain*(q_ref - q), -v_max, v_max)
+            limb.set_joint_velocities(dict(zip(names, v.tolist())))
+            r.sleep()
+        limb.set_joint_velocities(dict(zip(names, [0.0]*len(names))))
+        if not handle.cancelled():
+            limb.move_to_joint_positions(handle.target, timeout=2.0,
+                                         test=handle.cancelled)
+
+    def _start_config(self, arm):
+        """Get the configuration a new motion of a limb starts from, i.e.,
+        the target of its running motion or its current configuration.
+
+        :param arm: The arm <'left', 'right'> to control.
+        :return: Dictionary of joint name keys to joint angles.
+        """
+        previous = self._motions.get(arm)
+        if previous is not None and not previous.done() and previous.target:
+            return previous.target
+        return self._limbs[arm].joint_angles()
+
+    def _timed_trajectory(self, trajectory):
+        """Get the waypoints of a trajectory with the time to reach each of
+        them. Trajectories without timing (e.g., from SimplePlanner) are
+        timed such that no joint exceeds the fraction
+        settings.baxter_speed_fraction of its velocity limit.
+
+        :param trajectory: A MotionPlanner instance.
+        :return: A tuple (names, times, positions, velocities) of the list
+            of n joint names, a (K,) numpy array of times from start in s,
+            and (K, n) numpy arrays of joint angles and joint velocities
+            (None if not known), or None if the trajectory is empty.
+        """
+        if getattr(trajectory, 'times', None) is not None:
+            return (trajectory.joint_names, trajectory.times,
+                    trajectory.positions, trajectory.velocities)
+        steps = list(trajectory)
+        if not steps:
+            return None
+        names = sorted(steps[-1].keys())
+        start = self._start_config(names[0].split('_')[0])
+        positions = np.array([[step[n] for n in names] for step in steps])
+        limits = self._joint_velocity_limits()
+        v_max = settings.baxter_speed_fraction*np.array(
+            [limits[n.split('_')[-1]] for n in names])
+        deltas = np.abs(np.diff(np.vstack([[start[n] for n in names],
+                                           positions]), axis=0))
+        # allow at least 0.1 s per waypoint
+        times = np.cumsum(np.maximum(np.max(deltas/v_max, axis=1), 0.1))
+        return names, times, positions, None
+
+    def _trajectory_client(self, arm):
+        """Get the (persistent) client of the joint trajectory action server
+        of one limb.
+
+        :param arm: The arm <'left', 'right'> to control.
+        :return: The actionlib.SimpleActionClient.
+        :raise RuntimeError: if the action server is not running.
+        """
+        if arm not in self._trajectory_clients:
+            ns = 'robot/limb/%s/follow_joint_trajectory' % arm
+            client = actionlib.SimpleActionClient(ns, FollowJointTrajectoryAction)
+            if not client.wait_for_server(rospy.Duration(5.0)):
+                raise RuntimeError("Joint trajectory action server '{}' is not "
+                                   "available! Start it with 'rosrun "
+                                   "baxter_interface joint_trajectory_action_"
+                                   "server.py'.".format(ns))
+            self._trajectory_clients[arm] = client
+        return self._trajectory_clients[arm]
+
+    def _execute_action(self, names, times, positions, velocities, handle):
+        """Send a trajectory to the joint trajectory action server of one
+        limb in one goal and monitor its execution.
+
+        :param names: The list of n joint names.
+        :param times: A (K,) numpy array of times from start in s.
+        :param positions: A (K, n) numpy array of joint angles.
+        :param velocities: A (K, n) numpy array of joint velocities or None.
+        :param handle: The MotionHandle of the motion.
+        :return:
+        :raise RuntimeError: if the action server did not succeed.
+        """
+        client = self._trajectory_client(handle.arm)
+        goal = FollowJointTrajectoryGoal()
+        goal.goal_time_tolerance = rospy.Duration(0.5)
+        goal.trajectory.joint_names = names
+        for k, t in enumerate(times):
+            point = JointTrajectoryPoint()
+            point.positions = positions[k].tolist()
+            if velocities is not None:
+                point.velocities = velocities[k].tolist()
+            point.time_from_start = rospy.Duration(float(t))
+            goal.trajectory.points.append(point)
+        errors = [0.0]
+
+        def feedback_cb(feedback):
+            if feedback.error.positions:
+                errors.append(max(abs(e) for e in feedback.error.positions))
+
+        start = time.time()
+        goal.trajectory.header.stamp = rospy.Time.now()
+        client.send_goal(goal, feedback_cb=feedback_cb)
+        while not client.wait_for_result(rospy.Duration(0.05)):
+            if handle.cancelled() or rospy.is_shutdown():
+                client.cancel_goal()
+                client.wait_for_result(rospy.Duration(1.0))
+                return
+        elapsed = time.time() - start
+        self._logger.info("Trajectory of {} limb: commanded {:.3f} s, actual "
+                          "{:.3f} s, max tracking error {:.3f} rad.".format(
+                              handle.arm, times[-1], elapsed, max(errors)))
+        result = client.get_result()
+        if result is None or result.error_code != FollowJointTrajectoryResult.SUCCESSFUL:
+            raise RuntimeError("Joint trajectory action of {} limb failed with "
+                               "error code {}!".format(
+                                   handle.arm, None if result is None else result.error_code))
+
+    def motion(self, arm):
+        """Get the latest motion started for a limb.
+
+        :param arm: The arm <'left', 'right'> to control.
+        :return: The MotionHandle of the motion, or None.
+        """
+        return self._motions.get(arm)
 
     def plan(self, target):
         """Plan a trajectory from the current to the target configuration.
+        If a motion of the limb is still running, plan from its target.
+        If collision_checking is enabled and the straight line in joint
+        space hits the table or the other limb, a collision-free path of
+        way points for position control is planned instead.
 
         :param target: Dictionary of joint name keys to target joint angles.
         :return: A MotionPlanner trajectory generator.
         """
         arm = target.keys()[0].split('_')[0]
-        start = self._limbs[arm].joint_angles()
+        start = self._start_config(arm)
+        if self.collision_checking and arm in self._collision_planners:
+            planner = self._plan_collision_free(arm, start, target)
+            if planner is not None:
+                return planner
         self._planner.plan(start=start, end=target)
         return self._planner
 
+    def _plan_collision_free(self, arm, start, target):
+        """Plan a path around the table and the other limb with RRT-Connect.
+        If the other limb is moving, it is modelled by both its current
+        configuration and the target of its motion. The configurations it
+        passes in between are not checked, so this is only approximate while
+        both limbs move (e.g., in move_both).
+
+        :param arm: The arm <'left', 'right'> to control.
+        :param start: Dictionary of joint name keys to start joint angles.
+        :param target: Dictionary of joint name keys to target joint angles.
+        :return: The RRTConnectPlanner holding the path, or None if the
+            straight line to the target is collision-free or the collision
+            check does not apply (start or target in collision).
+        :raise ValueError: If no collision-free path was found.
+        """
+        planner = self._collision_planners[arm]
+        other = [a for a in self._arms if a != arm][0]
+        checker = planner.checker
+        checker.z_table = self.z_table
+        others = [self._limbs[other].joint_angles()]
+        motion = self._motions.get(other)
+        if motion is not None and not motion.done() and motion.target:
+            others.append(motion.target)
+        checker.set_obstacle_chain(self._collision_planners[other].checker,
+                                   others)
+        end = dict(start)
+        end.update(target)
+        try:
+            planner.plan(start=start, end=end)
+        except ValueError as e:
+            self._logger.warning("{} Moving {} limb without collision "
+                                 "checking.".format(e, arm))
+            return None
+        except RuntimeError as e:
+            # callers treat ValueError as an unreachable target
+            raise ValueError(str(e))
+        if len(planner.path) <= 2:
+            return None
+        self._logger.debug("Planned path with {} way points around obstacles "
+                           "in {} iterations.".format(len(planner.path) - 1,
+                                                      planner.iterations))
+        return planner
+
     def move_to_config(self, config):
         """Shortcut for planning a trajectory to the target configuration
         and executing the trajectory.
@@ -334,8 +998,58 @@ class Baxter(object):
         :param config: Dictionary of joint name keys to target joint angles.
         :return:
         """
-        trajectory = self.plan(target=config)
-        self.control(trajectory=trajectory)
+        self.move_to_config_async(config=config).wait()
+
+    def move_to_config_async(self, config):
+        """Shortcut for planning a trajectory to the target configuration
+        and executing the trajectory without blocking, see control_async.
+
+        :param config: Dictionary of joint name keys to target joint angles.
+        :return: A MotionHandle to poll, wait for or cancel the motion.
+        """
+        with self._plan_lock:
+            trajectory = self.plan(target=config)
+            return self.control_async(trajectory=trajectory)
+
+    def move_both(self, configs):
+        """Move both limbs (or a subset of them) to their target
+        configurations at the same time and wait for both motions to finish.
+
+        :param configs: Dictionary of arm <'left', 'right'> keys to
+            dictionaries of joint name keys to target joint angles.
+        :return:
+        :raise: The first exception raised by any of the motions, after all
+            motions finished.
+        """
+        start = time.time()
+        handles = self.move_both_async(configs=configs)
+        error = None
+        for arm, handle in handles.items():
+            try:
+                handle.wait()
+            except Exception as e:
+                self._logger.error("Failed to move {} limb: {}".format(arm, e))
+                error = error or e
+        if error is not None:
+            raise error
+        self._logger.info("Moved {} limbs concurrently in {:.2f} s ({:.2f} s "
+                          "sequentially).".format(
+                              ' and '.join(sorted(handles)), time.time() - start,
+                              sum(h.duration() for h in handles.values())))
+
+    def move_both_async(self, configs):
+        """Start moving both limbs (or a subset of them) to their target
+        configurations without blocking, see move_to_config_async.
+
+        :param configs: Dictionary of arm <'left', 'right'> keys to
+            dictionaries of joint name keys to target joint angles.
+        :return: Dictionary of arm keys to MotionHandles.
+        """
+        for arm in configs:
+            if arm not in self._arms:
+                raise KeyError("No '{}' limb!".format(arm))
+        return {arm: self.move_to_config_async(config=config)
+                for arm, config in configs.items()}
 
     def move_to_pose(self, arm, pose):
         """Shortcut for planning a trajectory to the target pose
@@ -351,27 +1065,48 @@ class Baxter(object):
             - a list of length 7 [x, y, z, qx, qy, qz, qw].
         :return:
         """
-        try:
-            config = self.ik(arm=arm, pose=pose)
-        except ValueError as e:
-            raise e
-        self.move_to_config(config=config)
+        self.move_to_pose_async(arm=arm, pose=pose).wait()
+
+    def move_to_pose_async(self, arm, pose):
+        """Shortcut for planning a trajectory to the target pose and
+        executing the trajectory without blocking, see move_to_pose and
+        control_async. The inverse kinematics are solved before returning.
+
+        :param arm: The arm <'left', 'right'> to control.
+        :param pose: The pose to stamp, see move_to_pose.
+        :return: A MotionHandle to poll, wait for or cancel the motion.
+        :raise ValueError: if no valid configuration was found.
+        """
+        config = self.ik(arm=arm, pose=pose)
+        return self.move_to_config_async(config=config)
 
     def move_to_neutral(self, arm=None):
-        """Move the lift, right or both limbs to their neutral configuration.
+        """Move the left, right or both limbs to their neutral configuration.
+        Both limbs are moved at the same time.
 
         :param arm: The arm <'left', 'right'> to control. If None, move both
             arms.
         :return:
         """
         if arm is None:
-            for arm in self._arms:
-                self._limbs[arm].move_to_neutral()
+            self.move_both({a: self._neutral_config(a) for a in self._arms})
         elif arm in self._arms:
-            self._limbs[arm].move_to_neutral()
+            self.move_to_config(config=self._neutral_config(arm))
         else:
             raise KeyError("No '{}' limb!".format(arm))
 
+    @staticmethod
+    def _neutral_config(arm):
+        """The neutral configuration of a limb, as used by
+        baxter_interface.Limb.move_to_neutral.
+
+        :param arm: The arm <'left', 'right'>.
+        :return: Dictionary of joint name keys to joint angles.
+        """
+        angles = {'s0': 0.0, 's1': -0.55, 'e0': 0.0, 'e1': 0.75,
+                  'w0': 0.0, 'w1': 1.26, 'w2': 0.0}
+        return {'{}_{}'.format(arm, j): a for j, a in angles.items()}
+
     @staticmethod
     def _gripper_ranges_meters():
         """Grasp ranges for wide and narrow finger slots."""
@@ -468,47 +1203,143 @@ class Baxter(object):
 
     def measure_distance(self, arm):
         """Measure the distance from the specified limb to the closest object
-        using the limb's infrared sensor.
+        using the limb's infrared sensor. For averaging over a number of
+        measurements see range_sensors[arm].robust_mean.
 
         :param arm: The arm <'left', 'right'> to control.
-        :return: The measured distance in meters or None.
+        :return: The most recent measured distance in meters or None (if it
+            is out of range or older than 0.5 s).
         """
-        distance = self._sensors[arm].state()
-        if distance < 65000:
-            return distance/1000.0
-        return None
+        distance, _ = self.range_sensors[arm].latest(max_age=0.5)
+        return distance
+
+    def fk(self, arm, configs, frame='gripper'):
+        """Compute the pose of a frame of one limb for a number of
+        configurations at once, without moving the limb.
 
-    def hom_gripper_to_robot(self, arm):
+        :param arm: The arm <'left', 'right'> to control.
+        :param configs: Dictionary of joint name keys to joint angles, or a
+            list of N such dictionaries.
+        :param frame: The frame <'gripper', 'hand_camera', 'hand_range'> to
+            compute the pose of.
+        :return: The homogeneous transformation matrix of the frame in robot
+            coordinates (a 4x4 numpy array), or a (N, 4, 4) numpy array if a
+            list of configurations was given.
+        :raise ValueError: if no robot model was loaded (no root_dir given).
+        """
+        if arm not in self.kinematics:
+            raise ValueError("Forward kinematics needs the robot model, "
+                             "pass root_dir to Baxter!")
+        chain = self.kinematics[arm]
+        return chain.fk(chain.config_to_array(configs),
+                        frame='{}_{}'.format(arm, frame))
+
+    def configs_in_task_space(self, arm, configs):
+        """Check for a number of configurations of one limb whether they put
+        the gripper within the robot's task space and the gripper and hand
+        camera above the table (if its height is known).
+
+        :param arm: The arm <'left', 'right'> to control.
+        :param configs: A list of N dictionaries of joint name keys to joint
+            angles.
+        :return: A (N,) boolean numpy array.
+        """
+        chain = self.kinematics[arm]
+        poses = chain.fk_frames(chain.config_to_array(configs),
+                                frames=['%s_gripper' % arm,
+                                        '%s_hand_camera' % arm])
+        grip = poses['%s_gripper' % arm][:, :3, 3]
+        lim = settings.task_space_limits_m
+        valid = np.all([lim['x_min'] <= grip[:, 0], grip[:, 0] <= lim['x_max'],
+                        lim['y_min'] <= grip[:, 1], grip[:, 1] <= lim['y_max'],
+                        lim['z_min'] <= grip[:, 2], grip[:, 2] <= lim['z_max']],
+                       axis=0)
+        if self.z_table is not None:
+            cam = poses['%s_hand_camera' % arm][:, :3, 3]
+            valid &= (grip[:, 2] > self.z_table) & (cam[:, 2] > self.z_table)
+        return valid
+
+    def hom_gripper_to_robot(self, arm, config=None):
         """Get the homogeneous transformation matrix {}^R\mat{T}_{G} relating
         gripper coordinates to robot coordinates.
 
         :param arm: The arm <'left', 'right'> to control.
+        :param config: Optional dictionary of joint name keys to joint angles.
+            If given, the transformation in this configuration is returned
+            (see fk), else the one in the current configuration.
         :return: The homogeneous transformation matrix (a 4x4 numpy array).
         """
-        ee_pose = self._limbs[arm].endpoint_pose()
-        return pose_dict_to_hom(pose=ee_pose)
+        if config is not None:
+            return self.fk(arm=arm, configs=config, frame='gripper')
+        return self.snapshot(arm=arm).hom_gripper.copy()
 
-    def hom_camera_to_robot(self, arm):
+    def hom_camera_to_robot(self, arm, config=None):
         """Get the homogeneous transformation matrix {}^R\mat{T}_{C} relating
         camera coordinates to robot coordinates.
 
+        :param arm: The arm <'left', 'right'> to control.
+        :param config: Optional dictionary of joint name keys to joint angles.
+            If given, the transformation in this configuration is returned
+            (see fk), else the one in the current configuration.
+        :return: The homogeneous transformation matrix (a 4x4 numpy array).
+        """
+        if config is not None:
+            return self.fk(arm=arm, configs=config, frame='hand_camera')
+        return self.snapshot(arm=arm).hom_camera.copy()
+
+    def _camera_in_gripper(self, arm):
+        """Get the fixed homogeneous transformation matrix relating camera
+        coordinates to gripper coordinates.
+
         :param arm: The arm <'left', 'right'> to control.
         :return: The homogeneous transformation matrix (a 4x4 numpy array).
         """
-        hom_grip_in_rob = self.hom_gripper_to_robot(arm=arm)
-        hom_cam_in_grip = np.eye(4)
-        hom_cam_in_grip[:-1, :-1] = np.array([[0, 1, 0], [-1, 0, 0], [0, 0, 1]])
-        hom_cam_in_grip[:-1, -1] = self.cam_offset
-        hom_cam_in_rob = np.dot(hom_grip_in_rob, hom_cam_in_grip)
-        return hom_cam_in_rob
+        if arm not in self._hom_cam_in_grip:
+            if arm in self.kinematics:
+                hom_cam_in_grip = self.kinematics[arm].offset('%s_hand_camera' % arm)
+            else:
+                hom_cam_in_grip = np.eye(4)
+                hom_cam_in_grip[:-1, :-1] = np.array([[0, 1, 0], [-1, 0, 0], [0, 0, 1]])
+                hom_cam_in_grip[:-1, -1] = self.cam_offset
+            self._hom_cam_in_grip[arm] = hom_cam_in_grip
+        return self._hom_cam_in_grip[arm]
+
+    def snapshot(self, arm):
+        """Get the kinematic state of a limb (joint angles, end effector
+        pose, gripper and camera transformations). The state is read from
+        the limb once and reused for at most snapshot_max_age s, unless a
+        motion of the limb is started (or running) in the meantime.
+
+        :param arm: The arm <'left', 'right'> to control.
+        :return: A KinematicSnapshot. Its fields must not be modified.
+        """
+        motion = self._motions.get(arm)
+        state = self._snapshots.get(arm)
+        if state is None or not state.valid(motion=motion,
+                                            max_age=self.snapshot_max_age):
+            limb = self._limbs[arm]
+            ee_pose = limb.endpoint_pose()
+            state = KinematicSnapshot(
+                arm=arm, config=limb.joint_angles(),
+                endpoint_pose=pose_dict_to_list(ee_pose),
+                hom_gripper=pose_dict_to_hom(pose=ee_pose),
+                hom_cam_in_grip=self._camera_in_gripper(arm=arm),
+                hom_to_pose=hom_to_list,
+                motion=motion)
+            self._snapshots[arm] = state
+        return state
 
-    def camera_pose(self, arm):
+    def camera_pose(self, arm, config=None):
         """Return the current Cartesian pose of the camera of the given limb.
 
         :param arm: The arm <'left', 'right'> to control.
+        :param config: Optional dictionary of joint name keys to joint angles.
+            If given, the pose the camera would have in this configuration is
+            returned (see fk).
         :return: The pose as a list [x, y, z, roll, pitch, yaw].
         """
-        cam_pose = hom_to_list(matrix=self.hom_camera_to_robot(arm=arm))
+        cam_pose = hom_to_list(matrix=self.hom_camera_to_robot(arm=arm,
+                                                               config=config))
         return cam_pose
 
     def estimate_object_position(self, arm, center):
@@ -521,11 +1352,12 @@ class Baxter(object):
         :param center: The pixel coordinates to project to robot coordinates.
         :return: The estimated object position as a list of length 3 [x, y, z].
         """
-        distance = self.camera_pose(arm=arm)[2] - self.z_table
+        state = self.snapshot(arm=arm)
+        distance = state.camera_pose[2] - self.z_table
         cam_coord = self.cameras[arm].projection_pixel_to_camera(pixel=center,
                                                                  z=distance)
         hom_coord = np.asarray(cam_coord + [1])
-        rob_coord = np.dot(self.hom_camera_to_robot(arm=arm), hom_coord)
+        rob_coord = np.dot(state.hom_camera, hom_coord)
         rob_coord /= rob_coord[-1]
         delta = abs(abs(rob_coord[2]) - abs(self.z_table))
         if delta > 1e-3:
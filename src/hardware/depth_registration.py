@@ -34,12 +34,304 @@
 # visual servoing will take care of the rest.
 # It would be much nicer to use the iai_kinect2 or WindowsSDK libraries,
 # though.
+# If the intrinsics and extrinsics of the Kinect sensors are available (see
+# 'scripts/calibrate_kinect.py'), the CalibratedDepthRegistrar below performs
+# a proper registration instead.
 
 import numpy as np
 
 import cv2
 
 
+def _magic_factors(size_color):
+    """Return the magic factors for matching the depth image to the color
+    image of the given size.
+
+    :param size_color: The size (height, width) of the color image.
+    :return: A tuple (scale_factor, x_shift, y_shift).
+    """
+    if size_color == (540, 960):
+        # magic factors for matching the depth image to the 960x540 color image
+        return 1.45, 120, -38
+    elif size_color == (1080, 1920):
+        # magic factors for matching the depth image to the 1920x1080 color image
+        # TODO: modify magic factors for full HD resolution
+        return 1.45*2, 120*2, -38*2
+    raise ValueError("Not defined for size {}!".format(size_color))
+
+
+class DepthRegistrar(object):
+    def __init__(self, interpolation=cv2.INTER_NEAREST):
+        """Register depth images to color images by scaling and shifting the
+        depth image by constant factors (see the disclaimer above).
+        The lookup maps for cv2.remap are computed once per (depth size,
+        color size) pair and cached, such that registering a frame is a
+        single remap call.
+
+        :param interpolation: The interpolation used when registering whole
+            depth images. Nearest neighbor interpolation does not blend depths
+            across object boundaries and is the fastest.
+        """
+        self._interpolation = interpolation
+        self._maps = dict()
+
+    def _pixels_color_to_depth(self, size_color, px, py):
+        """Map (sub-)pixel coordinates in the color image to the
+        corresponding (sub-)pixel coordinates in the depth image.
+
+        :param size_color: The size (height, width) of the color image.
+        :param px: The x coordinates in the color image.
+        :param py: The y coordinates in the color image.
+        :return: A tuple (x coordinates, y coordinates) in the depth image.
+        """
+        scale_factor, x_shift, y_shift = _magic_factors(size_color)
+        return (px - x_shift)/scale_factor, (py - y_shift)/scale_factor
+
+    def maps(self, size_depth, size_color):
+        """Return the (cached) cv2.remap lookup maps for registering a depth
+        image of the given size to a color image of the given size.
+
+        :param size_depth: The size (height, width) of the depth image.
+        :param size_color: The size (height, width) of the color image.
+        :return: The two maps to pass to cv2.remap.
+        """
+        key = (tuple(size_depth[:2]), tuple(size_color[:2]))
+        if key not in self._maps:
+            h, w = key[1]
+            # sample each color pixel at its center
+            px = np.arange(w, dtype=np.float32) + 0.5
+            py = np.arange(h, dtype=np.float32) + 0.5
+            map_x, map_y = self._pixels_color_to_depth(key[1], px, py)
+            map_x, map_y = np.meshgrid(map_x - 0.5, map_y - 0.5)
+            self._maps[key] = cv2.convertMaps(map_x.astype(np.float32),
+                                              map_y.astype(np.float32),
+                                              cv2.CV_16SC2)
+        return self._maps[key]
+
+    def register(self, img_depth, size_color):
+        """Compute a depth image that matches the color image.
+
+        :param img_depth: A depth image.
+        :param size_color: The size (height, width) of the color image.
+        :return: A depth image matching the color image.
+        """
+        map1, map2 = self.maps(img_depth.shape[:2], size_color)
+        return cv2.remap(img_depth, map1, map2,
+                         interpolation=self._interpolation,
+                         borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+
+    def get_depths(self, img_depth, size_color, pixels_color, window=1):
+        """Compute the depths at the given pixels in the color image from a
+        corresponding depth image.
+
+        :param img_depth: A depth image.
+        :param size_color: The size (height, width) of the color image.
+        :param pixels_color: The requested pixels in the color image, an
+            iterable of N pixels (px, py) or a (N, 2) numpy array.
+        :param window: The size of the (square) window around each pixel
+            in the depth image over which the median of the valid (non-zero)
+            depths is computed. A value of 1 reads single pixels.
+        :return: The depths in meters at the requested pixels as a (N,)
+            numpy array. Invalid depths and pixels outside of the depth image
+            have depth 0.0.
+        """
+        pixels_color = np.asarray(pixels_color, dtype=np.float64).reshape(-1, 2)
+        px, py = self._pixels_color_to_depth(size_color,
+                                             pixels_color[:, 0],
+                                             pixels_color[:, 1])
+        return _sample_depths(img_depth, px, py, window)
+
+
+class CalibratedDepthRegistrar(object):
+    def __init__(self, cam_mat_depth, dist_coeff_depth, cam_mat_color,
+                 size_color, rotation, translation):
+        """Register depth images to color images using the intrinsics of
+        both sensors and the extrinsics between them, as computed by the
+        iai_kinect2 calibration and stored by 'calibrate_kinect.py'.
+        Every depth pixel is back-projected along its (cached) viewing ray,
+        transformed into the color sensor frame by
+            p_color = rotation * p_depth + translation
+        and projected onto the color image. Where several depth pixels
+        project onto the same color pixel, the closest one wins (z-buffer).
+
+        :param cam_mat_depth: The 3x3 camera matrix of the depth sensor.
+        :param dist_coeff_depth: The distortion coefficients of the depth
+            sensor. Pass None for rectified depth images (e.g., the
+            image_depth_rect topic of iai_kinect2).
+        :param cam_mat_color: The 3x3 camera matrix of the color sensor.
+        :param size_color: The size (height, width) of the color images the
+            color camera matrix belongs to. Color images of other sizes (e.g.,
+            the 960x540 images of the ELTE Kinect Windows tool) are handled
+            by scaling the camera matrix accordingly.
+        :param rotation: The 3x3 rotation from the depth to the color sensor.
+        :param translation: The translation (in meters) from the depth to
+            the color sensor.
+        """
+        self._cam_mat_depth = np.asarray(cam_mat_depth, dtype=np.float64)
+        self._dist_coeff_depth = dist_coeff_depth
+        self._cam_mat_color = np.asarray(cam_mat_color, dtype=np.float64)
+        self._size_color = tuple(int(x) for x in size_color[:2])
+        self._rotation = np.asarray(rotation, dtype=np.float64).reshape((3, 3))
+        self._translation = np.asarray(translation,
+                                       dtype=np.float64).reshape(3)
+        self._tables = dict()
+
+    def _table(self, size_depth, size_color):
+        """Return the (cached) look-up tables for registering a depth image
+        of the given size to a color image of the given size.
+
+        :param size_depth: The size (height, width) of the depth image.
+        :param size_color: The size (height, width) of the color image.
+        :return: A tuple (rotated rays, color camera matrix, kernel), where
+            the rotated rays are a (3, height*width) float32 array of the
+            depth pixel viewing rays expressed in the color sensor frame,
+            and kernel is the structuring element for filling holes.
+        """
+        key = (tuple(size_depth[:2]), tuple(size_color[:2]))
+        if key not in self._tables:
+            rays = normalized_ray_grid(self._cam_mat_depth, key[0],
+                                       self._dist_coeff_depth).reshape(-1, 2)
+            rays = np.hstack([rays, np.ones((len(rays), 1), dtype=rays.dtype)])
+            rays = np.dot(self._rotation, rays.T).astype(np.float32)
+            scale = float(key[1][0])/self._size_color[0]
+            cam_mat = self._cam_mat_color*scale
+            cam_mat[2, 2] = 1.0
+            # depth pixels land up to 'ratio' color pixels apart
+            ratio = cam_mat[0, 0]/self._cam_mat_depth[0, 0]
+            k = 2*int(np.ceil(ratio/2.0)) + 1
+            kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (k, k))
+            self._tables[key] = (rays, cam_mat, kernel)
+        return self._tables[key]
+
+    def register(self, img_depth, size_color, fill_holes=True):
+        """Compute a depth image that matches the color image.
+
+        :param img_depth: A depth image (uint16, in millimeters).
+        :param size_color: The size (height, width) of the color image.
+        :param fill_holes: Whether to fill the gaps between the projected
+            depth pixels with the closest depth in their neighborhood.
+        :return: A depth image matching the color image.
+        """
+        rays, cam_mat, kernel = self._table(img_depth.shape[:2], size_color)
+        h, w = size_color[:2]
+        z = img_depth.reshape(-1)
+        valid = np.flatnonzero(z)
+        z = z[valid]
+        # back-project and transform into the color sensor frame
+        zm = z.astype(np.float32)*np.float32(0.001)
+        rays = rays[:, valid]
+        xc = rays[0]*zm + np.float32(self._translation[0])
+        yc = rays[1]*zm + np.float32(self._translation[1])
+        zc = rays[2]*zm + np.float32(self._translation[2])
+        # project onto the color image
+        u = (cam_mat[0, 0]*xc/zc + cam_mat[0, 2]).astype(np.int32)
+        v = (cam_mat[1, 1]*yc/zc + cam_mat[1, 2]).astype(np.int32)
+        inside = np.flatnonzero((u >= 0) & (u < w) & (v >= 0) & (v < h) &
+                                (zc > 0))
+        index = v[inside]*w + u[inside]
+        z = z[inside]
+        # z-buffer: write far to near, such that the closest point wins
+        order = np.argsort(z)[::-1]
+        output = np.zeros(h*w, dtype=img_depth.dtype)
+        output[index[order]] = z[order]
+        output = output.reshape((h, w))
+        if fill_holes:
+            # dilating the inverted depth spreads the closest depth into
+            # neighboring holes without growing foreground objects over
+            # measured background pixels
+            inverted = np.where(output > 0, np.iinfo(output.dtype).max - output, 0)
+            inverted = cv2.dilate(inverted.astype(output.dtype), kernel)
+            holes = (output == 0) & (inverted > 0)
+            output[holes] = np.iinfo(output.dtype).max - inverted[holes]
+        return output
+
+    def get_depths(self, img_depth, size_color, pixels_color, window=1):
+        """Compute the depths at the given pixels in the color image from a
+        corresponding depth image.
+
+        :param img_depth: A depth image.
+        :param size_color: The size (height, width) of the color image.
+        :param pixels_color: The requested pixels in the color image, an
+            iterable of N pixels (px, py) or a (N, 2) numpy array.
+        :param window: The size of the (square) window around each pixel
+            in the registered depth image over which the median of the valid
+            (non-zero) depths is computed. A value of 1 reads single pixels.
+        :return: The depths in meters at the requested pixels as a (N,)
+            numpy array. Invalid depths and pixels outside of the color image
+            have depth 0.0.
+        """
+        pixels_color = np.asarray(pixels_color, dtype=np.float64).reshape(-1, 2)
+        img_reg = self.register(img_depth, size_color)
+        return _sample_depths(img_reg, pixels_color[:, 0], pixels_color[:, 1],
+                              window)
+
+
+def normalized_ray_grid(camera_matrix, size, dist_coeff=None):
+    """Compute the viewing rays through the centers of all pixels of a
+    camera, i.e., the normalized image coordinates (x/z, y/z).
+
+    :param camera_matrix: The 3x3 camera matrix.
+    :param size: The size (height, width) of the image.
+    :param dist_coeff: The optional distortion coefficients. If given, the
+        pixel coordinates are undistorted.
+    :return: A (height, width, 2) float32 numpy array of the normalized image
+        coordinates of each pixel.
+    """
+    h, w = [int(x) for x in size[:2]]
+    px, py = np.meshgrid(np.arange(w, dtype=np.float64),
+                         np.arange(h, dtype=np.float64))
+    if dist_coeff is not None and np.any(dist_coeff):
+        pixels = np.dstack([px, py]).reshape((-1, 1, 2))
+        rays = cv2.undistortPoints(pixels, np.asarray(camera_matrix,
+                                                      dtype=np.float64),
+                                   np.asarray(dist_coeff, dtype=np.float64))
+        return rays.reshape((h, w, 2)).astype(np.float32)
+    x = (px - camera_matrix[0, 2])/camera_matrix[0, 0]
+    y = (py - camera_matrix[1, 2])/camera_matrix[1, 1]
+    return np.dstack([x, y]).astype(np.float32)
+
+
+def _sample_depths(img_depth, px, py, window):
+    """Read depths at (sub-)pixel positions of a depth image.
+
+    :param img_depth: A depth image (in millimeters).
+    :param px: The N x coordinates.
+    :param py: The N y coordinates.
+    :param window: The size of the (square) window around each pixel over
+        which the median of the valid (non-zero) depths is computed.
+    :return: The depths in meters as a (N,) numpy array. Invalid depths and
+        pixels outside of the depth image have depth 0.0.
+    """
+    px = np.asarray(px).astype(np.int64)
+    py = np.asarray(py).astype(np.int64)
+    h, w = img_depth.shape[:2]
+    if window > 1:
+        offsets = np.arange(window) - window//2
+        py = py[:, np.newaxis, np.newaxis] + offsets[np.newaxis, :, np.newaxis]
+        px = px[:, np.newaxis, np.newaxis] + offsets[np.newaxis, np.newaxis, :]
+        py, px = np.broadcast_arrays(py, px)
+    inside = (px >= 0) & (px < w) & (py >= 0) & (py < h)
+    depths = np.zeros(px.shape, dtype=np.float64)
+    depths[inside] = img_depth[py[inside], px[inside]]
+    if window > 1:
+        depths = depths.reshape(len(depths), -1)
+        # median over the valid depths of each row: sort invalid (zero)
+        # depths to the end and pick the middle of the valid ones
+        n = np.sum(depths > 0, axis=1)
+        depths[depths == 0] = np.inf
+        depths.sort(axis=1)
+        rows = np.flatnonzero(n)
+        medians = np.zeros(len(depths), dtype=np.float64)
+        medians[rows] = (depths[rows, (n[rows] - 1)//2] +
+                         depths[rows, n[rows]//2])/2.0
+        depths = medians
+    return depths/1000.0
+
+
+# registrar used by the module level functions below
+_registrar = DepthRegistrar()
+
+
 def register_depth(img_depth, size_color):
     """Compute a depth image that matches the color image.
     Note: This method implements a naive workaround to 'proper' depth image
@@ -49,37 +341,7 @@ def register_depth(img_depth, size_color):
     :param size_color: The size of the color image.
     :return: A depth image matching the color image.
     """
-    if size_color == (540, 960):
-        # magic factors for matching the depth image to the 960x540 color image
-        scale_factor = 1.45
-        x_shift = 120
-        y_shift = -38
-    elif size_color == (1080, 1920):
-        # magic factors for matching the depth image to the 1920x1080 color image
-        # TODO: modify magic factors for full HD resolution
-        scale_factor = 1.45*2
-        x_shift = 120*2
-        y_shift = -38*2
-    else:
-        raise ValueError("Not defined for size {}!".format(size_color))
-    dsize = tuple([int(x * scale_factor)
-                   for x in img_depth.shape[:2]][::-1])
-    img_depth = cv2.resize(img_depth, dsize, interpolation=cv2.INTER_CUBIC)
-    output = np.zeros(size_color, dtype=img_depth.dtype)
-    h0, w0 = output.shape[:2]
-    h2, w2 = img_depth.shape[:2]
-    # where to put image
-    x0 = min(max(x_shift, 0), w0)
-    y0 = min(max(y_shift, 0), h0)
-    x1 = min(x_shift + w2, w0)
-    y1 = min(y_shift + h2, h0)
-    # what to put
-    x2 = min(-x_shift if x_shift < 0 else 0, w2)
-    y2 = min(-y_shift if y_shift < 0 else 0, h2)
-    x3 = min(x2 + x1 - x0, w2)
-    y3 = min(y2 + y1 - y0, h2)
-    output[y0:y1, x0:x1] = img_depth[y2:y3, x2:x3]
-    return output
+    return _registrar.register(img_depth, size_color)
 
 
 def get_depth(img_depth, size_color, pixel_color):
@@ -91,23 +353,7 @@ def get_depth(img_depth, size_color, pixel_color):
     :param pixel_color: The requested pixel in the color image.
     :return: The depth at the requested pixel.
     """
-    if size_color == (540, 960):
-        # magic factors for matching the depth image to the 960x540 color image
-        scale_factor = 1.45
-        x_shift = 120
-        y_shift = -38
-    elif size_color == (1080, 1920):
-        # magic factors for matching the depth image to the 1920x1080 color image
-        # TODO: modify magic factors for full HD resolution
-        scale_factor = 1.45*2
-        x_shift = 120*2
-        y_shift = -38*2
-    else:
-        raise ValueError("Not defined for size {}!".format(size_color))
-    cx, cy = pixel_color
-    scaled_x = int((cx - x_shift)/scale_factor)
-    scaled_y = int((cy - y_shift)/scale_factor)
-    return img_depth[scaled_y, scaled_x]/1000.0
+    return float(_registrar.get_depths(img_depth, size_color, [pixel_color])[0])
 
 
 def blend(img_color, img_depth):
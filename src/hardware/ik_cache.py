@@ -0,0 +1,188 @@
+# Copyright (c) 2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+from collections import OrderedDict
+import numpy as np
+import threading
+
+from geometry_msgs.msg import Pose
+
+
+class IKCache(object):
+    def __init__(self, size=2048, resolution=1e-3):
+        """Least recently used cache of inverse kinematics solutions, keyed by
+        arm and quantized pose. Poses for which no solution exists are
+        remembered as well.
+
+        :param size: The maximum number of cached solutions.
+        :param resolution: The quantization step for pose coordinates (in m
+            for positions and in rad, or unit quaternion components, for
+            orientations).
+        """
+        self._size = size
+        self._resolution = resolution
+        self._entries = OrderedDict()
+        # the cache is shared by the IK requests for both arms
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, arm, pose):
+        """Compute the cache key for a pose.
+
+        :param arm: The arm <'left', 'right'>.
+        :param pose: One of
+            - a ROS Pose,
+            - a list of length 6 [x, y, z, roll, pitch, yaw] or
+            - a list of length 7 [x, y, z, qx, qy, qz, qw].
+        :return: A hashable key.
+        """
+        if isinstance(pose, Pose):
+            pose = [pose.position.x, pose.position.y, pose.position.z,
+                    pose.orientation.x, pose.orientation.y,
+                    pose.orientation.z, pose.orientation.w]
+        q = np.round(np.asarray(pose, dtype=np.float64)/self._resolution)
+        return arm, tuple(int(x) for x in q)
+
+    def lookup(self, arm, pose):
+        """Look up the solution for a pose.
+
+        :param arm: The arm <'left', 'right'>.
+        :param pose: The pose, see key.
+        :return: A tuple (found, config). If found is True, config is either
+            a dictionary of joint name keys to joint angles or None if it is
+            known that there is no solution.
+        """
+        key = self.key(arm, pose)
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            config = self._entries.pop(key)
+            self._entries[key] = config
+        return True, None if config is None else dict(config)
+
+    def store(self, arm, pose, config):
+        """Remember the solution for a pose.
+
+        :param arm: The arm <'left', 'right'>.
+        :param pose: The pose, see key.
+        :param config: A dictionary of joint name keys to joint angles or None
+            if there is no solution.
+        :return:
+        """
+        key = self.key(arm, pose)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = None if config is None else dict(config)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all cached solutions and reset the statistics.
+
+        :return:
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def statistics(self):
+        """Return the cache statistics.
+
+        :return: A dictionary with the number of entries, hits and misses and
+            the hit rate.
+        """
+        n = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits)/n if n > 0 else 0.0
+        }
+
+    def save(self, filename, poses=None):
+        """Save cached solutions to a file. Cached failures (no solution) are
+        not saved, such that a transient failure is retried in later runs.
+
+        :param filename: The npz file to write.
+        :param poses: An optional list of poses. If given, only the solutions
+            for these poses (for either arm) are saved.
+        :return:
+        """
+        with self._lock:
+            entries = [(k, c) for k, c in self._entries.items()
+                       if c is not None]
+        keys = [k for k, _ in entries]
+        if poses is not None:
+            wanted = set(self.key(arm, pose) for pose in poses
+                         for arm in ['left', 'right'])
+            keys = [k for k in keys if k in wanted]
+        names = list()
+        positions = list()
+        configs = dict(entries)
+        for key in keys:
+            config = configs[key]
+            joints = sorted(config.keys())
+            names.append(','.join(joints))
+            positions.append([config[j] for j in joints])
+        # poses are given by 6 or 7 values, pad them to a common length
+        np.savez(filename,
+                 arms=np.array([k[0] for k in keys], dtype='S5'),
+                 lengths=np.array([len(k[1]) for k in keys], dtype=np.int64),
+                 keys=np.array([list(k[1]) + [0]*(7 - len(k[1])) for k in keys],
+                               dtype=np.int64).reshape(len(keys), 7),
+                 names=np.array(names, dtype='S128'),
+                 positions=np.array(positions,
+                                    dtype=np.float64).reshape(len(keys), 7),
+                 resolution=self._resolution)
+
+    def load(self, filename):
+        """Load solutions previously saved with save.
+
+        :param filename: The npz file to read.
+        :return: The number of loaded solutions.
+        """
+        with np.load(filename) as data:
+            if float(data['resolution']) != self._resolution:
+                return 0
+            entries = zip(data['arms'], data['lengths'], data['keys'],
+                          data['names'], data['positions'])
+        n = 0
+        for arm, length, key, names, positions in entries:
+            if not names:
+                # failure saved by an earlier version, retry instead
+                continue
+            config = dict(zip(str(names).split(','),
+                              [float(x) for x in positions]))
+            key = str(arm), tuple(int(x) for x in key[:length])
+            self._entries[key] = config
+            n += 1
+        return n
@@ -26,11 +26,13 @@
 # DISCLAIMER: The client interface to the ELTE Kinect Windows tool is adapted
 # from and inspired by software written by Mike Olasz at ELTE.
 
+from collections import deque
 import logging
 import numpy as np
 import os
 import socket
 import struct
+import threading
 import time
 
 import cv2
@@ -38,13 +40,162 @@ import cv2
 import rospy
 from sensor_msgs.msg import CameraInfo, Image
 
-from base import Camera, img_to_imgmsg
-from depth_registration import get_depth
+from base import Camera, CameraPair, img_to_imgmsg
+from depth_registration import CalibratedDepthRegistrar, DepthRegistrar
+import kinect_codecs
 from settings.debug import topic_img4
 
 
+class _StreamStats(object):
+    def __init__(self):
+        """Book-keeping of the frames received for one data stream (color,
+        depth or skeleton) of the ELTE Kinect Windows tool.
+        """
+        self.n_frames = 0
+        self.t_first = None
+        self.t_last = None
+        self.n_transfers = 0
+        self.n_bytes = 0
+        self.t_receive = 0.0
+        self.t_decode = 0.0
+        self.n_allocs = 0
+        self.n_alloc_bytes = 0
+
+    def reset(self):
+        self.__init__()
+
+    def tick(self):
+        """Record the reception of one frame."""
+        now = time.time()
+        if self.t_first is None:
+            self.t_first = now
+        self.t_last = now
+        self.n_frames += 1
+
+    def add_transfer(self, n_bytes, t_receive, t_decode):
+        """Record one payload transfer.
+
+        :param n_bytes: The size of the payload in bytes.
+        :param t_receive: The time spent receiving the payload in seconds.
+        :param t_decode: The time spent decoding the payload in seconds.
+        :return:
+        """
+        self.n_transfers += 1
+        self.n_bytes += n_bytes
+        self.t_receive += t_receive
+        self.t_decode += t_decode
+
+    def add_allocation(self, n_bytes):
+        """Record the allocation of a receive buffer.
+
+        :param n_bytes: The size of the allocated buffer in bytes.
+        :return:
+        """
+        self.n_allocs += 1
+        self.n_alloc_bytes += n_bytes
+
+    def fps(self):
+        """The sustained frame rate since the first recorded frame.
+
+        :return: The number of frames per second (0.0 if less than two
+            frames have been received).
+        """
+        if self.n_frames < 2 or self.t_last <= self.t_first:
+            return 0.0
+        return (self.n_frames - 1)/(self.t_last - self.t_first)
+
+    def summary(self):
+        """Summarize the recorded statistics.
+
+        :return: A dictionary containing the frame rate, the receive
+            throughput in MB/s, the mean payload size in kB, the mean receive
+            and decode times per payload in ms and the buffer allocations and
+            allocated bytes per payload.
+        """
+        n = max(self.n_transfers, 1)
+        return {
+            'fps': self.fps(),
+            'kb_per_frame': self.n_bytes/1e3/n,
+            'mb_per_s': (self.n_bytes/self.t_receive/1e6
+                         if self.t_receive > 0.0 else 0.0),
+            'ms_receive': 1e3*self.t_receive/n,
+            'ms_decode': 1e3*self.t_decode/n,
+            'allocs_per_frame': float(self.n_allocs)/n,
+            'alloc_bytes_per_frame': float(self.n_alloc_bytes)/n
+        }
+
+
+class _FrameSlot(object):
+    def __init__(self):
+        """Lock-protected slot holding the latest frame of one data stream
+        together with its capture time stamp.
+        """
+        self._cond = threading.Condition()
+        self._data = None
+        self._stamp = 0.0
+
+    def put(self, data, stamp):
+        """Replace the frame in the slot and wake up all waiting readers.
+
+        :param data: The new frame.
+        :param stamp: The capture time stamp of the frame (in s).
+        :return:
+        """
+        with self._cond:
+            self._data = data
+            self._stamp = stamp
+            self._cond.notify_all()
+
+    def latest(self):
+        """Return the latest frame immediately.
+
+        :return: A tuple (frame, time stamp). The frame is None if no frame
+            was received yet.
+        """
+        with self._cond:
+            return self._data, self._stamp
+
+    def wait_newer_than(self, stamp, timeout=None):
+        """Wait for a frame captured after the given time stamp.
+
+        :param stamp: The time stamp (in s) the frame needs to be newer than.
+        :param timeout: The maximum time to wait in s. If None, wait forever.
+        :return: A tuple (frame, time stamp).
+        :raise RuntimeError: If no newer frame arrived within the timeout.
+        """
+        end = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._stamp <= stamp:
+                remaining = None if end is None else end - time.time()
+                if remaining is not None and remaining <= 0.0:
+                    raise RuntimeError("No new frame within {} s!".format(timeout))
+                self._cond.wait(remaining)
+            return self._data, self._stamp
+
+
 class Kinect(object):
-    def __init__(self, root_dir, host=None):
+    def __init__(self, root_dir, host=None, persistent=False, n_inflight=1,
+                 port=9999, color_codec='jpeg', depth_codec='png'):
+        """Hardware abstraction of the Kinect V2 sensor, either connected to
+        the Ubuntu machine (using ROS and iai_kinect2) or to a Windows
+        machine running the ELTE Kinect Windows tool.
+
+        :param root_dir: Where the baxter_pick_and_place package resides.
+        :param host: The host name or IP of the Windows machine running the
+            ELTE Kinect Windows tool.
+        :param persistent: Whether to keep one TCP/IP connection to the ELTE
+            Kinect Windows tool open for all requests (True) or to connect
+            anew for every request (False).
+        :param n_inflight: The number of frame requests to keep in flight
+            on a persistent connection. A value of 1 disables pipelining.
+        :param port: The port the ELTE Kinect Windows tool listens on.
+        :param color_codec: The payload encoding to request for color
+            images, see kinect_codecs.
+        :param depth_codec: The payload encoding to request for depth
+            images, see kinect_codecs. Encodings other than the defaults
+            ('jpeg' and 'png') are negotiated when connecting and require a
+            server that supports this, e.g., the stand-in in kinect_server.
+        """
         name = 'main.kinect'
         self._logger = logging.getLogger(name)
 
@@ -54,7 +205,32 @@ class Kinect(object):
         self._pub_vis = rospy.Publisher(topic_img4, Image,
                                         queue_size=10, latch=True)
         self._host = host
+        self._port = port
+        for codec in [color_codec, depth_codec]:
+            kinect_codecs.parse_codec(codec)
+        self._codecs = {'color': color_codec, 'depth': depth_codec}
         self._socket = None
+        self._persistent = persistent
+        self._n_inflight = max(1, int(n_inflight))
+        # requests (color, depth, skeleton) sent but not yet answered
+        self._pending = deque()
+        # number of responses received on the current persistent connection
+        self._n_responses = 0
+        self._n_session_failures = 0
+        self._timeout = 2.0
+        self._stats = {k: _StreamStats() for k in ['color', 'depth', 'skeleton']}
+        # serializes access to the sensor between callers and the grabber
+        self._lock = threading.RLock()
+        # number of callers waiting for the sensor, the grabber yields to them
+        self._n_waiting = 0
+        self._waiting = threading.Condition()
+        self._grabber = None
+        self._grab_streams = (False, False, False)
+        self._grab_stop = threading.Event()
+        self._slots = {k: _FrameSlot() for k in ['color', 'depth', 'skeleton']}
+        # reusable receive buffers for the color and depth payloads
+        self._buffers = dict()
+        self._registrar = DepthRegistrar()
         self._native_ros = False
         try:
             # try to read calibration from ROS camera info topic
@@ -83,10 +259,34 @@ class Kinect(object):
                     'size': cal['size_depth'],
                     'dist_coeff': cal['dist_coeff_depth']
                 }
+        # RGB--IR extrinsics (rotation, translation) from the depth to the
+        # color sensor, if calibrated
+        self._depth_to_color = None
+        if os.path.exists(path):
+            with np.load(path) as cal:
+                if 'rotation' in cal and 'translation' in cal:
+                    self._depth_to_color = (
+                        np.asarray(cal['rotation'], dtype=np.float64).reshape((3, 3)),
+                        np.asarray(cal['translation'], dtype=np.float64).reshape(3))
         self.depth = Camera(topic='/kinect2/sd/image_depth_rect',
                             prefix=name, cam_pars=pars_depth)
         self.color = Camera(topic='/kinect2/hd/image_color_rect',
                             prefix=name, cam_pars=pars_color)
+        if self._depth_to_color is not None:
+            # Register depth to color images using the calibrated RGB--IR
+            # extrinsics instead of the magic factors. The depth images of
+            # the native ROS interface are rectified already, so they must
+            # not be undistorted again.
+            self._registrar = CalibratedDepthRegistrar(
+                cam_mat_depth=self.depth.camera_matrix,
+                dist_coeff_depth=None if self._native_ros else self.depth.distortion_coeff,
+                cam_mat_color=self.color.camera_matrix,
+                size_color=self.color.image_size,
+                rotation=self._depth_to_color[0],
+                translation=self._depth_to_color[1])
+        # color and depth images captured at (nearly) the same time, i.e.,
+        # within half a frame period of the 30 Hz Kinect V2 streams
+        self._pair = CameraPair(self.color, self.depth, tolerance=0.5/30.0)
 
         # index into the skeleton arrays
         self.joint_type_count = 13
@@ -102,70 +302,114 @@ class Kinect(object):
         :return: The _image_size of the data to read (as an int).
         """
         data = self._socket.recv(4)
+        if not data:
+            raise socket.error("Connection closed by the ELTE Kinect Windows tool!")
         try:
             size = struct.unpack('<i', data)[0]  # we receive an int value
-        except ValueError:
+        except (ValueError, struct.error):
             size = -1
         finally:
             # Sending ACK that we received the _image_size
             self._socket.sendall("OK\n")
         return size
 
-    def _receive_data(self, n_bytes):
+    def _get_buffer(self, stream, n_bytes):
+        """Get a reusable receive buffer for a data stream that can hold at
+        least the requested number of bytes. The buffer is only reallocated
+        if it is too small, with some headroom for the varying payload size
+        of compressed images.
+
+        :param stream: The data stream <'color', 'depth'>.
+        :param n_bytes: The number of bytes the buffer needs to hold.
+        :return: A bytearray of at least n_bytes length.
+        """
+        buf = self._buffers.get(stream)
+        if buf is None or len(buf) < n_bytes:
+            buf = bytearray(int(1.25*n_bytes))
+            self._buffers[stream] = buf
+            self._stats[stream].add_allocation(len(buf))
+        return buf
+
+    def _receive_data(self, n_bytes, stream=None):
         """Receive a given number of bytes from the data stream provided by
         the ELTE Kinect Windows tool.
+        The bytes are read directly into a buffer without intermediate
+        copies. If a data stream is given, its reusable buffer is used and
+        the returned array is only valid until the next payload of this
+        stream is received.
 
         :param n_bytes: The number of bytes to read from the data stream.
-        :return: The received data.
-        :raise ValueError: If the requested number of bytes was not received.
+        :param stream: The optional data stream <'color', 'depth'> whose
+            receive buffer to use. If None, a new buffer is allocated.
+        :return: The received data as a uint8 numpy array (a view onto the
+            receive buffer).
+        :raise socket.error: If the connection was closed before the
+            requested number of bytes was received.
         """
+        if stream is None:
+            buf = bytearray(n_bytes)
+        else:
+            buf = self._get_buffer(stream=stream, n_bytes=n_bytes)
+        view = memoryview(buf)
         # Reading the socket stream to get every packet
-        data = self._socket.recv(n_bytes)
-        while len(data) < n_bytes:
-            data += self._socket.recv(n_bytes - len(data))
-        self._logger.debug("Received {}/{} bytes.".format(len(data), n_bytes))
-        if len(data) != n_bytes:
-            msg = "Received {} but should have received {} bytes!".format(
-                len(data), n_bytes)
-            self._logger.error(msg)
-            raise ValueError(msg)
+        n_received = 0
+        while n_received < n_bytes:
+            n = self._socket.recv_into(view[n_received:], n_bytes - n_received)
+            if n == 0:
+                raise socket.error("Connection closed by the ELTE Kinect "
+                                   "Windows tool after {}/{} bytes!".format(
+                                       n_received, n_bytes))
+            n_received += n
+        self._logger.debug("Received {}/{} bytes.".format(n_received, n_bytes))
         # Sending ACK that we received the data
         self._socket.sendall("OK2\n")
-        return data
+        return np.frombuffer(buf, dtype=np.uint8, count=n_bytes)
 
-    def _receive_color(self):
-        """Receive a color image from the ELTE Kinect Windows tool and decode
-        it as a uint8, three-channel numpy array of _image_size height x width.
+    def _receive_image(self, stream):
+        """Receive an encoded image from the ELTE Kinect Windows tool and
+        decode it straight from the receive buffer with the codec negotiated
+        for the data stream.
 
-        :return: A (h, w, 3) numpy array holding the color image.
+        :param stream: The data stream <'color', 'depth'>.
+        :return: The decoded image or None.
         """
         start = time.time()
         # Reading the _image_size of the data stream we want to read
         n_bytes = self._receive_size()
         if n_bytes == -1:
-            self._logger.warning("Failed to receive color image data!")
+            self._logger.warning("Failed to receive {} image data!".format(stream))
             return None
         self._logger.debug("Need to receive {} bytes.".format(n_bytes))
 
         # Reading the data from the socket stream
-        try:
-            msg = self._receive_data(n_bytes=n_bytes)
-        except ValueError:
-            return None
+        barray = self._receive_data(n_bytes=n_bytes, stream=stream)
+        received = time.time()
 
-        # Convert received data into a numpy array
-        try:
-            barray = np.fromstring(msg, np.uint8)
-        except ValueError:
-            self._logger.warning("Error when converting raw data to color image!")
+        img = kinect_codecs.decode(barray, self._codecs[stream])
+        decoded = time.time()
+        self._stats[stream].add_transfer(n_bytes=n_bytes,
+                                         t_receive=received - start,
+                                         t_decode=decoded - received)
+        if img is None:
+            self._logger.warning("Error when decoding raw data to {} "
+                                 "image!".format(stream))
             return None
-        img = cv2.imdecode(barray, cv2.IMREAD_COLOR)
-        self._logger.debug("Received a {} {} color image (min={}, max={}) "
-                           "in {:.3f} s.".format(img.shape, img.dtype,
-                                                 img.min(), img.max(),
-                                                 time.time() - start))
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug("Received a {} {} {} image (min={}, max={}) "
+                               "in {:.3f} s.".format(img.shape, img.dtype,
+                                                     stream, img.min(),
+                                                     img.max(),
+                                                     decoded - start))
         return img
 
+    def _receive_color(self):
+        """Receive a color image from the ELTE Kinect Windows tool and decode
+        it as a uint8, three-channel numpy array of _image_size height x width.
+
+        :return: A (h, w, 3) numpy array holding the color image.
+        """
+        return self._receive_image(stream='color')
+
     def _receive_depth(self):
         """Receive a depth image from the ELTE Kinect Windows tool and decode
         it as an uint16 depth map where each value represents the distance in
@@ -175,34 +419,8 @@ class Kinect(object):
         for more information.
 
         :return: A (h, w) numpy array holding the depth map.
-        :raise ValueError: If no depth map was received.
         """
-        start = time.time()
-        # Reading the _image_size of the data stream we want to read
-        n_bytes = self._receive_size()
-        if n_bytes == -1:
-            self._logger.warning("Failed to receive depth map data!")
-            return None
-        self._logger.debug("Need to receive {} bytes.".format(n_bytes))
-
-        # Reading the data from the socket stream
-        try:
-            msg = self._receive_data(n_bytes=n_bytes)
-        except ValueError:
-            return None
-
-        # Convert received data into a numpy array
-        try:
-            barray = np.fromstring(msg, np.uint16)
-        except ValueError:
-            self._logger.warning("Error when converting raw data to depth map!")
-            return None
-        img = cv2.imdecode(barray, cv2.IMREAD_UNCHANGED)
-        self._logger.debug("Received a {} {} depth map (min={}, max={}) "
-                           "in {:.3f} s.".format(img.shape, img.dtype,
-                                                 img.min(), img.max(),
-                                                 time.time() - start))
-        return img
+        return self._receive_image(stream='depth')
 
     def _receive_skeleton_data(self, n_bytes):
         """Receive skeleton data from the ELTE Kinect Windows tool.
@@ -213,30 +431,35 @@ class Kinect(object):
         """
         # Reading the number of bodies we want to receive data for
         data = self._socket.recv(4)
+        if not data:
+            raise socket.error("Connection closed by the ELTE Kinect Windows tool!")
         try:
             n_bodies = struct.unpack("<I", data)[0]  # read unsigned int value
-        except ValueError:
+        except (ValueError, struct.error):
             n_bodies = 0
         finally:
             # Sending ACK that we received the _image_size
             self._socket.sendall("OK\n")
 
         # Reading the data from the socket stream
-        try:
-            msg = self._receive_data(n_bytes=n_bytes)
-        except ValueError:
-            msg = None
+        msg = self._receive_data(n_bytes=n_bytes)
         return n_bodies, msg
 
+    def _empty_skeletons(self):
+        """Skeleton data holding no bodies.
+
+        :return: A (0, 13, 7) float32 numpy array.
+        """
+        return np.empty((0, self.joint_type_count, 7), dtype=np.float32)
+
     def _receive_skeleton(self):
         """Receive skeleton data from the ELTE Kinect Windows tool and decode
-        if as a list of length number of bodies (skeletons), where each
-        skeleton is defined by three lists holding 13 joint coordinates each,
-        where the first list holds the camera coordinates, the second list
-        holds color space (pixel) coordinates and the third list holds depth
-        space (pixel) coordinates.
+        it as a (n_bodies, 13, 7) float32 numpy array, a view onto the
+        received data. For each body and each of the 13 joints the last axis
+        holds the camera coordinates (x, y, z), the color space (pixel)
+        coordinates (px, py) and the depth space (pixel) coordinates (px, py).
 
-        :return: A list holding n skeletons defined by three lists of joint
+        :return: A (n_bodies, 13, 7) numpy array holding the joint
             coordinates in camera, color and depth space.
         """
         start = time.time()
@@ -245,44 +468,294 @@ class Kinect(object):
         if n_bytes == -1:
             msg = "Failed to receive skeleton data!"
             self._logger.warning(msg)
-            return list()
+            return self._empty_skeletons()
         self._logger.debug("Need to receive {} bytes.".format(n_bytes))
 
         # Reading the data from the socket stream
-        try:
-            n_bodies, msg = self._receive_skeleton_data(n_bytes=n_bytes)
-        except ValueError:
-            return list()
+        n_bodies, msg = self._receive_skeleton_data(n_bytes=n_bytes)
+        received = time.time()
 
-        # Convert received data into a list
+        # Interpret received data as array of bodies
+        n_values = n_bodies*self.joint_type_count*7
         try:
-            barray = np.fromstring(msg, np.float32)
+            bodies = msg.view(np.float32)[:n_values].reshape(
+                (n_bodies, self.joint_type_count, 7))
         except ValueError:
-            self._logger.warning("Error when converting raw data to skeleton list!")
-            return list()
-        bodies = list()
-        for body in range(n_bodies):
-            cam_space_points = list()
-            color_space_points = list()
-            depth_space_points = list()
-            for i in range(body*self.joint_type_count*7,
-                           (body + 1)*self.joint_type_count*7, 7):
-                cam_space_points.append((barray[i], barray[i + 1], barray[i + 2]))
-                color_space_points.append((barray[i + 3], barray[i + 4]))
-                depth_space_points.append((barray[i + 5], barray[i + 6]))
-            bodies.append((cam_space_points, color_space_points, depth_space_points))
+            self._logger.warning("Error when converting raw data to skeleton "
+                                 "array ({} bytes for {} bodies)!".format(
+                                     n_bytes, n_bodies))
+            return self._empty_skeletons()
+        self._stats['skeleton'].add_transfer(n_bytes=n_bytes,
+                                             t_receive=received - start,
+                                             t_decode=time.time() - received)
         self._logger.debug("Received skeleton data for {} bod{} in {:.3f} s.".format(
             len(bodies), 'y' if len(bodies) == 1 else 'ies',
             time.time() - start))
         return bodies
 
-    def collect_data(self, color=False, depth=False, skeleton=False):
-        """Collect the latest color, depth and skeleton data from the Kinect V2
-        sensor.
-        Note: If the Kinect is connected to a Ubuntu machine, use the native
-        ROS interface using the libfreenect2 and iai_kinect2 libraries. If the
-        Kinect is connected to a Windows machine and runs the ELTE Kinect
-        Windows tool server, communicate via a TCP/IP socket connection.
+    def _connect(self):
+        """Open a TCP/IP connection to the ELTE Kinect Windows tool.
+
+        :return: The connected socket.
+        :raise ValueError: If no host name was provided.
+        :raise RuntimeError: If the connection could not be established.
+        """
+        if not self._host:
+            msg = "No host name for ELTE Kinect Windows tool provided!"
+            self._logger.error(msg)
+            raise ValueError(msg)
+        # Create a TCP/IP socket
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # The protocol exchanges many tiny messages (request lines and ACKs),
+        # which must not be delayed by Nagle's algorithm.
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Connect the socket to the host and port where the server listens
+        server = self._host, self._port
+        self._logger.debug('Connect to {} on port {}.'.format(server[0].upper(),
+                                                              server[1]))
+        try:
+            sock.connect(server)
+        except (socket.gaierror, socket.error):
+            sock.close()
+            raise RuntimeError("Failed to connect to {}!".format(server[0].upper()) +
+                               " Check your network connection.")
+        return sock
+
+    def _receive_line(self, max_length=64):
+        """Receive a short line of text from the ELTE Kinect Windows tool.
+
+        :param max_length: The maximum number of characters to read.
+        :return: The line including the trailing newline.
+        :raise socket.error: If the connection was closed or no newline was
+            received within max_length characters.
+        """
+        line = ''
+        while not line.endswith('\n'):
+            char = self._socket.recv(1)
+            if not char or len(line) >= max_length:
+                raise socket.error("No answer from the ELTE Kinect Windows tool!")
+            line += char
+        return line
+
+    def _negotiate_codecs(self):
+        """Request the configured payload encodings on a new connection.
+        If the server does not confirm them, reconnect and fall back to the
+        default encodings.
+
+        :return:
+        """
+        if self._codecs == kinect_codecs.default_codecs:
+            return
+        msg = 'CODEC color={} depth={}\n'.format(self._codecs['color'],
+                                                 self._codecs['depth'])
+        timeout = self._socket.gettimeout()
+        self._socket.settimeout(self._timeout)
+        try:
+            self._socket.sendall(msg)
+            answer = self._receive_line()
+        except socket.error:
+            answer = None
+        if answer == 'OK\n':
+            self._socket.settimeout(timeout)
+            self._logger.debug("Negotiated color codec '{}' and depth codec "
+                               "'{}'.".format(self._codecs['color'],
+                                              self._codecs['depth']))
+            return
+        self._logger.warning("ELTE Kinect Windows tool does not support "
+                             "codecs {}. Fall back to {}.".format(
+                                 self._codecs, kinect_codecs.default_codecs))
+        self._codecs = dict(kinect_codecs.default_codecs)
+        self._socket.close()
+        self._socket = self._connect()
+        self._socket.settimeout(timeout)
+
+    def _send_request(self, request):
+        """Request data from the ELTE Kinect Windows tool.
+
+        :param request: A triple of flags (color, depth, skeleton).
+        :return:
+        """
+        msg = '{}{}{}\n'.format(*[1 if x else 0 for x in request])
+        self._socket.sendall(msg)
+
+    def _receive_response(self, request):
+        """Receive the answer of the ELTE Kinect Windows tool to a request.
+
+        :param request: A triple of flags (color, depth, skeleton).
+        :return: A triple (color image, depth image, skeletons).
+        """
+        color, depth, skeleton = request
+        img_color = None
+        img_depth = None
+        data_skeleton = self._empty_skeletons()
+        if color:
+            img_color = self._receive_color()
+        if depth:
+            img_depth = self._receive_depth()
+        if skeleton:
+            data_skeleton = self._receive_skeleton()
+        return img_color, img_depth, data_skeleton
+
+    def _collect_per_call(self, request):
+        """Collect data from the ELTE Kinect Windows tool using a connection
+        that is opened for this request only.
+
+        :param request: A triple of flags (color, depth, skeleton).
+        :return: A triple (color image, depth image, skeletons).
+        """
+        data = None, None, self._empty_skeletons()
+        self._socket = self._connect()
+        try:
+            self._negotiate_codecs()
+            self._send_request(request)
+            data = self._receive_response(request)
+        except socket.error as e:
+            self._logger.error(str(e))
+        finally:
+            self._logger.debug('Close socket.')
+            self._socket.close()
+        self._socket = None
+        return data
+
+    def open_session(self):
+        """Open a persistent connection to the ELTE Kinect Windows tool.
+
+        :return:
+        """
+        if self._socket is not None:
+            return
+        self._socket = self._connect()
+        # A server that does not support persistent connections or pipelined
+        # requests might stop answering instead of closing the connection.
+        self._socket.settimeout(self._timeout)
+        self._negotiate_codecs()
+        self._pending.clear()
+        self._n_responses = 0
+        self.reset_statistics()
+        self._logger.info("Opened persistent connection to {}.".format(
+            self._host.upper()))
+
+    def close_session(self):
+        """Close the persistent connection to the ELTE Kinect Windows tool
+        and report the sustained frame rates.
+
+        :return:
+        """
+        self.stop_grabber()
+        if self._socket is None:
+            return
+        self._logger.info("Close persistent connection to {} ({}).".format(
+            self._host.upper(), self.report_statistics()))
+        try:
+            self._socket.close()
+        finally:
+            self._socket = None
+            self._pending.clear()
+
+    def _reset_session(self):
+        """Drop a broken persistent connection. If the server repeatedly
+        fails to answer more than one request on a connection, first stop
+        pipelining (the server may not accept a request line in place of an
+        ACK) and then fall back to connecting anew for every request.
+
+        :return:
+        """
+        if self._n_responses <= 1:
+            self._n_session_failures += 1
+        else:
+            self._n_session_failures = 0
+        try:
+            self._socket.close()
+        except socket.error:
+            pass
+        self._socket = None
+        self._pending.clear()
+        if self._n_session_failures >= 2:
+            self._n_session_failures = 0
+            if self._n_inflight > 1:
+                self._logger.warning("ELTE Kinect Windows tool does not "
+                                     "support pipelined requests. Disable "
+                                     "pipelining.")
+                self._n_inflight = 1
+            else:
+                self._logger.warning("ELTE Kinect Windows tool does not "
+                                     "support persistent connections. Fall "
+                                     "back to one connection per request.")
+                self._persistent = False
+
+    def _collect_session(self, request):
+        """Collect data from the ELTE Kinect Windows tool using a persistent
+        connection. Up to n_inflight requests are sent ahead, such that the
+        server can prepare the next frame while we decode the current one.
+        If the connection breaks, reconnect once.
+
+        :param request: A triple of flags (color, depth, skeleton).
+        :return: A triple (color image, depth image, skeletons).
+        """
+        for attempt in range(2):
+            try:
+                if self._socket is None:
+                    self.open_session()
+                # answers to requests for other data streams are of no use
+                while self._pending and self._pending[0] != request:
+                    self._receive_response(self._pending.popleft())
+                    self._n_responses += 1
+                while len(self._pending) < self._n_inflight:
+                    self._send_request(request)
+                    self._pending.append(request)
+                data = self._receive_response(self._pending.popleft())
+                self._n_responses += 1
+                return data
+            except socket.error as e:
+                self._logger.warning("Persistent connection failed ({}). "
+                                     "Reconnecting.".format(e))
+                self._reset_session()
+                if not self._persistent:
+                    return self._collect_per_call(request)
+        return None, None, self._empty_skeletons()
+
+    def frame_rates(self):
+        """The sustained frame rates of the color, depth and skeleton streams
+        received from the ELTE Kinect Windows tool.
+
+        :return: A dictionary of stream name keys to frames per second.
+        """
+        return {k: v.fps() for k, v in self._stats.items()}
+
+    def receive_statistics(self):
+        """Statistics of the data received from the ELTE Kinect Windows tool
+        per stream, i.e., frame rate, throughput, receive and decode times and
+        receive buffer allocations per frame.
+
+        :return: A dictionary of stream name keys to dictionaries of
+            statistics.
+        """
+        return {k: v.summary() for k, v in self._stats.items()}
+
+    def reset_statistics(self):
+        """Reset the statistics of the data received from the ELTE Kinect
+        Windows tool.
+
+        :return:
+        """
+        for stats in self._stats.values():
+            stats.reset()
+
+    def report_statistics(self):
+        """Format the receive statistics for logging.
+
+        :return: A string listing the statistics per stream.
+        """
+        return '; '.join(
+            '{}: {fps:.1f} fps, {kb_per_frame:.1f} kB/frame, {mb_per_s:.1f} '
+            'MB/s, receive {ms_receive:.1f} '
+            'ms, decode {ms_decode:.1f} ms, {allocs_per_frame:.2f} allocs '
+            '({alloc_bytes_per_frame:.0f} B)/frame'.format(k, **v.summary())
+            for k, v in sorted(self._stats.items()) if v.n_frames > 0)
+
+    def _collect(self, color=False, depth=False, skeleton=False):
+        """Fetch the latest color, depth and skeleton data from the Kinect V2
+        sensor. See collect_data for details.
 
         :param color: Whether to retrieve the latest color image.
         :param depth: Whether to retrieve the latest depth image.
@@ -291,12 +764,14 @@ class Kinect(object):
         """
         img_color = None
         img_depth = None
-        data_skeleton = list()
+        data_skeleton = self._empty_skeletons()
         if self._native_ros:
             # Kinect is connected to the Ubuntu machine, communicate via ROS
-            if color:
+            if color and depth:
+                img_color, img_depth, _ = self._pair.collect()
+            elif color:
                 img_color = self.color.collect_image()
-            if depth:
+            elif depth:
                 img_depth = self.depth.collect_image()
             if skeleton:
                 # libfreenect2 does not provide skeleton data
@@ -304,75 +779,282 @@ class Kinect(object):
         else:
             # Kinect is connected to a Windows machine, communicate via
             # TCP/IP socket connection
-            if not self._host:
-                msg = "No host name for ELTE Kinect Windows tool provided!"
-                self._logger.error(msg)
-                raise ValueError(msg)
-            # Create a TCP/IP socket
-            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            # Connect the socket to the host and port where the server listens
-            server = self._host, 9999
-            self._logger.debug('Connect to {} on port {}.'.format(server[0].upper(),
-                                                                  server[1]))
-            try:
-                self._socket.connect(server)
-            except socket.gaierror:
-                raise RuntimeError("Failed to connect to {}!".format(server[0].upper()) +
-                                   " Check your network connection.")
-            try:
-                msg = '{}{}{}\n'.format(*[1 if x else 0
-                                          for x in [color, depth, skeleton]])
-                self._socket.sendall(msg)
-                if color:
-                    img_color = self._receive_color()
-                if depth:
-                    img_depth = self._receive_depth()
-                if skeleton:
-                    data_skeleton = self._receive_skeleton()
-            except socket.error as e:
-                self._logger.error(str(e))
-            finally:
-                self._logger.debug('Close socket.')
-                self._socket.close()
-            self._socket = None
+            request = (color, depth, skeleton)
+            if self._persistent:
+                img_color, img_depth, data_skeleton = \
+                    self._collect_session(request)
+            else:
+                img_color, img_depth, data_skeleton = \
+                    self._collect_per_call(request)
+            for key, flag, data in zip(['color', 'depth', 'skeleton'],
+                                       request,
+                                       [img_color, img_depth, data_skeleton]):
+                if flag and data is not None:
+                    self._stats[key].tick()
         # transmitting depth images sometimes fails
         if depth and img_depth is None:
-            return self.collect_data(color=color, depth=depth, skeleton=skeleton)
+            return self._collect(color=color, depth=depth, skeleton=skeleton)
         return img_color, img_depth, data_skeleton
 
-    def estimate_hands_positions(self):
+    def _grab(self):
+        """Main loop of the frame grabber thread. Keep fetching the requested
+        data streams and put them into the latest frame slots.
+
+        :return:
+        """
+        color, depth, skeleton = self._grab_streams
+        while not self._grab_stop.is_set() and not rospy.is_shutdown():
+            # Python locks are not fair, let waiting callers go first
+            with self._waiting:
+                while self._n_waiting > 0 and not self._grab_stop.is_set():
+                    self._waiting.wait(0.1)
+            try:
+                with self._lock:
+                    data = self._collect(color=color, depth=depth,
+                                         skeleton=skeleton)
+            except (RuntimeError, ValueError) as e:
+                self._logger.warning("Frame grabber failed to collect data "
+                                     "({}).".format(e))
+                self._grab_stop.wait(1.0)
+                continue
+            except Exception as e:
+                self._logger.exception("Unexpected error in frame grabber "
+                                       "({}).".format(e))
+                self._grab_stop.wait(1.0)
+                continue
+            stamp = time.time()
+            for key, flag, frame in zip(['color', 'depth', 'skeleton'],
+                                        self._grab_streams, data):
+                if flag and frame is not None:
+                    self._slots[key].put(frame, stamp)
+
+    def start_grabber(self, color=True, depth=False, skeleton=True):
+        """Start a background thread that keeps fetching the requested data
+        streams from the Kinect V2 sensor into latest frame slots.
+
+        :param color: Whether to grab color images.
+        :param depth: Whether to grab depth images.
+        :param skeleton: Whether to grab skeleton data.
+        :return:
+        """
+        self.stop_grabber()
+        self._grab_streams = (color, depth, skeleton)
+        self._grab_stop.clear()
+        self._grabber = threading.Thread(target=self._grab, name='kinect_grabber')
+        self._grabber.daemon = True
+        self._grabber.start()
+        self._logger.info("Started frame grabber for {}.".format(
+            ', '.join(k for k, f in zip(['color', 'depth', 'skeleton'],
+                                        self._grab_streams) if f)))
+
+    def stop_grabber(self):
+        """Stop the background frame grabber thread, if it is running.
+
+        :return:
+        """
+        if self._grabber is None:
+            return
+        self._grab_stop.set()
+        self._grabber.join(timeout=5.0)
+        self._grabber = None
+        self._grab_streams = (False, False, False)
+        self._logger.info("Stopped frame grabber.")
+
+    def _is_grabbed(self, color, depth, skeleton):
+        """Whether all requested data streams are fetched by the running
+        frame grabber.
+        """
+        return (self._grabber is not None and
+                all(g or not r for r, g in zip([color, depth, skeleton],
+                                               self._grab_streams)))
+
+    def latest(self, stream):
+        """Return the latest frame of a data stream fetched by the frame
+        grabber immediately.
+
+        :param stream: The data stream <'color', 'depth', 'skeleton'>.
+        :return: A tuple (frame, capture time stamp in s). The frame is None
+            if no frame was received yet.
+        """
+        return self._slots[stream].latest()
+
+    def wait_newer_than(self, stream, stamp, timeout=None):
+        """Wait for a frame of a data stream fetched by the frame grabber that
+        was captured after the given time stamp.
+
+        :param stream: The data stream <'color', 'depth', 'skeleton'>.
+        :param stamp: The time stamp (in s) the frame needs to be newer than.
+        :param timeout: The maximum time to wait in s. If None, wait forever.
+        :return: A tuple (frame, capture time stamp in s).
+        :raise RuntimeError: If no newer frame arrived within the timeout.
+        """
+        return self._slots[stream].wait_newer_than(stamp=stamp, timeout=timeout)
+
+    def _grabbed_data(self, color, depth, skeleton, newer_than, timeout=2.0):
+        """Read a set of frames from the latest frame slots of the frame
+        grabber. Frames fetched in one go share the same time stamp, such
+        that waiting for all of them yields consistent data.
+
+        :param color: Whether to return the latest color image.
+        :param depth: Whether to return the latest depth image.
+        :param skeleton: Whether to return the latest skeleton data.
+        :param newer_than: The time stamp (in s) the frames need to be newer
+            than.
+        :param timeout: The maximum time to wait for each frame in s.
+        :return: A triple (color image, depth image, skeletons).
+        """
+        data = [None, None, self._empty_skeletons()]
+        stamp = newer_than
+        for i, (key, flag) in enumerate(zip(['color', 'depth', 'skeleton'],
+                                            [color, depth, skeleton])):
+            if flag:
+                frame, stamp = self.wait_newer_than(stream=key, stamp=stamp,
+                                                    timeout=timeout)
+                # the next frame must be from the same fetch
+                stamp -= 1e-6
+                # callers may draw onto the images they get
+                data[i] = np.copy(frame) if key != 'skeleton' else frame
+        return tuple(data)
+
+    def collect_data(self, color=False, depth=False, skeleton=False):
+        """Collect the latest color, depth and skeleton data from the Kinect V2
+        sensor.
+        Note: If the Kinect is connected to a Ubuntu machine, use the native
+        ROS interface using the libfreenect2 and iai_kinect2 libraries. If the
+        Kinect is connected to a Windows machine and runs the ELTE Kinect
+        Windows tool server, communicate via a TCP/IP socket connection.
+        Note: On a persistent, pipelined connection the returned data may be
+        up to n_inflight - 1 frames old.
+        Note: If the frame grabber fetches all requested data streams, the
+        first frames captured after this call are returned.
+
+        :param color: Whether to retrieve the latest color image.
+        :param depth: Whether to retrieve the latest depth image.
+        :param skeleton: Whether to retrieve the latest skeleton data.
+        :return: A triple (color image, depth image, skeletons).
+        """
+        if self._is_grabbed(color=color, depth=depth, skeleton=skeleton):
+            return self._grabbed_data(color=color, depth=depth,
+                                      skeleton=skeleton, newer_than=time.time())
+        with self._waiting:
+            self._n_waiting += 1
+        try:
+            with self._lock:
+                return self._collect(color=color, depth=depth,
+                                     skeleton=skeleton)
+        finally:
+            with self._waiting:
+                self._n_waiting -= 1
+                self._waiting.notify_all()
+
+    def joints_to_robot(self, skeletons):
+        """Transform the camera coordinates of all joints of all bodies into
+        robot coordinates in one go.
+
+        :param skeletons: A (n_bodies, 13, 7) numpy array of skeleton data.
+        :return: A (n_bodies, 13, 3) numpy array of joint positions in robot
+            coordinates.
+        """
+        cam = skeletons[..., :3]
+        return np.dot(cam, self.trafo[:-1, :-1].T) + self.trafo[:-1, -1]
+
+    def point_cloud(self, img_depth, mask=None, roi=None, voxel_size=None,
+                    max_points=None):
+        """Project a Kinect depth image into 3D robot coordinates.
+        The points are moved from the depth into the color sensor frame
+        (using the calibrated RGB--IR extrinsics) before applying the color
+        camera--robot transformation.
+
+        :param img_depth: A depth image.
+        :param mask: An optional boolean mask selecting the depth pixels to
+            project.
+        :param roi: An optional region of interest (x_min, y_min, x_max,
+            y_max) in depth pixels to project.
+        :param voxel_size: If given, the points are downsampled to one point
+            per voxel of this edge length (in meters).
+        :param max_points: If given, at most this many points are returned.
+        :return: A (N, 3) float32 numpy array of positions in robot
+            coordinates.
+        """
+        points = self.depth.point_cloud(img_depth, mask=mask, roi=roi,
+                                        voxel_size=voxel_size,
+                                        max_points=max_points)
+        trafo = self.trafo
+        if self._depth_to_color is not None:
+            rotation, translation = self._depth_to_color
+            depth_to_color = np.eye(4)
+            depth_to_color[:-1, :-1] = rotation
+            depth_to_color[:-1, -1] = translation
+            # the extrinsics are given in the OpenCV convention, whereas
+            # Camera.point_cloud flips the y axis
+            flip = np.diag([1.0, -1.0, 1.0, 1.0])
+            trafo = np.dot(trafo, np.dot(flip, np.dot(depth_to_color, flip)))
+        else:
+            self._logger.warning("No RGB--IR extrinsics calibrated, point "
+                                 "cloud is off by the sensor baseline.")
+        trafo = trafo.astype(np.float32)
+        return np.dot(points, trafo[:-1, :-1].T) + trafo[:-1, -1]
+
+    def joints_to_color(self, skeletons):
+        """Extract the color space (pixel) coordinates of all joints of all
+        bodies, scaled to the resolution of the received color images.
+
+        :param skeletons: A (n_bodies, 13, 7) numpy array of skeleton data.
+        :return: A (n_bodies, 13, 2) numpy array of pixel coordinates.
+        """
+        px_color = skeletons[..., 3:5]
+        if not self._native_ros:
+            # The ELTE KinectOverNetwork tool scales the color image by a
+            # factor of 1/2 (to 960x540). We thus adapt the estimated pixel
+            # coordinates accordingly.
+            px_color = px_color/2.0
+        return px_color
+
+    def hands_positions(self, skeletons):
+        """Extract the hand positions of all tracked bodies.
+
+        :param skeletons: A (n_bodies, 13, 7) numpy array of skeleton data.
+        :return: A dictionary of <'left', 'right'> keys to triplets of
+            (n_bodies, 3) robot coordinates, (n_bodies, 2) color space and
+            (n_bodies, 2) depth space coordinates of the hands.
+        """
+        idxs = [self.joint_type_hand_left, self.joint_type_hand_right]
+        hands = skeletons[:, idxs]
+        pos = self.joints_to_robot(skeletons=hands)
+        px_color = self.joints_to_color(skeletons=hands)
+        px_depth = hands[..., 5:7]
+        return {arm: (pos[:, i], px_color[:, i], px_depth[:, i])
+                for i, arm in enumerate(['left', 'right'])}
+
+    def estimate_hands_positions(self, max_age=0.5):
         """Extract the estimate for the approximate hand position from the
         skeleton data obtained from the Kinect.
+        If the frame grabber fetches color and skeleton data, the latest
+        grabbed frames are used without waiting, unless they are older than
+        max_age.
 
+        :param max_age: The maximum age (in s) of grabbed frames to use.
         :return: One of
-            - A dictionary holding the hand coordinate triplets (camera,
+            - A dictionary holding the hand coordinate triplets (robot,
               color and depth space coordinates) for the left and right hands.
             - None if no skeleton estimate is computed by the Kinect.
         """
-        color, _, skeletons = self.collect_data(color=True, skeleton=True)
+        if self._is_grabbed(color=True, depth=False, skeleton=True):
+            color, _, skeletons = self._grabbed_data(
+                color=True, depth=False, skeleton=True,
+                newer_than=time.time() - max_age)
+        else:
+            color, _, skeletons = self.collect_data(color=True, skeleton=True)
         if len(skeletons) != 1:
             raise ValueError("Need to track exactly one person!")
-        skeleton = skeletons[0]
-        if skeleton is None:
-            estimate = None
-        else:
-            estimate = dict()
-            for arm, idx in zip(['left', 'right'],
-                                [self.joint_type_hand_left,
-                                 self.joint_type_hand_right]):
-                coord, px_color, px_depth = [a[idx] for a in skeleton]
-                # The ELTE KinectOverNetwork tool scales the color image by a
-                # factor of 1/2 (to 960x540). We thus adapt the estimated pixel
-                # coordinates accordingly.
-                px_color = tuple(x/2.0 if not self._native_ros else x
-                                 for x in px_color)
-                pos = tuple(np.dot(self.trafo, list(coord) + [1])[:-1])
-                estimate[arm] = (pos, px_color, px_depth)
-                # visualize estimate
-                ctr = tuple(int(x) for x in px_color)
-                cv2.circle(color, center=ctr, radius=5, color=[255, 0, 0],
-                           thickness=3)
-            self._pub_vis.publish(img_to_imgmsg(img=color))
+        estimate = dict()
+        for arm, (pos, px_color, px_depth) in self.hands_positions(skeletons).items():
+            estimate[arm] = (tuple(pos[0]), tuple(px_color[0]), tuple(px_depth[0]))
+            # visualize estimate
+            ctr = tuple(int(x) for x in px_color[0])
+            cv2.circle(color, center=ctr, radius=5, color=[255, 0, 0],
+                       thickness=3)
+        self._pub_vis.publish(img_to_imgmsg(img=color))
         return estimate
 
     def estimate_hand_position(self, hand):
@@ -385,13 +1067,30 @@ class Kinect(object):
         """
         try:
             est = self.estimate_hands_positions()[hand]
-        except ValueError:
+        except (ValueError, RuntimeError):
+            # no single person tracked or no recent enough frame grabbed
             return None
         if est is None:
             return None
         else:
             return list(est[0])
 
+    @staticmethod
+    def _bbox_center(bbox):
+        """Return the center pixel of a rotated rectangle or bounding box.
+
+        :param bbox: A rotated rectangle ((cx, cy), (w, h), angle) or a
+            bounding box (x_min, y_min, x_max, y_max).
+        :return: The center pixel (px, py).
+        """
+        if len(bbox) == 3:
+            # smallest enclosing rectangle
+            return bbox[0]
+        elif len(bbox) == 4:
+            # bounding box
+            return (bbox[0] + bbox[2])/2.0, (bbox[1] + bbox[3])/2.0
+        raise ValueError("Expected rroi or bounding box, got {}!".format(bbox))
+
     def estimate_object_position(self, img_color, bbox, img_depth):
         """Estimate the approximate position of an object in 3d from a Kinect
         color and corresponding depth image, as well as the bounding box of
@@ -406,16 +1105,32 @@ class Kinect(object):
         """
         if bbox is None:
             return None
+        return list(self.estimate_objects_positions(img_color, [bbox],
+                                                    img_depth, window=1)[0])
 
-        if len(bbox) == 3:
-            # smallest enclosing rectangle
-            px, py = bbox[0]
-        elif len(bbox) == 4:
-            # bounding box
-            px, py = bbox[2] - bbox[0], bbox[3] - bbox[1]
-        else:
-            raise ValueError("Expected rroi or bounding box, got {}!".format(bbox))
-        z_3d = get_depth(img_depth, img_color.shape[:2], (px, py))
-        pos_cam = self.color.projection_pixel_to_camera(pixel=(px, py), z=z_3d)
-        pos_rob = np.dot(self.trafo, pos_cam + [1])[:-1]
-        return list(pos_rob)
+    def estimate_objects_positions(self, img_color, bboxes, img_depth,
+                                   window=5):
+        """Estimate the approximate positions of several objects in 3d from
+        one Kinect color and corresponding depth image, as well as the
+        bounding boxes of the objects detected in the color image.
+
+        :param img_color: A color image.
+        :param bboxes: A list of N bounding boxes of the objects we are
+            interested in in the color image.
+        :param img_depth: A depth image corresponding to the color image.
+        :param window: The size of the window around each bounding box
+            center in the depth image over which the median depth is taken.
+        :return: A (N, 3) numpy array of the approximate object positions in
+            robot coordinates.
+        """
+        pixels = np.array([self._bbox_center(bbox) for bbox in bboxes],
+                          dtype=np.float64).reshape(-1, 2)
+        z = self._registrar.get_depths(img_depth, img_color.shape[:2],
+                                       pixels, window=window)
+        # vectorized Camera.projection_pixel_to_camera
+        cam_mat = self.color.camera_matrix
+        pos_cam = np.ones((len(pixels), 4))
+        pos_cam[:, 0] = z*(pixels[:, 0] - cam_mat[0, 2])/cam_mat[0, 0]
+        pos_cam[:, 1] = -z*(pixels[:, 1] - cam_mat[1, 2])/cam_mat[1, 1]
+        pos_cam[:, 2] = z
+        return np.dot(pos_cam, self.trafo.T)[:, :-1]
@@ -0,0 +1,141 @@
+# Copyright (c) 2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# Payload encodings for the color and depth images exchanged with the ELTE
+# Kinect Windows tool (or the stand-in server in kinect_server).
+# A codec is specified by a string '<name>[:<parameter>]', e.g., 'jpeg:80'
+# for JPEG compression with quality 80. Available codecs are
+#   - 'jpeg[:quality]': lossy JPEG (the default for color images),
+#   - 'png[:level]': lossless PNG (the default for depth images),
+#   - 'raw': uncompressed pixels, and
+#   - 'zlib[:level]': a fast lossless codec that splits the pixels into byte
+#     planes (high bytes of depth images are highly redundant) before
+#     compressing them with zlib.
+# The raw and zlib payloads start with a little-endian header (height, width,
+# number of channels, bytes per channel).
+
+import numpy as np
+import struct
+import zlib
+
+import cv2
+
+
+default_codecs = {'color': 'jpeg', 'depth': 'png'}
+
+_header = struct.Struct('<HHBB')
+
+
+def parse_codec(spec):
+    """Split a codec specification into name and parameter.
+
+    :param spec: A codec specification '<name>[:<parameter>]'.
+    :return: A tuple (name, parameter), where parameter is an int or None.
+    :raise ValueError: If the codec is unknown or the parameter invalid.
+    """
+    name, _, par = spec.partition(':')
+    if name not in ['jpeg', 'png', 'raw', 'zlib']:
+        raise ValueError("Unknown codec '{}'!".format(spec))
+    if not par:
+        return name, None
+    if name == 'raw':
+        raise ValueError("Codec 'raw' takes no parameter!")
+    try:
+        return name, int(par)
+    except ValueError:
+        raise ValueError("Invalid codec parameter in '{}'!".format(spec))
+
+
+def _split_header(img):
+    img = np.ascontiguousarray(img)
+    h, w = img.shape[:2]
+    n_channels = 1 if img.ndim == 2 else img.shape[2]
+    return _header.pack(h, w, n_channels, img.dtype.itemsize), img
+
+
+def _parse_header(data):
+    h, w, n_channels, itemsize = _header.unpack_from(data.data if isinstance(
+        data, np.ndarray) else data)
+    if itemsize not in (1, 2, 4, 8) or n_channels < 1:
+        raise ValueError("Invalid image header!")
+    dtype = np.dtype('<u{}'.format(itemsize))
+    shape = (h, w) if n_channels == 1 else (h, w, n_channels)
+    return shape, dtype
+
+
+def encode(img, spec):
+    """Encode an image with the given codec.
+
+    :param img: The image to encode.
+    :param spec: The codec specification, see parse_codec.
+    :return: The encoded image as a string.
+    """
+    name, par = parse_codec(spec)
+    if name == 'jpeg':
+        flags = [] if par is None else [cv2.IMWRITE_JPEG_QUALITY, par]
+        return cv2.imencode('.jpg', img, flags)[1].tostring()
+    if name == 'png':
+        flags = [] if par is None else [cv2.IMWRITE_PNG_COMPRESSION, par]
+        return cv2.imencode('.png', img, flags)[1].tostring()
+    header, img = _split_header(img)
+    data = img.astype(img.dtype.newbyteorder('<'), copy=False)
+    if name == 'raw':
+        return header + data.tostring()
+    # byte planes: all first bytes, then all second bytes, ...
+    planes = data.view(np.uint8).reshape(-1, img.dtype.itemsize).T
+    level = 1 if par is None else par
+    return header + zlib.compress(np.ascontiguousarray(planes).tostring(),
+                                  level)
+
+
+def decode(data, spec):
+    """Decode an image encoded with the given codec.
+
+    :param data: The encoded image as a uint8 numpy array.
+    :param spec: The codec specification, see parse_codec.
+    :return: The decoded image (a new array, independent of data) or None
+        if decoding failed.
+    """
+    name, _ = parse_codec(spec)
+    if name == 'jpeg':
+        return cv2.imdecode(data, cv2.IMREAD_COLOR)
+    if name == 'png':
+        return cv2.imdecode(data, cv2.IMREAD_UNCHANGED)
+    try:
+        shape, dtype = _parse_header(data)
+        payload = data[_header.size:]
+        n_bytes = int(np.prod(shape))*dtype.itemsize
+        if name == 'raw':
+            img = np.frombuffer(payload, dtype=dtype,
+                                count=n_bytes//dtype.itemsize)
+            return img.reshape(shape).astype(dtype.newbyteorder('='))
+        planes = np.frombuffer(zlib.decompress(payload), dtype=np.uint8)
+        img = np.empty(n_bytes, dtype=np.uint8)
+        img.reshape(-1, dtype.itemsize)[:] = planes.reshape(dtype.itemsize,
+                                                            -1).T
+        return img.view(dtype).reshape(shape).astype(dtype.newbyteorder('='),
+                                                     copy=False)
+    except (ValueError, TypeError, struct.error, zlib.error):
+        return None
@@ -0,0 +1,333 @@
+# Copyright (c) 2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# A local stand-in for the ELTE Kinect Windows tool (KinectOverNetwork.exe)
+# speaking the same wire protocol. Used for benchmarking and testing the
+# hardware.kinect.Kinect client without the Windows machine.
+
+import logging
+import numpy as np
+import socket
+import struct
+import threading
+import time
+
+import cv2
+
+import kinect_codecs
+
+
+def synthetic_frames(n_frames=30, size_color=(540, 960),
+                     size_depth=(424, 512), n_bodies=1):
+    """Generate a sequence of synthetic Kinect V2 frames: a smooth color
+    gradient with a moving square, a depth ramp with a moving box and
+    randomly walking skeletons.
+
+    :param n_frames: The number of frames to generate.
+    :param size_color: The size (height, width) of the color images.
+    :param size_depth: The size (height, width) of the depth images.
+    :param n_bodies: The number of bodies (skeletons) per frame.
+    :return: A list of n_frames triples (color image, depth image,
+        skeletons), where the skeletons are a (n_bodies, 13, 7) float32
+        numpy array.
+    """
+    hc, wc = size_color
+    hd, wd = size_depth
+    gx, gy = np.meshgrid(np.linspace(0, 255, wc), np.linspace(0, 255, hc))
+    background = np.dstack([gx, gy, 255 - gx]).astype(np.uint8)
+    ramp = np.tile(np.linspace(500, 4500, hd)[:, np.newaxis], (1, wd))
+    ramp = ramp.astype(np.uint16)
+    skeletons = np.zeros((n_bodies, 13, 7), dtype=np.float32)
+    skeletons[..., 2] = 2.0
+    frames = list()
+    for i in range(n_frames):
+        color = background.copy()
+        x = int((wc - 100)*(0.5 + 0.5*np.sin(2*np.pi*i/n_frames)))
+        cv2.rectangle(color, (x, hc//2 - 50), (x + 100, hc//2 + 50),
+                      (0, 0, 255), -1)
+        depth = ramp.copy()
+        x = int((wd - 50)*(0.5 + 0.5*np.sin(2*np.pi*i/n_frames)))
+        depth[hd//2 - 25:hd//2 + 25, x:x + 50] = 1000
+        skeletons = skeletons + np.random.normal(
+            scale=0.005, size=skeletons.shape).astype(np.float32)
+        frames.append((color, depth, skeletons.copy()))
+    return frames
+
+
+def load_recording(filename):
+    """Load frames previously recorded with save_recording.
+
+    :param filename: The npz file holding the recorded frames.
+    :return: A list of triples (color image, depth image, skeletons).
+    """
+    with np.load(filename) as rec:
+        color = rec['color']
+        depth = rec['depth']
+        skeletons = rec['skeletons']
+        n_bodies = rec['n_bodies']
+    return [(c, d, s[:n]) for c, d, s, n in zip(color, depth, skeletons,
+                                                n_bodies)]
+
+
+def save_recording(filename, frames):
+    """Save frames such that they can be replayed by the stand-in server.
+
+    :param filename: The npz file to write.
+    :param frames: A list of triples (color image, depth image, skeletons).
+    :return:
+    """
+    n_bodies = np.array([len(s) for _, _, s in frames], dtype=np.int32)
+    skeletons = np.zeros((len(frames), max(n_bodies.max(), 1), 13, 7),
+                         dtype=np.float32)
+    for i, (_, _, s) in enumerate(frames):
+        skeletons[i, :len(s)] = s
+    np.savez(filename,
+             color=np.array([c for c, _, _ in frames]),
+             depth=np.array([d for _, d, _ in frames]),
+             skeletons=skeletons, n_bodies=n_bodies)
+
+
+class KinectServer(object):
+    def __init__(self, frames, host='127.0.0.1', port=9999, latency=0.0,
+                 bandwidth=None, jpeg_quality=90):
+        """Stand-in for the ELTE Kinect Windows tool. Replays the given frames
+        over TCP/IP using the KinectOverNetwork wire protocol:
+          - The client sends a request line '<color><depth><skeleton>\\n',
+            e.g., '101\\n' for color and skeleton data.
+          - For each requested stream the server sends a little-endian int32
+            payload size and waits for the ACK 'OK\\n'. Skeleton data
+            additionally send a little-endian uint32 number of bodies,
+            acknowledged by 'OK\\n'.
+          - Then the server sends the payload (JPEG color image, PNG depth
+            image or float32 skeleton data) and waits for the ACK 'OK2\\n'.
+        Connections are kept open for further requests, and request lines
+        arriving while an ACK is expected are queued (pipelining).
+        Additionally, a client may request other payload encodings (see
+        kinect_codecs) right after connecting by sending
+        'CODEC color=<codec> depth=<codec>\n', answered by 'OK\n' or
+        'ERR\n'.
+
+        :param frames: A list of triples (color image, depth image,
+            skeletons) to replay, see synthetic_frames and load_recording.
+        :param host: The host name or IP to listen on.
+        :param port: The port to listen on. If 0, a free port is chosen.
+        :param latency: The delay in s before answering a request, e.g., to
+            simulate frame capture and encoding.
+        :param bandwidth: The maximum bandwidth in bytes per second for
+            sending payloads. If None, the bandwidth is not limited.
+        :param jpeg_quality: The JPEG quality used to encode color images
+            by default.
+        """
+        self._logger = logging.getLogger('main.kinect_server')
+        self._latency = latency
+        self._bandwidth = bandwidth
+        self._chunk = 64*1024
+        self._frames = frames
+        self._default_codecs = {'color': 'jpeg:{}'.format(jpeg_quality),
+                                'depth': 'png'}
+        # The frames are encoded once per codec, such that the encoding time
+        # does not distort the measurements on the client side.
+        self._encoded = dict()
+        self._skeletons = list()
+        for _, _, skeletons in frames:
+            skeletons = np.ascontiguousarray(skeletons, dtype='<f4')
+            self._skeletons.append((len(skeletons), skeletons.tostring()))
+        for stream, codec in self._default_codecs.items():
+            self._payloads(stream, codec)
+        self._index = 0
+        self._lock = threading.Lock()
+
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(5)
+        self.host, self.port = self._server.getsockname()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _payloads(self, stream, codec):
+        """Return the (cached) encoded images of a data stream.
+
+        :param stream: The data stream <'color', 'depth'>.
+        :param codec: The codec specification, see kinect_codecs.
+        :return: A list of encoded images, one per frame.
+        """
+        key = (stream, codec)
+        if key not in self._encoded:
+            index = 0 if stream == 'color' else 1
+            self._encoded[key] = [kinect_codecs.encode(frame[index], codec)
+                                  for frame in self._frames]
+        return self._encoded[key]
+
+    def start(self):
+        """Start accepting connections in a background thread.
+
+        :return:
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._accept,
+                                        name='kinect_server')
+        self._thread.daemon = True
+        self._thread.start()
+        self._logger.info("Serving {} frames on {}:{}.".format(
+            len(self._frames), self.host, self.port))
+
+    def stop(self):
+        """Stop accepting connections.
+
+        :return:
+        """
+        self._stop.set()
+        try:
+            self._server.close()
+        except socket.error:
+            pass
+
+    def _accept(self):
+        while not self._stop.is_set():
+            try:
+                conn, address = self._server.accept()
+            except socket.error:
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            handler = threading.Thread(target=self._serve, args=(conn,))
+            handler.daemon = True
+            handler.start()
+
+    def _next_frame(self):
+        with self._lock:
+            index = self._index
+            self._index = (self._index + 1) % len(self._frames)
+        return index
+
+    def _negotiate(self, line):
+        """Parse a codec request 'CODEC color=<codec> depth=<codec>\\n'.
+
+        :param line: The request line.
+        :return: A dictionary of data stream keys to codecs.
+        :raise ValueError: If the request is invalid.
+        """
+        codecs = dict(self._default_codecs)
+        for item in line.split()[1:]:
+            stream, _, codec = item.partition('=')
+            if stream not in codecs:
+                raise ValueError("Unknown data stream '{}'!".format(stream))
+            name, _ = kinect_codecs.parse_codec(codec)
+            if stream == 'depth' and name == 'jpeg':
+                raise ValueError("Cannot encode depth images as JPEG!")
+            if codec == 'jpeg':
+                codec = self._default_codecs['color']
+            codecs[stream] = codec
+        with self._lock:
+            for stream, codec in codecs.items():
+                self._payloads(stream, codec)
+        return codecs
+
+    @staticmethod
+    def _read_line(conn, buf):
+        """Read one line from the connection.
+
+        :param conn: The connected socket.
+        :param buf: A list holding bytes received but not yet consumed.
+        :return: The line including the trailing newline or None if the
+            connection was closed.
+        """
+        data = buf[0] if buf else ''
+        while '\n' not in data:
+            chunk = conn.recv(1024)
+            if not chunk:
+                return None
+            data += chunk
+        line, rest = data.split('\n', 1)
+        buf[:] = [rest]
+        return line + '\n'
+
+    def _wait_for_ack(self, conn, buf, queue, ack):
+        """Wait for an ACK, queueing request lines received in between.
+
+        :raise socket.error: If the connection was closed or the client sent
+            something unexpected.
+        """
+        while True:
+            line = self._read_line(conn, buf)
+            if line is None:
+                raise socket.error("Connection closed by client!")
+            if line == ack:
+                return
+            if len(line) == 4 and line[:3].strip('01') == '':
+                queue.append(line)
+            else:
+                raise socket.error("Expected {!r}, got {!r}!".format(ack, line))
+
+    def _send(self, conn, data):
+        """Send data, optionally limited to the configured bandwidth."""
+        if self._bandwidth is None:
+            conn.sendall(data)
+            return
+        start = time.time()
+        for i in range(0, len(data), self._chunk):
+            conn.sendall(data[i:i + self._chunk])
+            ahead = (i + self._chunk)/float(self._bandwidth) - (time.time() - start)
+            if ahead > 0.0:
+                time.sleep(ahead)
+
+    def _serve(self, conn):
+        """Answer requests on one connection until the client closes it."""
+        buf = list()
+        queue = list()
+        codecs = dict(self._default_codecs)
+        try:
+            while not self._stop.is_set():
+                line = queue.pop(0) if queue else self._read_line(conn, buf)
+                if line is None:
+                    break
+                if line.startswith('CODEC'):
+                    try:
+                        codecs = self._negotiate(line)
+                        conn.sendall('OK\n')
+                    except ValueError as e:
+                        self._logger.warning(str(e))
+                        conn.sendall('ERR\n')
+                    continue
+                if self._latency > 0.0:
+                    time.sleep(self._latency)
+                index = self._next_frame()
+                color = self._payloads('color', codecs['color'])[index]
+                depth = self._payloads('depth', codecs['depth'])[index]
+                n_bodies, skeleton = self._skeletons[index]
+                for flag, payload in zip(line[:3], [color, depth, skeleton]):
+                    if flag != '1':
+                        continue
+                    conn.sendall(struct.pack('<i', len(payload)))
+                    self._wait_for_ack(conn, buf, queue, 'OK\n')
+                    if payload is skeleton:
+                        conn.sendall(struct.pack('<I', n_bodies))
+                        self._wait_for_ack(conn, buf, queue, 'OK\n')
+                    self._send(conn, payload)
+                    self._wait_for_ack(conn, buf, queue, 'OK2\n')
+        except socket.error as e:
+            self._logger.debug("Connection closed ({}).".format(e))
+        finally:
+            conn.close()
@@ -0,0 +1,101 @@
+# Copyright (c) 2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import threading
+import time
+
+
+class MotionHandle(object):
+    def __init__(self, arm, target=None):
+        """Future-like handle of a motion of one limb that is executed in
+        the background, see Baxter.control_async.
+
+        :param arm: The arm <'left', 'right'> that is moving.
+        :param target: The final configuration of the motion (dictionary of
+            joint name keys to joint angles), if known.
+        """
+        self.arm = arm
+        self.target = target
+        self.start_time = time.time()
+        self.end_time = None
+        # the commanded duration of the motion in s, if known
+        self.planned_duration = None
+        self._done = threading.Event()
+        self._cancelled = threading.Event()
+        self._error = None
+
+    def done(self):
+        """Whether the motion has finished (completed, cancelled or failed).
+
+        :return: Boolean flag.
+        """
+        return self._done.is_set()
+
+    def cancelled(self):
+        """Whether cancellation of the motion was requested.
+
+        :return: Boolean flag.
+        """
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Request the motion to stop. The limb is held at the configuration
+        it is in when the request is noticed.
+
+        :return: False if the motion had already finished, True otherwise.
+        """
+        self._cancelled.set()
+        return not self.done()
+
+    def wait(self, timeout=None):
+        """Wait for the motion to finish.
+
+        :param timeout: The maximum time to wait in seconds. If None, wait
+            until the motion has finished.
+        :return: True if the motion has finished, False on timeout.
+        :raise: The exception raised while executing the motion, if any.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        # wait in slices, such that the main thread stays interruptible
+        while not self._done.is_set():
+            remaining = 0.1 if deadline is None else min(0.1, deadline - time.time())
+            if remaining <= 0:
+                break
+            self._done.wait(remaining)
+        if self._done.is_set() and self._error is not None:
+            raise self._error
+        return self._done.is_set()
+
+    def duration(self):
+        """The duration of the motion so far (or in total, if it finished).
+
+        :return: The duration in seconds.
+        """
+        return (self.end_time or time.time()) - self.start_time
+
+    def _finish(self, error=None):
+        self._error = error
+        self.end_time = time.time()
+        self._done.set()
@@ -0,0 +1,178 @@
+# Copyright (c) 2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+from collections import deque
+import logging
+import threading
+import time
+
+import numpy as np
+
+import rospy
+from sensor_msgs.msg import Range
+
+
+def reject_outliers(values, threshold=3.0, min_deviation=0.001):
+    """Remove outliers based on the median absolute deviation (MAD).
+
+    :param values: A (N,) array-like of values.
+    :param threshold: Values deviating more than threshold times the
+        standard deviation estimated from the MAD from the median are
+        outliers.
+    :param min_deviation: Lower bound on the estimated standard deviation,
+        such that quantized, (almost) identical values are kept.
+    :return: A numpy array of the remaining values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    median = np.median(values)
+    sigma = max(1.4826*np.median(np.abs(values - median)), min_deviation)
+    return values[np.abs(values - median) <= threshold*sigma]
+
+
+class RangeSensor(object):
+    def __init__(self, arm, prefix, buffer_size=100):
+        """Stream of the measurements of the infrared range sensor in one of
+        the hands of the Baxter robot.
+
+        :param arm: The arm <'left', 'right'> whose sensor to read.
+        :param prefix: The prefix for the logger name to use.
+        :param buffer_size: The number of most recent measurements to keep
+            in the ring buffer filled by the range topic subscriber.
+        """
+        self._topic = '/robot/range/{}_hand_range/state'.format(arm)
+        # The subscriber is created on first use and kept alive, filling a
+        # ring buffer of (time of reception, distance) tuples. Out-of-range
+        # measurements are kept as NaN. The time of reception is used
+        # instead of the header time stamp, such that freshness is judged by
+        # the clock of this machine, independent of the robot's clock.
+        self._subscriber = None
+        self._buffer = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+
+        self._logger = logging.getLogger('{}.range.{}'.format(prefix, arm))
+
+    def subscribe(self):
+        """Subscribe to the range topic, if not done yet. From then on the
+        ring buffer holds the most recent measurements.
+
+        :return:
+        """
+        if self._subscriber is None:
+            self._subscriber = rospy.Subscriber(self._topic, Range,
+                                                self._callback, queue_size=10)
+
+    def unsubscribe(self):
+        """Unsubscribe from the range topic and clear the ring buffer.
+
+        :return:
+        """
+        if self._subscriber is not None:
+            self._subscriber.unregister()
+            self._subscriber = None
+        with self._cond:
+            self._buffer.clear()
+
+    def _callback(self, msg):
+        stamp = rospy.get_time()
+        distance = msg.range
+        if not msg.min_range <= distance <= msg.max_range:
+            distance = np.nan
+        with self._cond:
+            self._buffer.append((stamp, distance))
+            self._cond.notify_all()
+
+    def latest(self, max_age=None):
+        """Return the most recent measurement immediately.
+
+        :param max_age: The maximum age of the measurement in s. If None,
+            any age is accepted.
+        :return: A tuple (distance in m, time of reception). The distance
+            is None if no (sufficiently recent) measurement was received yet
+            or the measurement is out of range.
+        """
+        self.subscribe()
+        with self._cond:
+            if not self._buffer:
+                return None, 0.0
+            stamp, distance = self._buffer[-1]
+        if max_age is not None and rospy.get_time() - stamp > max_age:
+            return None, stamp
+        if np.isnan(distance):
+            return None, stamp
+        return distance, stamp
+
+    def sample(self, n, timeout=1.0, newer_than=None):
+        """Wait for a number of valid (in range) measurements.
+
+        :param n: The number of measurements (at most the size of the ring
+            buffer).
+        :param timeout: The maximum time to wait in s.
+        :param newer_than: The time (in s, see rospy.get_time) after which
+            the measurements need to be received. If None, only measurements received after calling
+            this method are used, e.g., after the limb came to rest.
+        :return: A (n,) numpy array of distances in m, oldest first.
+        :raise RuntimeError: If not enough valid measurements arrived within
+            the timeout.
+        """
+        if n > self._buffer.maxlen:
+            raise ValueError("Can sample at most {} measurements, got "
+                             "{}!".format(self._buffer.maxlen, n))
+        self.subscribe()
+        if newer_than is None:
+            newer_than = rospy.get_time()
+        end = time.time() + timeout
+        with self._cond:
+            while True:
+                entries = [d for s, d in self._buffer if s > newer_than]
+                valid = [d for d in entries if not np.isnan(d)]
+                if len(valid) >= n:
+                    return np.array(valid[-n:])
+                remaining = end - time.time()
+                if remaining <= 0.0:
+                    msg = ("Got {} valid of {} measurements from {} within {} "
+                           "s, need {}.".format(len(valid), len(entries),
+                                                self._topic, timeout, n))
+                    self._logger.error(msg)
+                    raise RuntimeError(msg)
+                self._cond.wait(remaining)
+
+    def robust_mean(self, window, timeout=1.0, threshold=3.0):
+        """Wait for a number of valid measurements (see sample) and compute
+        their mean after rejecting outliers (see reject_outliers).
+
+        :param window: The number of measurements to average.
+        :param timeout: The maximum time to wait in s.
+        :param threshold: The outlier threshold, see reject_outliers.
+        :return: The mean distance in m.
+        :raise RuntimeError: If not enough valid measurements arrived within
+            the timeout.
+        """
+        distances = self.sample(n=window, timeout=timeout)
+        inliers = reject_outliers(distances, threshold=threshold)
+        if len(inliers) < len(distances):
+            self._logger.debug("Rejected {} of {} measurements as "
+                               "outliers.".format(len(distances) - len(inliers),
+                                                  len(distances)))
+        return float(np.mean(inliers))
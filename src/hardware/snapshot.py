@@ -0,0 +1,76 @@
+# Copyright (c) 2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import time
+
+import numpy as np
+
+
+class KinematicSnapshot(object):
+    def __init__(self, arm, config, endpoint_pose, hom_gripper,
+                 hom_cam_in_grip, hom_to_pose, motion=None):
+        """Kinematic state of one limb captured at one point in time, such
+        that all computations within one control tick (e.g., one iteration
+        of visual servoing) use the same, once computed transformations.
+        See Baxter.snapshot.
+
+        :param arm: The arm <'left', 'right'>.
+        :param config: Dictionary of joint name keys to joint angles.
+        :param endpoint_pose: The pose of the end effector as a list
+            [x, y, z, roll, pitch, yaw].
+        :param hom_gripper: The homogeneous transformation matrix relating
+            gripper coordinates to robot coordinates (a 4x4 numpy array).
+        :param hom_cam_in_grip: The fixed homogeneous transformation matrix
+            relating camera coordinates to gripper coordinates.
+        :param hom_to_pose: Function converting a homogeneous transformation
+            matrix into a pose [x, y, z, roll, pitch, yaw].
+        :param motion: The MotionHandle of the latest motion of the limb at
+            capture time, if any.
+        """
+        self.arm = arm
+        self.stamp = time.time()
+        self.motion = motion
+        self.config = config
+        self.endpoint_pose = endpoint_pose
+        self.hom_gripper = hom_gripper
+        self.hom_camera = np.dot(hom_gripper, hom_cam_in_grip)
+        self.camera_pose = hom_to_pose(self.hom_camera)
+
+    def valid(self, motion, max_age):
+        """Whether the snapshot still describes the state of the limb, i.e.,
+        no motion was started since and it is not older than max_age.
+
+        :param motion: The MotionHandle of the latest motion of the limb, if
+            any.
+        :param max_age: The maximum age of the snapshot in s.
+        :return: Boolean flag.
+        """
+        if motion is not self.motion:
+            return False
+        if motion is not None and (motion.end_time is None or
+                                   motion.end_time > self.stamp):
+            # captured while the limb was moving
+            return False
+        return time.time() - self.stamp <= max_age
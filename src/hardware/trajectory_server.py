@@ -0,0 +1,120 @@
+# Copyright (c) 2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# A local stand-in for the joint trajectory action server of the Baxter SDK
+# (baxter_interface/joint_trajectory_action_server.py). Used for testing
+# the 'action' control backend of hardware.baxter.Baxter without the robot.
+
+import threading
+
+import actionlib
+import numpy as np
+import rospy
+from control_msgs.msg import (
+    FollowJointTrajectoryAction,
+    FollowJointTrajectoryFeedback,
+    FollowJointTrajectoryResult
+)
+
+
+class TrajectoryActionServer(object):
+    def __init__(self, arm, time_scale=1.0, lag=0.05, rate=100.0):
+        """Stand-in for the joint trajectory action server of one Baxter
+        limb. Goals are 'executed' by interpolating the trajectory points
+        over time, without moving anything. The (simulated) joint angles
+        follow the desired ones with a delay.
+
+        :param arm: The arm <'left', 'right'> to serve.
+        :param time_scale: Factor to stretch the execution time with, e.g.,
+            to simulate a limb that is slower than commanded.
+        :param lag: The delay in s of the simulated joint angles behind the
+            desired ones.
+        :param rate: The rate in Hz at which feedback is published.
+        """
+        self.arm = arm
+        self.time_scale = time_scale
+        self.lag = lag
+        self.rate = rate
+        self.positions = dict()
+        self._lock = threading.Lock()
+        self._server = actionlib.SimpleActionServer(
+            'robot/limb/%s/follow_joint_trajectory' % arm,
+            FollowJointTrajectoryAction, execute_cb=self._execute,
+            auto_start=False)
+
+    def start(self):
+        """Start serving goals."""
+        self._server.start()
+
+    def joint_angles(self):
+        """The simulated joint angles.
+
+        :return: Dictionary of joint name keys to joint angles.
+        """
+        with self._lock:
+            return dict(self.positions)
+
+    def _execute(self, goal):
+        names = list(goal.trajectory.joint_names)
+        points = goal.trajectory.points
+        result = FollowJointTrajectoryResult()
+        if not points or not all(n.startswith(self.arm + '_') for n in names):
+            result.error_code = FollowJointTrajectoryResult.INVALID_JOINTS
+            self._server.set_aborted(result)
+            return
+        with self._lock:
+            start = [self.positions.get(n, p)
+                     for n, p in zip(names, points[0].positions)]
+        times = np.array([0.0] + [p.time_from_start.to_sec() for p in points])
+        positions = np.array([start] + [list(p.positions) for p in points])
+
+        def interpolate(t):
+            return [float(np.interp(t, times, positions[:, j]))
+                    for j in range(len(names))]
+
+        feedback = FollowJointTrajectoryFeedback()
+        feedback.joint_names = names
+        r = rospy.Rate(self.rate)
+        t_start = rospy.get_time()
+        while not rospy.is_shutdown():
+            t = (rospy.get_time() - t_start)/self.time_scale
+            if self._server.is_preempt_requested():
+                self._server.set_preempted()
+                return
+            desired = interpolate(t)
+            actual = interpolate(t - self.lag)
+            with self._lock:
+                self.positions.update(zip(names, actual))
+            feedback.header.stamp = rospy.Time.now()
+            feedback.desired.positions = desired
+            feedback.actual.positions = actual
+            feedback.error.positions = [d - a for d, a in zip(desired, actual)]
+            feedback.desired.time_from_start = rospy.Duration(t)
+            self._server.publish_feedback(feedback)
+            if t - self.lag >= times[-1]:
+                break
+            r.sleep()
+        result.error_code = FollowJointTrajectoryResult.SUCCESSFUL
+        self._server.set_succeeded(result)
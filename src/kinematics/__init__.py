@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+"""Module for the kinematics of the Baxter research robot.
+
+Implements forward and inverse kinematics of the Baxter limbs in pure NumPy,
+built from the kinematic model in models/baxter/baxter_kinematics.urdf.
+That is, no ROS service (and no running robot) is needed to compute them.
+"""
+
+from chain import (
+    KinematicChain,
+    load_urdf
+)
+
+from ik import IKSolver
+
+from reachability import (
+    ReachabilityMap,
+    build_reachability_map,
+    load_reachability_map
+)
+
+from transformations import (
+    hom_to_pose,
+    pose_to_hom
+)
@@ -0,0 +1,289 @@
+# Copyright (c) 2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+
+from transformations import axis_angle_to_matrix, rpy_to_matrix
+
+
+def _parse_floats(text, default):
+    if text is None:
+        return list(default)
+    return [float(v) for v in text.split()]
+
+
+def load_urdf(filename):
+    """Parse the joints of a URDF robot description.
+    Only the kinematic information (joint type, parent and child link,
+    origin, axis and limits) is read.
+
+    :param filename: The URDF file to read.
+    :return: A dictionary of joint name keys to dictionaries with keys
+        'type', 'parent', 'child', 'origin' (a (4, 4) numpy array), 'axis',
+        'lower', 'upper' and 'velocity'.
+    :raise ValueError: if the file does not describe a robot.
+    """
+    root = ElementTree.parse(filename).getroot()
+    if root.tag != 'robot':
+        raise ValueError("'{}' is not a URDF robot description!".format(filename))
+    joints = dict()
+    for joint in root.findall('joint'):
+        origin = joint.find('origin')
+        xyz = _parse_floats(None if origin is None else origin.get('xyz'),
+                            [0., 0., 0.])
+        rpy = _parse_floats(None if origin is None else origin.get('rpy'),
+                            [0., 0., 0.])
+        hom = np.eye(4)
+        hom[:3, :3] = rpy_to_matrix(*rpy)
+        hom[:3, 3] = xyz
+        axis = joint.find('axis')
+        axis = np.array(_parse_floats(None if axis is None else axis.get('xyz'),
+                                      [1., 0., 0.]))
+        limit = joint.find('limit')
+        if limit is None:
+            limit = dict()
+        joints[joint.get('name')] = {
+            'type': joint.get('type'),
+            'parent': joint.find('parent').get('link'),
+            'child': joint.find('child').get('link'),
+            'origin': hom,
+            'axis': axis/np.linalg.norm(axis),
+            'lower': float(limit.get('lower', -np.pi)),
+            'upper': float(limit.get('upper', np.pi)),
+            'velocity': float(limit.get('velocity', np.inf))
+        }
+    return joints
+
+
+def _walk(by_child, base, tip):
+    """Find the joints connecting two links.
+
+    :param by_child: Dictionary of child link keys to (joint name, joint)
+        tuples.
+    :param base: The name of the link to start at.
+    :param tip: The name of the link to end at.
+    :return: The list of (joint name, joint) tuples from base to tip.
+    :raise ValueError: if there is no chain from base to tip.
+    """
+    chain = list()
+    link = tip
+    while link != base:
+        if link not in by_child:
+            raise ValueError("No kinematic chain from '{}' to '{}'!".format(
+                base, tip))
+        chain.append(by_child[link])
+        link = by_child[link][1]['parent']
+    chain.reverse()
+    return chain
+
+
+class KinematicChain(object):
+    def __init__(self, joints, base, tip, frames=None):
+        """Serial kinematic chain of revolute joints between two links of a
+        robot description, with forward kinematics and Jacobians computed
+        for many configurations at once.
+
+        :param joints: The joints of the robot, as returned by load_urdf.
+        :param base: The name of the link the chain starts at.
+        :param tip: The name of the link the chain ends at.
+        :param frames: Optional list of names of further links rigidly
+            attached to the last revolute joint of the chain (e.g., sensors
+            on the hand), whose poses are computed along with the tip.
+        :raise ValueError: if there is no chain from base to tip or it
+            contains joints other than fixed and revolute ones, or if one
+            of the frames is not rigidly attached to the chain.
+        """
+        by_child = {j['child']: (name, j) for name, j in joints.items()}
+        chain = _walk(by_child, base, tip)
+
+        self.base = base
+        self.tip = tip
+        self.joint_names = list()
+        self.axes = list()
+        # fixed transform preceding each revolute joint and following the last
+        self._origins = list()
+        origin = np.eye(4)
+        for name, joint in chain:
+            origin = np.dot(origin, joint['origin'])
+            if joint['type'] == 'fixed':
+                continue
+            if joint['type'] != 'revolute':
+                raise ValueError("Joint '{}' is of unsupported type '{}'!".format(
+                    name, joint['type']))
+            self.joint_names.append(name)
+            self.axes.append(joint['axis'])
+            self._origins.append(origin)
+            origin = np.eye(4)
+        self._tip_offset = origin
+        # the link moved by the last revolute joint
+        link = base
+        for name, joint in reversed(chain):
+            if joint['type'] == 'revolute':
+                link = joint['child']
+                break
+        self._offsets = {tip: self._tip_offset}
+        for frame in frames or list():
+            offset = np.eye(4)
+            for name, joint in _walk(by_child, link, frame):
+                if joint['type'] != 'fixed':
+                    raise ValueError("Link '{}' is not rigidly attached to "
+                                     "'{}'!".format(frame, link))
+                offset = np.dot(offset, joint['origin'])
+            self._offsets[frame] = offset
+        self.lower = np.array([joints[n]['lower'] for n in self.joint_names])
+        self.upper = np.array([joints[n]['upper'] for n in self.joint_names])
+        self.velocity = np.array([joints[n]['velocity'] for n in self.joint_names])
+
+    @property
+    def n_joints(self):
+        return len(self.joint_names)
+
+    def config_to_array(self, config):
+        """Convert one or a number of configurations into an array of joint
+        angles.
+
+        :param config: Dictionary of joint name keys to joint angles, or a
+            list of N such dictionaries.
+        :return: A (n_joints,) or (N, n_joints) numpy array.
+        """
+        if isinstance(config, dict):
+            return np.array([config[n] for n in self.joint_names],
+                            dtype=np.float64)
+        return np.array([[c[n] for n in self.joint_names] for c in config],
+                        dtype=np.float64).reshape((-1, self.n_joints))
+
+    def array_to_config(self, angles):
+        """Convert an array of joint angles into a configuration.
+
+        :param angles: A (n_joints,) array-like of joint angles.
+        :return: Dictionary of joint name keys to joint angles.
+        """
+        return dict(zip(self.joint_names, [float(a) for a in angles]))
+
+    @property
+    def frames(self):
+        """The names of the links whose poses can be computed, i.e., the
+        tip and the further frames attached to the chain."""
+        return sorted(self._offsets.keys())
+
+    def offset(self, frame, reference=None):
+        """Get the constant transform relating a frame attached to the chain
+        to another one.
+
+        :param frame: The name of the frame, one of self.frames.
+        :param reference: The name of the frame to relate to, one of
+            self.frames. If None, the tip is used.
+        :return: The homogeneous transform of frame in reference
+            coordinates (a (4, 4) numpy array).
+        """
+        reference = reference or self.tip
+        return np.dot(np.linalg.inv(self._offsets[reference]),
+                      self._offsets[frame])
+
+    def _frames(self, angles):
+        """Compute the transforms of all revolute joint frames (after
+        rotation).
+
+        :param angles: A (N, n_joints) array of joint angles.
+        :return: A (n_joints, N, 4, 4) numpy array.
+        """
+        n = angles.shape[0]
+        hom = np.tile(np.eye(4), (n, 1, 1))
+        rot = np.tile(np.eye(4), (n, 1, 1))
+        frames = np.empty((self.n_joints, n, 4, 4))
+        for k, (origin, axis) in enumerate(zip(self._origins, self.axes)):
+            hom = np.einsum('...ij,jk->...ik', hom, origin)
+            rot[:, :3, :3] = axis_angle_to_matrix(axis, angles[:, k])
+            hom = np.einsum('...ij,...jk->...ik', hom, rot)
+            frames[k] = hom
+        return frames
+
+    def fk_frames(self, angles, frames=None):
+        """Compute the poses of a number of frames attached to the chain for
+        a number of configurations in one pass.
+
+        :param angles: A (n_joints,) or (N, n_joints) array-like of joint
+            angles, in the order of self.joint_names.
+        :param frames: The list of names of the frames to compute, see
+            self.frames. If None, all frames are computed.
+        :return: A dictionary of frame name keys to (4, 4) or (N, 4, 4)
+            numpy arrays of homogeneous transforms in the base link.
+        """
+        q = np.asarray(angles, dtype=np.float64)
+        last = self._frames(np.atleast_2d(q))[-1]
+        poses = dict()
+        for frame in frames or self.frames:
+            hom = np.einsum('...ij,jk->...ik', last, self._offsets[frame])
+            poses[frame] = hom[0] if q.ndim == 1 else hom
+        return poses
+
+    def fk(self, angles, frame=None):
+        """Compute the pose of the tip link (or another frame attached to
+        the chain) for a number of configurations.
+
+        :param angles: A (n_joints,) or (N, n_joints) array-like of joint
+            angles, in the order of self.joint_names.
+        :param frame: The name of the frame, see self.frames. If None, the
+            tip is used.
+        :return: A (4, 4) or (N, 4, 4) numpy array of homogeneous
+            transforms in the base link.
+        """
+        frame = frame or self.tip
+        return self.fk_frames(angles, frames=[frame])[frame]
+
+    def joint_positions(self, angles):
+        """Compute the positions of the revolute joints and of the tip link
+        for a number of configurations, e.g., to approximate the links by
+        the segments between them.
+
+        :param angles: A (N, n_joints) array-like of joint angles.
+        :return: A (N, n_joints + 1, 3) numpy array of positions in the base
+            link.
+        """
+        frames = self._frames(np.asarray(angles, dtype=np.float64))
+        tip = np.einsum('...ij,jk->...ik', frames[-1], self._tip_offset)
+        return np.concatenate([np.transpose(frames[:, :, :3, 3], (1, 0, 2)),
+                               tip[:, np.newaxis, :3, 3]], axis=1)
+
+    def jacobian(self, angles):
+        """Compute the pose of the tip link and the geometric Jacobian for a
+        number of configurations.
+
+        :param angles: A (N, n_joints) array of joint angles.
+        :return: A tuple (tip, jac) of a (N, 4, 4) array of homogeneous
+            transforms of the tip link and a (N, 6, n_joints) array mapping
+            joint velocities to linear and angular velocity of the tip link,
+            both in the base link.
+        """
+        frames = self._frames(np.asarray(angles, dtype=np.float64))
+        tip = np.einsum('...ij,jk->...ik', frames[-1], self._tip_offset)
+        jac = np.empty((tip.shape[0], 6, self.n_joints))
+        for k, axis in enumerate(self.axes):
+            z = np.dot(frames[k, :, :3, :3], axis)
+            jac[:, :3, k] = np.cross(z, tip[:, :3, 3] - frames[k, :, :3, 3])
+            jac[:, 3:, k] = z
+        return tip, jac
@@ -0,0 +1,150 @@
+# Copyright (c) 2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import numpy as np
+
+from transformations import pose_to_hom
+
+
+class IKSolver(object):
+    def __init__(self, chain, n_seeds=8, max_iterations=150, damping=0.05,
+                 tolerance=(1e-3, 1e-2)):
+        """Numerical inverse kinematics solver for a kinematic chain using
+        damped least squares. A batch of poses is solved at once, starting
+        from a number of seed configurations per pose that are all iterated
+        in parallel.
+
+        :param chain: The KinematicChain to solve for.
+        :param n_seeds: The number of seed configurations per pose. The
+            first one is the seed passed to solve (if any), the remaining
+            ones are sampled uniformly within the joint limits.
+        :param max_iterations: The maximum number of iterations.
+        :param damping: The damping factor of the least squares step.
+        :param tolerance: The maximum position (in m) and orientation (in
+            rad) error of a solution.
+        """
+        self.chain = chain
+        self.n_seeds = n_seeds
+        self.max_iterations = max_iterations
+        self.damping = damping
+        self.tolerance = tolerance
+        # largest step in joint space per iteration (in rad)
+        self.max_step = 0.5
+
+    @staticmethod
+    def _error(current, target):
+        """Compute the pose error between current and target poses.
+
+        :param current: A (N, 4, 4) array of homogeneous transforms.
+        :param target: A (N, 4, 4) array of homogeneous transforms.
+        :return: A (N, 6) numpy array of position and orientation errors.
+        """
+        err = np.empty((current.shape[0], 6))
+        err[:, :3] = target[:, :3, 3] - current[:, :3, 3]
+        err[:, 3:] = 0.5*np.sum(np.cross(current[:, :3, :3], target[:, :3, :3],
+                                         axis=1), axis=2)
+        return err
+
+    def _seeds(self, seed):
+        """Create the seed configurations for one pose.
+
+        :param seed: A (n_joints,) array of joint angles or None.
+        :return: A (n_seeds, n_joints) numpy array.
+        """
+        lower, upper = self.chain.lower, self.chain.upper
+        seeds = lower + (upper - lower)*np.random.random_sample(
+            (self.n_seeds, self.chain.n_joints))
+        if seed is not None:
+            seeds[0] = np.clip(seed, lower, upper)
+        return seeds
+
+    def solve_array(self, poses, seed=None):
+        """Solve inverse kinematics for a number of poses.
+
+        :param poses: A list of N poses, each one of
+            - a ROS Pose,
+            - a list of length 6 [x, y, z, roll, pitch, yaw],
+            - a list of length 7 [x, y, z, qx, qy, qz, qw] or
+            - a (4, 4) homogeneous transform.
+        :param seed: An optional (n_joints,) array of joint angles (e.g.,
+            the current configuration) to start from.
+        :return: A tuple (angles, valid), where angles is a (N, n_joints)
+            numpy array of joint angles (NaN where no solution was found)
+            and valid is a (N,) boolean numpy array.
+        """
+        n_poses = len(poses)
+        n_joints = self.chain.n_joints
+        if n_poses == 0:
+            return np.empty((0, n_joints)), np.zeros(0, dtype=bool)
+        targets = np.array([p if isinstance(p, np.ndarray) and p.shape == (4, 4)
+                            else pose_to_hom(p) for p in poses])
+        # all seeds of all poses, pose-major
+        q = np.concatenate([self._seeds(seed) for _ in range(n_poses)])
+        row_pose = np.repeat(np.arange(n_poses), self.n_seeds)
+        targets = targets[row_pose]
+        solved = np.zeros(n_poses, dtype=bool)
+        angles = np.empty((n_poses, n_joints))
+        angles.fill(np.nan)
+
+        eye = (self.damping**2)*np.eye(6)
+        for _ in range(self.max_iterations):
+            rows = np.flatnonzero(~solved[row_pose])
+            if rows.size == 0:
+                break
+            tip, jac = self.chain.jacobian(q[rows])
+            err = self._error(tip, targets[rows])
+            converged = np.logical_and(
+                np.linalg.norm(err[:, :3], axis=1) < self.tolerance[0],
+                np.linalg.norm(err[:, 3:], axis=1) < self.tolerance[1])
+            for r in rows[converged]:
+                if not solved[row_pose[r]]:
+                    solved[row_pose[r]] = True
+                    angles[row_pose[r]] = q[r]
+            jac_t = np.transpose(jac, (0, 2, 1))
+            step = np.einsum('...ij,...jk->...ik', jac_t, np.linalg.solve(
+                np.einsum('...ij,...jk->...ik', jac, jac_t) + eye,
+                err[:, :, np.newaxis]))[:, :, 0]
+            norm = np.linalg.norm(step, axis=1)
+            too_large = norm > self.max_step
+            step[too_large] *= (self.max_step/norm[too_large])[:, np.newaxis]
+            q[rows] = np.clip(q[rows] + step, self.chain.lower, self.chain.upper)
+        return angles, solved
+
+    def solve(self, poses, seed=None):
+        """Solve inverse kinematics for a number of poses.
+
+        :param poses: A list of N poses, see solve_array.
+        :param seed: An optional dictionary of joint name keys to joint
+            angles (e.g., the current configuration) to start from.
+        :return: A tuple (configs, valid), where configs is a list of N
+            dictionaries of joint name keys to joint angles (None where no
+            solution was found) and valid is a (N,) boolean numpy array.
+        """
+        if seed is not None:
+            seed = self.chain.config_to_array(seed)
+        angles, valid = self.solve_array(poses, seed=seed)
+        configs = [self.chain.array_to_config(a) if v else None
+                   for a, v in zip(angles, valid)]
+        return configs, valid
@@ -0,0 +1,209 @@
+# Copyright (c) 2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import os
+
+import numpy as np
+
+
+_limit_keys = ['x_min', 'x_max', 'y_min', 'y_max', 'z_min', 'z_max']
+
+
+def _info_file(filename):
+    return os.path.splitext(filename)[0] + '_info.npz'
+
+
+class ReachabilityMap(object):
+    def __init__(self, arms, limits, resolution, reachable,
+                 orientation=(np.pi, 0.0, np.pi)):
+        """Voxel map of the positions within a box (e.g., the robot's task
+        space) that the limbs can reach with a fixed gripper orientation.
+
+        :param arms: The list of arms the map was built for.
+        :param limits: Dictionary of the box limits with keys 'x_min',
+            'x_max', 'y_min', 'y_max', 'z_min' and 'z_max' (in m).
+        :param resolution: The edge length of the cubic cells (in m).
+        :param reachable: A (n_arms, nx, ny, nz) boolean (or memory-mapped)
+            numpy array, True where the arm reaches the cell center.
+        :param orientation: The gripper orientation [roll, pitch, yaw] the
+            map was built for.
+        """
+        self.arms = list(arms)
+        self.limits = {k: float(limits[k]) for k in _limit_keys}
+        self.resolution = float(resolution)
+        self.orientation = [float(o) for o in orientation]
+        self.reachable = reachable
+        self._lower = np.array([self.limits[c + '_min'] for c in 'xyz'])
+        self._upper = np.array([self.limits[c + '_max'] for c in 'xyz'])
+        self.shape = grid_shape(self.limits, self.resolution)
+        if tuple(reachable.shape) != (len(self.arms),) + self.shape:
+            raise ValueError("Expected map of shape {}, got {}!".format(
+                (len(self.arms),) + self.shape, reachable.shape))
+        # flat indices of the reachable cells, computed on first use
+        self._cells = dict()
+
+    def index(self, position):
+        """Get the cell containing a position.
+
+        :param position: A position or pose [x, y, z, ...] (list of len >= 3).
+        :return: The cell index as a tuple (ix, iy, iz), or None if the
+            position is outside of the map.
+        """
+        p = np.asarray(position[:3], dtype=np.float64)
+        if np.any(p < self._lower) or np.any(p > self._upper):
+            return None
+        idx = ((p - self._lower)/self.resolution).astype(int)
+        return tuple(np.minimum(idx, np.array(self.shape) - 1))
+
+    def is_reachable(self, position, arm=None):
+        """Check whether a position lies within the map and is reachable.
+
+        :param position: A position or pose [x, y, z, ...] (list of len >= 3).
+        :param arm: The arm <'left', 'right'> to check. If None, check
+            whether either arm reaches the position.
+        :return: Boolean flag.
+        """
+        idx = self.index(position)
+        if idx is None:
+            return False
+        if arm is None:
+            return bool(self.reachable[(slice(None),) + idx].any())
+        return bool(self.reachable[(self.arms.index(arm),) + idx])
+
+    def arms_reaching(self, position):
+        """Get the arms that reach a position.
+
+        :param position: A position or pose [x, y, z, ...] (list of len >= 3).
+        :return: The (possibly empty) list of arms.
+        """
+        idx = self.index(position)
+        if idx is None:
+            return list()
+        return [a for i, a in enumerate(self.arms)
+                if self.reachable[(i,) + idx]]
+
+    def _reachable_cells(self, arm):
+        if arm not in self._cells:
+            if arm is None:
+                mask = np.any(self.reachable, axis=0)
+            else:
+                mask = self.reachable[self.arms.index(arm)]
+            self._cells[arm] = np.flatnonzero(mask)
+        return self._cells[arm]
+
+    def sample(self, arm=None, z_max=None):
+        """Sample a position uniformly from the reachable cells.
+
+        :param arm: The arm <'left', 'right'> that should reach the position.
+            If None, either arm may reach it.
+        :param z_max: Optional upper bound on the z coordinate (in m).
+        :return: The position as a list [x, y, z], or None if no cell is
+            reachable.
+        """
+        cells = self._reachable_cells(arm)
+        if z_max is not None:
+            iz_max = int(np.floor((z_max - self._lower[2])/self.resolution))
+            cells = cells[np.unravel_index(cells, self.shape)[2] <= iz_max]
+        if cells.size == 0:
+            return None
+        idx = np.array(np.unravel_index(np.random.choice(cells), self.shape))
+        position = self._lower + (idx + np.random.random_sample(3))*self.resolution
+        position = np.minimum(position, self._upper)
+        if z_max is not None:
+            position[2] = min(position[2], z_max)
+        return list(position)
+
+    def save(self, filename):
+        """Save the map such that it can be memory-mapped by
+        load_reachability_map.
+
+        :param filename: The npy file to write the map to. The limits,
+            resolution and orientation are written next to it into a file
+            with suffix '_info.npz'.
+        :return:
+        """
+        np.save(filename, np.asarray(self.reachable, dtype=bool))
+        np.savez(_info_file(filename),
+                 arms=np.array(self.arms, dtype='S5'),
+                 limits=np.array([self.limits[k] for k in _limit_keys]),
+                 resolution=self.resolution,
+                 orientation=np.array(self.orientation))
+
+
+def grid_shape(limits, resolution):
+    """Compute the number of cells per axis of a voxel map.
+
+    :param limits: Dictionary of the box limits, see ReachabilityMap.
+    :param resolution: The edge length of the cubic cells (in m).
+    :return: The shape as a tuple (nx, ny, nz).
+    """
+    return tuple(max(1, int(np.ceil((limits[c + '_max'] - limits[c + '_min']) /
+                                    resolution - 1e-9)))
+                 for c in 'xyz')
+
+
+def load_reachability_map(filename):
+    """Load a map previously saved with ReachabilityMap.save, memory-mapping
+    the voxel data.
+
+    :param filename: The npy file to read.
+    :return: The ReachabilityMap.
+    """
+    with np.load(_info_file(filename)) as info:
+        arms = [str(a) for a in info['arms']]
+        limits = dict(zip(_limit_keys, info['limits']))
+        resolution = float(info['resolution'])
+        orientation = list(info['orientation'])
+    reachable = np.load(filename, mmap_mode='r')
+    return ReachabilityMap(arms=arms, limits=limits, resolution=resolution,
+                           reachable=reachable, orientation=orientation)
+
+
+def build_reachability_map(solvers, limits, resolution=0.02,
+                           orientation=(np.pi, 0.0, np.pi), batch_size=1000):
+    """Build a reachability map by solving inverse kinematics at the center
+    of every cell.
+
+    :param solvers: Dictionary of arm keys to IKSolver instances.
+    :param limits: Dictionary of the box limits, see ReachabilityMap.
+    :param resolution: The edge length of the cubic cells (in m).
+    :param orientation: The gripper orientation [roll, pitch, yaw].
+    :param batch_size: The number of poses to solve at once.
+    :return: The ReachabilityMap.
+    """
+    arms = sorted(solvers.keys())
+    shape = grid_shape(limits, resolution)
+    lower = np.array([limits[c + '_min'] for c in 'xyz'])
+    idx = np.indices(shape).reshape(3, -1).T
+    centers = lower + (idx + 0.5)*resolution
+    poses = [list(c) + list(orientation) for c in centers]
+    reachable = np.zeros((len(arms),) + shape, dtype=bool)
+    for i, arm in enumerate(arms):
+        valid = np.concatenate([
+            solvers[arm].solve_array(poses[start:start + batch_size])[1]
+            for start in xrange(0, len(poses), batch_size)])
+        reachable[i] = valid.reshape(shape)
+    return ReachabilityMap(arms=arms, limits=limits, resolution=resolution,
+                           reachable=reachable, orientation=orientation)
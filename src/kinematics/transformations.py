@@ -0,0 +1,143 @@
+# Copyright (c) 2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import numpy as np
+
+
+def rpy_to_matrix(roll, pitch, yaw):
+    """Compute rotation matrices from roll, pitch and yaw angles (static
+    axes xyz, as used in URDF and by tf.transformations.euler_matrix).
+
+    :param roll: Rotation about the x axis (float or (N,) array).
+    :param pitch: Rotation about the y axis (float or (N,) array).
+    :param yaw: Rotation about the z axis (float or (N,) array).
+    :return: A (3, 3) or (N, 3, 3) numpy array.
+    """
+    cr, sr = np.cos(roll), np.sin(roll)
+    cp, sp = np.cos(pitch), np.sin(pitch)
+    cy, sy = np.cos(yaw), np.sin(yaw)
+    rot = np.array([
+        [cy*cp, cy*sp*sr - sy*cr, cy*sp*cr + sy*sr],
+        [sy*cp, sy*sp*sr + cy*cr, sy*sp*cr - cy*sr],
+        [-sp, cp*sr, cp*cr]
+    ], dtype=np.float64)
+    if rot.ndim == 3:
+        rot = np.rollaxis(rot, 2)
+    return rot
+
+
+def quaternion_to_matrix(quaternion):
+    """Compute rotation matrices from quaternions.
+
+    :param quaternion: A (4,) or (N, 4) array-like [qx, qy, qz, qw].
+    :return: A (3, 3) or (N, 3, 3) numpy array.
+    """
+    q = np.asarray(quaternion, dtype=np.float64)
+    q = q/np.linalg.norm(q, axis=-1)[..., np.newaxis]
+    x, y, z, w = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    rot = np.array([
+        [1 - 2*(y*y + z*z), 2*(x*y - z*w), 2*(x*z + y*w)],
+        [2*(x*y + z*w), 1 - 2*(x*x + z*z), 2*(y*z - x*w)],
+        [2*(x*z - y*w), 2*(y*z + x*w), 1 - 2*(x*x + y*y)]
+    ])
+    if rot.ndim == 3:
+        rot = np.rollaxis(rot, 2)
+    return rot
+
+
+def pose_to_hom(pose):
+    """Convert a pose into a homogeneous transform.
+
+    :param pose: One of
+        - a ROS Pose,
+        - a list of length 6 [x, y, z, roll, pitch, yaw] or
+        - a list of length 7 [x, y, z, qx, qy, qz, qw].
+    :return: A (4, 4) numpy array.
+    :raise ValueError: if the pose has an unexpected length.
+    """
+    if hasattr(pose, 'position') and hasattr(pose, 'orientation'):
+        pose = [pose.position.x, pose.position.y, pose.position.z,
+                pose.orientation.x, pose.orientation.y,
+                pose.orientation.z, pose.orientation.w]
+    hom = np.eye(4)
+    if len(pose) == 6:
+        hom[:3, :3] = rpy_to_matrix(*pose[3:])
+    elif len(pose) == 7:
+        hom[:3, :3] = quaternion_to_matrix(pose[3:])
+    else:
+        raise ValueError("Expected either 6 or 7 elements in list: "
+                         "(x,y,z,r,p,y) or (x,y,z,qx,qy,qz,qw)!")
+    hom[:3, 3] = pose[:3]
+    return hom
+
+
+def axis_angle_to_matrix(axis, angles):
+    """Compute rotation matrices about a fixed axis (Rodrigues' formula).
+
+    :param axis: The unit rotation axis, a (3,) array-like.
+    :param angles: The (N,) rotation angles.
+    :return: A (N, 3, 3) numpy array.
+    """
+    x, y, z = axis
+    k = np.array([[0., -z, y], [z, 0., -x], [-y, x, 0.]])
+    c = np.cos(angles)[:, np.newaxis, np.newaxis]
+    s = np.sin(angles)[:, np.newaxis, np.newaxis]
+    return np.eye(3) + s*k + (1 - c)*np.dot(k, k)
+
+
+def matrix_to_quaternion(rot):
+    """Compute the quaternion of a rotation matrix.
+
+    :param rot: A (3, 3) rotation matrix.
+    :return: A (4,) numpy array [qx, qy, qz, qw].
+    """
+    m = np.asarray(rot, dtype=np.float64)
+    trace = np.trace(m)
+    if trace > 0:
+        s = 2.0*np.sqrt(trace + 1.0)
+        q = [(m[2, 1] - m[1, 2])/s, (m[0, 2] - m[2, 0])/s,
+             (m[1, 0] - m[0, 1])/s, 0.25*s]
+    elif m[0, 0] > m[1, 1] and m[0, 0] > m[2, 2]:
+        s = 2.0*np.sqrt(1.0 + m[0, 0] - m[1, 1] - m[2, 2])
+        q = [0.25*s, (m[0, 1] + m[1, 0])/s, (m[0, 2] + m[2, 0])/s,
+             (m[2, 1] - m[1, 2])/s]
+    elif m[1, 1] > m[2, 2]:
+        s = 2.0*np.sqrt(1.0 + m[1, 1] - m[0, 0] - m[2, 2])
+        q = [(m[0, 1] + m[1, 0])/s, 0.25*s, (m[1, 2] + m[2, 1])/s,
+             (m[0, 2] - m[2, 0])/s]
+    else:
+        s = 2.0*np.sqrt(1.0 + m[2, 2] - m[0, 0] - m[1, 1])
+        q = [(m[0, 2] + m[2, 0])/s, (m[1, 2] + m[2, 1])/s, 0.25*s,
+             (m[1, 0] - m[0, 1])/s]
+    return np.array(q)
+
+
+def hom_to_pose(hom):
+    """Convert a homogeneous transform into a pose.
+
+    :param hom: A (4, 4) homogeneous transform.
+    :return: The pose as a list [x, y, z, qx, qy, qz, qw].
+    """
+    return list(hom[:3, 3]) + list(matrix_to_quaternion(hom[:3, :3]))
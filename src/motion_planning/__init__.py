@@ -9,4 +9,7 @@ That is, the motion planners' plan method should be implemented as a
 generator.
 """
 
+from collision import CollisionChecker
+from rrt import RRTConnectPlanner
 from simple import SimplePlanner
+from trajectory import TrajectoryPlanner
@@ -0,0 +1,166 @@
+# Copyright (c) 2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import numpy as np
+
+
+def segment_distances(p0, p1, q0, q1):
+    """Compute the minimum distances between pairs of line segments.
+    All arguments are broadcast against each other.
+
+    :param p0: A (..., 3) array of start points of the first segments.
+    :param p1: A (..., 3) array of end points of the first segments.
+    :param q0: A (..., 3) array of start points of the second segments.
+    :param q1: A (..., 3) array of end points of the second segments.
+    :return: A (...) numpy array of distances.
+    """
+    eps = 1e-12
+    d1 = p1 - p0
+    d2 = q1 - q0
+    r = p0 - q0
+    a = np.sum(d1*d1, axis=-1)
+    e = np.sum(d2*d2, axis=-1)
+    b = np.sum(d1*d2, axis=-1)
+    c = np.sum(d1*r, axis=-1)
+    f = np.sum(d2*r, axis=-1)
+    # closest point parameters, see Ericson, Real-Time Collision Detection
+    denom = a*e - b*b
+    s = np.where(denom > eps, np.clip((b*f - c*e)/np.maximum(denom, eps),
+                                      0.0, 1.0), 0.0)
+    t = (b*s + f)/np.maximum(e, eps)
+    t = np.clip(t, 0.0, 1.0)
+    s = np.clip((b*t - c)/np.maximum(a, eps), 0.0, 1.0)
+    diff = (p0 + s[..., np.newaxis]*d1) - (q0 + t[..., np.newaxis]*d2)
+    return np.sqrt(np.sum(diff*diff, axis=-1))
+
+
+class CollisionChecker(object):
+    def __init__(self, chain, radii, z_table=None, table_clearance=0.02):
+        """Vectorized collision checker for a kinematic chain whose links are
+        approximated by capsules around the segments between consecutive
+        joints.
+        Configurations are checked against a horizontal table plane and
+        against static capsule obstacles, e.g., the other arm of the robot.
+
+        :param chain: The KinematicChain to check.
+        :param radii: A list of n_joints capsule radii, one for each segment
+            between consecutive joints and the tip link. The tip itself is
+            allowed to touch the table, since it needs to reach objects
+            placed on it.
+        :param z_table: The height of the table plane in the base link. If
+            None, the table is ignored.
+        :param table_clearance: The minimum distance to keep from the table
+            plane.
+        """
+        if len(radii) != chain.n_joints:
+            raise ValueError("Need {} capsule radii, got {}!".format(
+                chain.n_joints, len(radii)))
+        self.chain = chain
+        self.radii = np.asarray(radii, dtype=np.float64)
+        self.z_table = z_table
+        self.table_clearance = table_clearance
+        # static obstacles as capsules (start, end, radius)
+        self._obstacles = (np.zeros((0, 3)), np.zeros((0, 3)), np.zeros(0))
+
+    def capsules(self, angles):
+        """Compute the link capsules for a number of configurations.
+
+        :param angles: A (N, n_joints) array-like of joint angles.
+        :return: A tuple (start, end, radii) of a (N, n_joints, 3) array of
+            segment start points, a (N, n_joints, 3) array of segment end
+            points and a (n_joints,) array of capsule radii.
+        """
+        points = self.chain.joint_positions(angles)
+        return points[:, :-1], points[:, 1:], self.radii
+
+    def set_obstacles(self, start, end, radii):
+        """Set the static capsule obstacles.
+
+        :param start: A (M, 3) array-like of segment start points.
+        :param end: A (M, 3) array-like of segment end points.
+        :param radii: A (M,) array-like of capsule radii.
+        :return:
+        """
+        self._obstacles = (np.asarray(start, dtype=np.float64).reshape(-1, 3),
+                           np.asarray(end, dtype=np.float64).reshape(-1, 3),
+                           np.asarray(radii, dtype=np.float64).reshape(-1))
+
+    def set_obstacle_chain(self, checker, config):
+        """Use the links of another chain in one or more fixed
+        configurations as obstacles, e.g., the other arm of the robot at its
+        current joint angles.
+        Both chains need to be defined with respect to the same base link.
+
+        :param checker: The CollisionChecker of the other chain.
+        :param config: The configuration of the other chain, a dictionary
+            of joint name keys to joint angle values, or a list of such
+            dictionaries.
+        :return:
+        """
+        configs = config if isinstance(config, list) else [config]
+        angles = checker.chain.config_to_array(configs)
+        start, end, radii = checker.capsules(angles)
+        self.set_obstacles(start, end, np.tile(radii, len(configs)))
+
+    def check(self, angles):
+        """Check a number of configurations for collisions.
+
+        :param angles: A (N, n_joints) array-like of joint angles.
+        :return: A (N,) boolean numpy array, True for collision-free
+            configurations.
+        """
+        start, end, radii = self.capsules(angles)
+        valid = np.ones(len(start), dtype=bool)
+        if self.z_table is not None:
+            # a capsule is lowest at one of its end points; the tip (end
+            # point of the last segment) only needs to stay above the table
+            z_min = self.z_table + self.table_clearance
+            valid &= np.all(start[:, :, 2] - radii > z_min, axis=1)
+            valid &= np.all(end[:, :-1, 2] - radii[:-1] > z_min, axis=1)
+            valid &= end[:, -1, 2] > self.z_table
+        o_start, o_end, o_radii = self._obstacles
+        if len(o_radii) > 0:
+            dist = segment_distances(
+                start[:, :, np.newaxis], end[:, :, np.newaxis],
+                o_start[np.newaxis, np.newaxis], o_end[np.newaxis, np.newaxis])
+            clearance = radii[:, np.newaxis] + o_radii[np.newaxis]
+            valid &= np.all(dist > clearance[np.newaxis], axis=(1, 2))
+        return valid
+
+    def check_motion(self, q_start, q_end, resolution=0.05):
+        """Check the straight line in joint space between two configurations
+        for collisions, by checking interpolated configurations at once.
+
+        :param q_start: A (n_joints,) array-like of start joint angles.
+        :param q_end: A (n_joints,) array-like of end joint angles.
+        :param resolution: The maximum joint angle difference between
+            consecutive checked configurations.
+        :return: True if the motion is collision-free, False otherwise.
+        """
+        q_start = np.asarray(q_start, dtype=np.float64)
+        q_end = np.asarray(q_end, dtype=np.float64)
+        n = max(1, int(np.ceil(np.max(np.abs(q_end - q_start))/resolution)))
+        s = np.linspace(0.0, 1.0, n + 1)[:, np.newaxis]
+        return bool(np.all(self.check(q_start + s*(q_end - q_start))))
@@ -0,0 +1,98 @@
+# Copyright (c) 2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import numpy as np
+
+
+class KDTree(object):
+    def __init__(self, dim):
+        """Incremental k-d tree for nearest neighbor queries among points
+        that are added one at a time, e.g., the nodes of a growing tree of
+        configurations.
+
+        :param dim: The dimension of the points.
+        """
+        self.dim = dim
+        self.points = list()
+        # per node: splitting axis and indices of the left and right child
+        self._axis = list()
+        self._left = list()
+        self._right = list()
+
+    def __len__(self):
+        return len(self.points)
+
+    def insert(self, point):
+        """Add a point.
+
+        :param point: A (dim,) array-like.
+        :return: The index of the point.
+        """
+        point = np.asarray(point, dtype=np.float64)
+        idx = len(self.points)
+        self.points.append(point)
+        self._left.append(-1)
+        self._right.append(-1)
+        if idx == 0:
+            self._axis.append(0)
+            return idx
+        node = 0
+        while True:
+            axis = self._axis[node]
+            children = self._left if point[axis] < self.points[node][axis] else self._right
+            if children[node] < 0:
+                children[node] = idx
+                self._axis.append((axis + 1) % self.dim)
+                return idx
+            node = children[node]
+
+    def nearest(self, point):
+        """Find the nearest point (in Euclidean distance).
+
+        :param point: A (dim,) array-like.
+        :return: A tuple (index, distance) of the nearest point, or
+            (None, inf) if the tree is empty.
+        """
+        point = np.asarray(point, dtype=np.float64)
+        best, best_d2 = None, np.inf
+        stack = [0] if self.points else []
+        while stack:
+            node = stack.pop()
+            p = self.points[node]
+            diff = point - p
+            d2 = np.dot(diff, diff)
+            if d2 < best_d2:
+                best, best_d2 = node, d2
+            axis = self._axis[node]
+            delta = diff[axis]
+            near, far = ((self._left[node], self._right[node]) if delta < 0
+                         else (self._right[node], self._left[node]))
+            # visit the far side only if the splitting plane is close enough;
+            # push it first, such that the near side is searched first
+            if far >= 0 and delta*delta < best_d2:
+                stack.append(far)
+            if near >= 0:
+                stack.append(near)
+        return best, np.sqrt(best_d2)
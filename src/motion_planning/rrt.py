@@ -0,0 +1,190 @@
+# Copyright (c) 2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import numpy as np
+import time
+
+from base import MotionPlanner
+from kdtree import KDTree
+
+
+class _Tree(object):
+    def __init__(self, root):
+        """A tree of configurations with a nearest neighbor index."""
+        self.index = KDTree(len(root))
+        self.parents = [-1]
+        self.index.insert(root)
+
+    def add(self, q, parent):
+        self.parents.append(parent)
+        return self.index.insert(q)
+
+    def path(self, node):
+        """Configurations from the root to the given node."""
+        path = list()
+        while node >= 0:
+            path.append(self.index.points[node])
+            node = self.parents[node]
+        return path[::-1]
+
+
+class RRTConnectPlanner(MotionPlanner):
+    def __init__(self, checker, step=0.3, resolution=0.05,
+                 max_iterations=2000, timeout=5.0, shortcuts=100):
+        """A sampling-based motion planner for collision-free joint space
+        paths using RRT-Connect [Kuffner and LaValle, ICRA 2000], followed by
+        shortcut smoothing.
+        Iterating over the planned trajectory yields the way points of the
+        path (without the start configuration) for position control.
+
+        :param checker: The CollisionChecker for the planned chain.
+        :param step: The maximum joint angle difference when extending a
+            tree toward a sample.
+        :param resolution: The maximum joint angle difference between
+            configurations checked along a motion.
+        :param max_iterations: The maximum number of sampling iterations.
+        :param timeout: The maximum planning time in seconds.
+        :param shortcuts: The number of shortcut smoothing attempts.
+        """
+        super(RRTConnectPlanner, self).__init__()
+        self.controller_type = 'position'
+        self.checker = checker
+        self.step = step
+        self.resolution = resolution
+        self.max_iterations = max_iterations
+        self.timeout = timeout
+        self.shortcuts = shortcuts
+        self._rng = np.random.RandomState()
+
+        self.joint_names = None
+        self.path = None
+        self.iterations = None
+
+    def seed(self, seed):
+        """Seed the random number generator of the planner."""
+        self._rng.seed(seed)
+
+    def _motion_valid(self, q_start, q_end):
+        return self.checker.check_motion(q_start, q_end,
+                                         resolution=self.resolution)
+
+    def _extend(self, tree, q):
+        """Extend the tree by one step toward q.
+
+        :return: A tuple (node, reached) of the index of the added node (or
+            None if the step is in collision) and whether q was reached.
+        """
+        near, _ = tree.index.nearest(q)
+        q_near = tree.index.points[near]
+        delta = q - q_near
+        reached = np.max(np.abs(delta)) <= self.step
+        if not reached:
+            q = q_near + delta*self.step/np.max(np.abs(delta))
+        if not self._motion_valid(q_near, q):
+            return None, False
+        return tree.add(q, near), reached
+
+    def _connect(self, tree, q):
+        """Greedily extend the tree toward q until reaching q or colliding.
+
+        :return: A tuple (node, reached) of the index of the last added node
+            (or None if no node was added) and whether q was reached.
+        """
+        node, reached = self._extend(tree, q)
+        last = node
+        while node is not None and not reached:
+            node, reached = self._extend(tree, q)
+            if node is not None:
+                last = node
+        return last, reached
+
+    def _shortcut(self, path):
+        """Shortcut smoothing: repeatedly replace the part of the path
+        between two random points on it by a straight line if that is
+        collision-free.
+
+        :param path: A list of configurations.
+        :return: The smoothed list of configurations.
+        """
+        for _ in range(self.shortcuts):
+            if len(path) < 3:
+                break
+            i, j = np.sort(self._rng.choice(len(path), 2, replace=False))
+            if j - i < 2:
+                continue
+            if self._motion_valid(path[i], path[j]):
+                path = path[:i + 1] + path[j:]
+        return path
+
+    def _solve(self, q_start, q_goal):
+        """Find a collision-free path from q_start to q_goal.
+
+        :return: A list of configurations from q_start to q_goal or None.
+        """
+        if self._motion_valid(q_start, q_goal):
+            self.iterations = 0
+            return [q_start, q_goal]
+        lower, upper = self.checker.chain.lower, self.checker.chain.upper
+        start_tree = _Tree(q_start)
+        trees = [start_tree, _Tree(q_goal)]
+        t_start = time.time()
+        for self.iterations in range(1, self.max_iterations + 1):
+            if time.time() - t_start > self.timeout:
+                break
+            q = self._rng.uniform(lower, upper)
+            a, b = trees
+            node, _ = self._extend(a, q)
+            if node is not None:
+                other, reached = self._connect(b, a.index.points[node])
+                if reached:
+                    path = a.path(node) + b.path(other)[::-1][1:]
+                    return path if a is start_tree else path[::-1]
+            trees = trees[::-1]
+        return None
+
+    def plan(self, start, end, **kwargs):
+        """Plan a collision-free path from the start to the end
+        configuration.
+
+        :param start: Dictionary of joint name keys to start joint angles.
+        :param end: Dictionary of joint name keys to end joint angles.
+        :return:
+        """
+        chain = self.checker.chain
+        q_start = chain.config_to_array(start)
+        q_goal = chain.config_to_array(end)
+        valid = self.checker.check(np.array([q_start, q_goal]))
+        if not valid[0]:
+            raise ValueError("Start configuration is in collision!")
+        if not valid[1]:
+            raise ValueError("End configuration is in collision!")
+        path = self._solve(q_start, q_goal)
+        if path is None:
+            raise RuntimeError("Failed to find a collision-free path within "
+                               "{} iterations!".format(self.iterations))
+        path = self._shortcut(path)
+        self.joint_names = chain.joint_names
+        self.path = np.array(path)
+        self._trajectory = [chain.array_to_config(q) for q in path[1:]]
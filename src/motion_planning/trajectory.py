@@ -0,0 +1,166 @@
+# Copyright (c) 2016, BRML
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import numpy as np
+
+from base import MotionPlanner
+
+
+class _Samples(object):
+    def __init__(self, names, values):
+        """Sequence view of a (K, n) array of trajectory samples, yielding
+        one dictionary of joint name keys to values per sample."""
+        self._names = names
+        self._values = values
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, k):
+        return dict(zip(self._names, self._values[k].tolist()))
+
+
+def _ramp(tau, t_ramp, v, profile):
+    """Path parameter and its derivative while accelerating from rest to
+    velocity v within t_ramp.
+
+    :param tau: A (K,) array of times since the start of the ramp.
+    :param t_ramp: The duration of the ramp.
+    :param v: The velocity at the end of the ramp.
+    :param profile: The velocity profile <'trapezoidal', 's-curve'>.
+    :return: A tuple of (K,) numpy arrays (position, velocity).
+    """
+    x = tau/t_ramp
+    if profile == 'trapezoidal':
+        return v*t_ramp*x**2/2.0, v*x
+    w = 2.0*np.pi*x
+    return (v*t_ramp*(x**2/2.0 + (np.cos(w) - 1.0)/(4.0*np.pi**2)),
+            v*(x - np.sin(w)/(2.0*np.pi)))
+
+
+class TrajectoryPlanner(MotionPlanner):
+    def __init__(self, velocity_limits, acceleration_limits, rate=100.0,
+                 profile='trapezoidal', speed=1.0, controller_type='velocity'):
+        """A motion planner for time-parameterized straight-line trajectories
+        in joint space, sampled at a fixed rate.
+        All joints start and stop at the same time. The velocity profile
+        along the line is trapezoidal (constant acceleration phases) or
+        s-curve (sinusoidal acceleration phases, i.e., continuous
+        acceleration), such that no joint exceeds its velocity and
+        acceleration limits.
+
+        :param velocity_limits: Dictionary of joint name suffix keys (e.g.,
+            's0') to maximum joint velocities in rad/s.
+        :param acceleration_limits: Dictionary of joint name suffix keys to
+            maximum joint accelerations in rad/s^2.
+        :param rate: The sampling rate of the trajectory in Hz.
+        :param profile: The velocity profile <'trapezoidal', 's-curve'>.
+        :param speed: The fraction of the velocity limits to use.
+        :param controller_type: Whether iterating over the trajectory yields
+            joint velocities ('velocity') or joint angles ('position').
+        """
+        super(TrajectoryPlanner, self).__init__()
+        if profile not in ['trapezoidal', 's-curve']:
+            raise KeyError("No such velocity profile: '{}'!".format(profile))
+        if controller_type not in ['position', 'velocity']:
+            raise KeyError("No such control mode: '{}'!".format(controller_type))
+        self.controller_type = controller_type
+        self.velocity_limits = velocity_limits
+        self.acceleration_limits = acceleration_limits
+        self.rate = float(rate)
+        self.profile = profile
+        self.speed = speed
+
+        self.joint_names = None
+        self.times = None
+        self.positions = None
+        self.velocities = None
+        self.duration = None
+
+    def _limits(self, names):
+        suffixes = [n.split('_')[-1] for n in names]
+        v_max = self.speed*np.array([self.velocity_limits[s] for s in suffixes])
+        a_max = np.array([self.acceleration_limits[s] for s in suffixes])
+        return v_max, a_max
+
+    def plan(self, start, end, **kwargs):
+        """Plan a trajectory from the start to the end configuration.
+
+        :param start: Dictionary of joint name keys to start joint angles.
+        :param end: Dictionary of joint name keys to end joint angles. Only
+            the joints in end are planned for.
+        :return:
+        """
+        names = sorted(end.keys())
+        q_start = np.array([start[n] for n in names], dtype=np.float64)
+        q_end = np.array([end[n] for n in names], dtype=np.float64)
+        delta = q_end - q_start
+        v_max, a_max = self._limits(names)
+
+        # limits of the path parameter s in [0, 1] along the line
+        dist = np.abs(delta)
+        moving = dist > 1e-9
+        if moving.any():
+            v = np.min(v_max[moving]/dist[moving])
+            a = np.min(a_max[moving]/dist[moving])
+        else:
+            v = a = np.inf
+        # the s-curve reaches a velocity at half the mean acceleration
+        a_mean = a if self.profile == 'trapezoidal' else a/2.0
+        if np.isinf(v):
+            t_ramp, t_cruise = 0.0, 0.0
+        elif v*v/a_mean >= 1.0:
+            # the velocity limit is not reached, no cruise phase
+            v = np.sqrt(a_mean)
+            t_ramp, t_cruise = v/a_mean, 0.0
+        else:
+            t_ramp = v/a_mean
+            t_cruise = (1.0 - v*t_ramp)/v
+        duration = 2.0*t_ramp + t_cruise
+
+        n = max(1, int(np.ceil(duration*self.rate)))
+        times = np.minimum(np.arange(1, n + 1)/self.rate, duration)
+        s = np.ones(n)
+        s_dot = np.zeros(n)
+        if duration > 0:
+            acc = times < t_ramp
+            dec = times > t_ramp + t_cruise
+            cru = ~acc & ~dec
+            s[acc], s_dot[acc] = _ramp(times[acc], t_ramp, v, self.profile)
+            s[cru] = v*t_ramp/2.0 + v*(times[cru] - t_ramp)
+            s_dot[cru] = v
+            s_dec, s_dot[dec] = _ramp(duration - times[dec], t_ramp, v,
+                                      self.profile)
+            s[dec] = 1.0 - s_dec
+
+        self.joint_names = names
+        self.times = times
+        self.positions = q_start + s[:, np.newaxis]*delta
+        self.velocities = s_dot[:, np.newaxis]*delta
+        self.duration = duration
+        if self.controller_type == 'velocity':
+            self._trajectory = _Samples(names, self.velocities)
+        else:
+            self._trajectory = _Samples(names, self.positions)
@@ -194,7 +194,8 @@ class Servoing(object):
         d_cam = [x*p2c_factor for x in d_pixel]
         # delta in robot space
         # assuming that orientation of end effector is perpendicular to table
-        rot = self._robot.hom_camera_to_robot(arm=arm)[:2, :2]
+        state = self._robot.snapshot(arm=arm)
+        rot = state.hom_camera[:2, :2]
         d_rob = np.dot(rot, d_cam)
         # update
         dx, dy = [-x*kp for x in d_rob]
@@ -203,9 +204,8 @@ class Servoing(object):
         self._logger.debug("Computed position update is ({: .3f}, "
                            "{: .3f}, {: .3f}) m.".format(dx, dy, dz))
 
-        pose = self._robot.endpoint_pose(arm=arm)
-        pose = [a + b for a, b in zip(pose, [dx, dy, dz,
-                                             0, 0, -np.deg2rad(rroi[2])])]
+        pose = [a + b for a, b in zip(state.endpoint_pose,
+                                      [dx, dy, dz, 0, 0, -np.deg2rad(rroi[2])])]
         if pose[2] < self._robot.z_table:
             pose[2] = self._robot.z_table
         cfg = self._robot.ik(arm=arm, pose=pose)
@@ -30,6 +30,16 @@ import os
 
 # The name or IP of the host PC on which the ELTE Kinect Windows server runs.
 elte_kinect_win_host = '10.162.85.173'
+# Whether to keep one persistent connection to the ELTE Kinect Windows server
+# open (falls back to one connection per request if the server does not
+# support it) and how many frame requests to keep in flight on it. Only enable
+# these if the server supports persistent connections and pipelining.
+elte_kinect_win_persistent = False
+elte_kinect_win_inflight = 1
+# Payload encodings for color and depth images (see hardware/kinect_codecs.py).
+# Encodings other than 'jpeg' and 'png' require a server supporting them.
+elte_kinect_win_color_codec = 'jpeg'
+elte_kinect_win_depth_codec = 'png'
 
 
 # The directory on the Ubuntu machine where the 'py-faster-rcnn' and 'mnc'
@@ -106,6 +116,21 @@ servo_tolerance_meters = 0.003
 # Baxter's hand cameras exposure value (0%--100%)
 baxter_cam_exposure = 10
 
+# How Baxter's limbs execute motions. With 'position' control the limbs move
+# to the target using the Baxter SDK's move_to_joint_positions. With
+# 'velocity' control time-parameterized trajectories with a 'trapezoidal' or
+# 's-curve' velocity profile are streamed to the limbs, using the given
+# fraction of the joint velocity limits (see motion_planning/trajectory.py).
+# Velocity control has not been tested on the real robot yet.
+baxter_control_mode = 'position'
+baxter_velocity_profile = 's-curve'
+baxter_speed_fraction = 0.6
+# Whether to plan Baxter's limb motions around the table and the other limb
+# with RRT-Connect if the straight line in joint space would hit them (see
+# motion_planning/rrt.py). Needs the robot model; if enabled, the
+# demonstration turns it on once the table height is calibrated.
+baxter_collision_checking = False
+
 
 # The threshold for the color change in a table view image patch in percent.
 # Needed to detect empty spots on the table.